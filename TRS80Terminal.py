@@ -0,0 +1,690 @@
+# jonathanrothberg@gmail.com TERMINAL FRONT END FOR THE TRS80 SIMULATOR
+# Oct 19 2026 - curses / ANSI terminal front end: same interpreter as the Tk
+#              app (TRS80Simulator subclass, no Tk root is ever created).
+#              64x16 text + 128x48 semigraphics drawn with Unicode sextant
+#              characters (or '#' with --ascii); only cells written since the
+#              last flush are redrawn.  Keys feed INKEY$ / PEEK(14400) / INPUT,
+#              Esc or Ctrl+C = BREAK, Ctrl+D or SYSTEM = quit.
+#              --headless runs a program with scripted keys and prints the
+#              final screen (for kiosks, SSH sessions and CI).
+# Oct 19 2026 - --stats FILE (or -) writes the run's interpreter metrics as JSON.
+# Oct 19 2026 - --state FILE resumes a SAVE STATE file (mid-INPUT too) and
+#              saves the program's state there if it is still running at exit;
+#              the file is deleted once the program ends, and a state saved
+#              from a different PROGRAM is not resumed.
+#
+# Usage:
+#   python3 TRS80Terminal.py [PROGRAM.BAS] [--type TEXT | --keys FILE]
+#                            [--headless] [--ascii] [--mem 4|16|48] [--tape FILE]
+#                            [--disk DIR|IMAGE] [--drive N=DIR|IMAGE] [--stats FILE|-]
+#                            [--state FILE]
+
+import argparse
+import heapq
+import itertools
+import json
+import locale
+import os
+import time
+from collections import deque
+
+import TRS80_Aug_10_26 as trs80
+
+KEY_HOLD_MS = 120      # terminals send no KeyRelease: keys read as held this long
+STATUS_ROW = 16        # status line under the 16 screen rows
+HEADLESS_TIMEOUT = 10  # seconds before a headless run is BREAKed
+
+
+def _sextant(bits):
+    """Unicode 'Symbols for Legacy Computing' sextant for 2x3 pixel bits.
+
+    Bit order matches video RAM: bit = (y % 3) * 2 + (x & 1).  The four
+    patterns that already exist as block elements are not repeated in the
+    U+1FB00 range, hence the index adjustment.
+    """
+    if bits == 0:
+        return ' '
+    if bits == 21:
+        return '▌'
+    if bits == 42:
+        return '▐'
+    if bits == 63:
+        return '█'
+    return chr(0x1FB00 + bits - 1 - (bits > 21) - (bits > 42))
+
+
+def _glyph_table(ascii_graphics):
+    table = list(trs80._CELL_CHARS)
+    table[127] = ' '  # DEL would echo as ^? and shift the row
+    for code in range(128, 256):
+        bits = code & 0x3F
+        table[code] = ('#' if bits else ' ') if ascii_graphics else _sextant(bits)
+    return tuple(table)
+
+
+# Printable characters whose Tk keysym is a name (the keyboard matrix is
+# keyed by keysym, so '@' must arrive as 'at' to set its bit).
+_CHAR_KEYSYMS = {
+    ' ': 'space', '@': 'at', ':': 'colon', ';': 'semicolon', ',': 'comma',
+    '-': 'minus', '.': 'period', '/': 'slash', '!': 'exclam', '"': 'quotedbl',
+    '#': 'numbersign', '$': 'dollar', '%': 'percent', '&': 'ampersand',
+    "'": 'apostrophe', '(': 'parenleft', ')': 'parenright', '*': 'asterisk',
+    '+': 'plus', '<': 'less', '=': 'equal', '>': 'greater', '?': 'question',
+}
+
+
+def _ignore(*args, **kwargs):
+    return None
+
+
+class _HeadlessWidget:
+    """Stands in for a Tk widget: remembers bindings, ignores everything else."""
+
+    def __init__(self):
+        self.bindings = {}
+
+    def bind(self, sequence, func=None, add=None):
+        if func is None:
+            return None
+        if add:
+            self.bindings.setdefault(sequence, []).append(func)
+        else:
+            self.bindings[sequence] = [func]
+        return sequence
+
+    def unbind(self, sequence, funcid=None):
+        self.bindings.pop(sequence, None)
+
+    def __getattr__(self, name):
+        return _ignore
+
+
+class _TextBuffer(_HeadlessWidget):
+    """The program editor without a widget: get/delete/insert/index on a string.
+
+    Understands the Text indexes the interpreter uses: "row.col",
+    "row.end", "end" and "end-1c" (the insert mark sits at the end).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.text = ''
+
+    def _offset(self, index):
+        index = str(index)
+        text = self.text
+        if index.startswith('end') or index == 'insert':
+            return len(text) + (index == 'end')
+        row, _, col = index.partition('.')
+        start = 0
+        for _ in range(int(float(row)) - 1):
+            newline = text.find('\n', start)
+            if newline < 0:
+                return len(text)
+            start = newline + 1
+        stop = text.find('\n', start)
+        stop = len(text) if stop < 0 else stop
+        return stop if col == 'end' else min(start + int(col or 0), stop)
+
+    def index(self, index):
+        before = self.text[:self._offset(index)]
+        return f"{before.count(chr(10)) + 1}.{len(before) - before.rfind(chr(10)) - 1}"
+
+    def get(self, start='1.0', end='end'):
+        return (self.text + '\n')[self._offset(start):self._offset(end)]
+
+    def delete(self, start, end=None):
+        a = self._offset(start)
+        b = min(self._offset(end) if end is not None else a + 1, len(self.text))
+        if b > a:
+            self.text = self.text[:a] + self.text[b:]
+
+    def insert(self, index, chars, *tags):
+        a = min(self._offset(index), len(self.text))
+        self.text = self.text[:a] + chars + self.text[a:]
+
+
+class _Scheduler(_HeadlessWidget):
+    """Stands in for the Tk root: after()/after_idle() timers and update().
+
+    update() does what Tk's does for the interpreter — deliver pending key
+    events, run due timers and idle callbacks — and then refreshes the
+    terminal, so the run loop's existing update() cadence drives the display.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.all_bindings = {}
+        self.app = None
+        self.deadline = None
+        self._timers = []
+        self._idle = deque()
+        self._cancelled = set()
+        self._ids = itertools.count(1)
+
+    def bind_all(self, sequence, func=None, add=None):
+        if func is not None:
+            self.all_bindings[sequence] = [func]
+
+    def after(self, ms, func=None, *args):
+        if func is None:
+            time.sleep(ms / 1000.0)
+            return None
+        timer_id = f"after#{next(self._ids)}"
+        heapq.heappush(self._timers, (time.monotonic() + ms / 1000.0, timer_id, func, args))
+        return timer_id
+
+    def after_idle(self, func, *args):
+        timer_id = f"idle#{next(self._ids)}"
+        self._idle.append((timer_id, func, args))
+        return timer_id
+
+    def after_cancel(self, timer_id):
+        if timer_id:
+            self._cancelled.add(timer_id)
+
+    def seconds_to_next_timer(self):
+        if self._idle:
+            return 0.0
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - time.monotonic())
+
+    def pending(self):
+        return bool(self._idle or self._timers)
+
+    def _run_idle(self):
+        idle = self._idle
+        for _ in range(len(idle)):
+            timer_id, func, args = idle.popleft()
+            if timer_id in self._cancelled:
+                self._cancelled.discard(timer_id)
+                continue
+            func(*args)
+
+    def _run_due(self):
+        timers = self._timers
+        now = time.monotonic()
+        while timers and timers[0][0] <= now:
+            _, timer_id, func, args = heapq.heappop(timers)
+            if timer_id in self._cancelled:
+                self._cancelled.discard(timer_id)
+                continue
+            func(*args)
+
+    def update_idletasks(self):
+        self._run_idle()
+        if self.app is not None:
+            self.app.refresh_terminal()
+
+    def update(self):
+        app = self.app
+        if app is not None:
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                self.deadline = None
+                app.break_program()
+            app.poll_keys()
+        self._run_due()
+        self.update_idletasks()
+
+
+class _KeyEvent:
+    """The fields of a Tk key event the interpreter reads."""
+
+    def __init__(self, widget, keysym, char, keycode, state=0):
+        self.widget = widget
+        self.keysym = keysym
+        self.char = char
+        self.keycode = keycode
+        self.state = state
+
+
+class CursesScreen:
+    """64x16 cell renderer on a curses window plus a one-line status bar."""
+
+    def __init__(self, stdscr, ascii_graphics=False):
+        import curses
+        self.curses = curses
+        self.win = stdscr
+        self.glyphs = _glyph_table(ascii_graphics)
+        self._drawn = [None] * trs80.VIDEO_RAM_SIZE
+        self._pending_keys = deque()
+        self.cursor = (0, 0)
+        self.status = ''
+        self.changed = True
+        curses.raw()
+        curses.noecho()
+        stdscr.keypad(True)
+        stdscr.nodelay(True)
+        try:
+            curses.curs_set(1)
+        except curses.error:
+            pass
+        stdscr.erase()
+
+    def draw_cells(self, vram, cells):
+        drawn = self._drawn
+        glyphs = self.glyphs
+        addstr = self.win.addstr
+        error = self.curses.error
+        for cell in cells:
+            code = vram[cell]
+            if drawn[cell] == code:
+                continue
+            drawn[cell] = code
+            row, col = divmod(cell, 64)
+            try:
+                addstr(row, col, glyphs[code])
+            except error:
+                pass  # terminal smaller than 64x17
+            self.changed = True
+
+    def move_cursor(self, row, col):
+        if (row, col) != self.cursor:
+            self.cursor = (row, col)
+            self.changed = True
+
+    def set_status(self, text):
+        if text != self.status:
+            self.status = text
+            try:
+                self.win.move(STATUS_ROW, 0)
+                self.win.clrtoeol()
+                self.win.addstr(STATUS_ROW, 0, text[:63], self.curses.A_REVERSE)
+            except self.curses.error:
+                pass
+            self.changed = True
+
+    def refresh(self):
+        if not self.changed:
+            return
+        self.changed = False
+        row, col = self.cursor
+        try:
+            self.win.move(min(row, 15), min(col, 63))
+        except self.curses.error:
+            pass
+        self.win.refresh()
+
+    def read_keys(self):
+        """Drain typed keys without blocking."""
+        keys = self._pending_keys
+        get_wch = self.win.get_wch
+        while True:
+            try:
+                keys.append(get_wch())
+            except self.curses.error:
+                break
+        while keys:
+            yield keys.popleft()
+
+    def wait_for_key(self, seconds):
+        """Block until a key arrives or `seconds` pass (None = wait for a key)."""
+        win = self.win
+        win.timeout(-1 if seconds is None else int(seconds * 1000))
+        try:
+            self._pending_keys.append(win.get_wch())
+        except self.curses.error:
+            pass
+        win.nodelay(True)
+
+    def prompt(self, title):
+        """Read a line (a file name) on the status row; '' when cancelled."""
+        curses = self.curses
+        win = self.win
+        label = f"{title}: "
+        text = ''
+        win.nodelay(False)
+        try:
+            while True:
+                try:
+                    win.move(STATUS_ROW, 0)
+                    win.clrtoeol()
+                    win.addstr(STATUS_ROW, 0, (label + text)[-63:])
+                except curses.error:
+                    pass
+                win.refresh()
+                key = win.get_wch()
+                if key in ('\n', '\r', curses.KEY_ENTER):
+                    return text.strip()
+                if key in ('\x1b', '\x03'):
+                    return ''
+                if key in ('\x7f', '\x08', curses.KEY_BACKSPACE):
+                    text = text[:-1]
+                elif isinstance(key, str) and key.isprintable():
+                    text += key
+        finally:
+            win.nodelay(True)
+            self.status = None
+            self.changed = True
+
+
+class TerminalSimulator(trs80.TRS80Simulator):
+    """TRS80Simulator driven by a terminal instead of Tk widgets.
+
+    renderer is a CursesScreen, or None for headless runs (the screen is
+    still kept in video RAM and can be printed with screen_text()).
+    """
+
+    def __init__(self, renderer=None, memory_kb=trs80.MEMORY_SIZE_KB):
+        self.renderer = renderer
+        self.quit_requested = False
+        self.tape_path = None
+        self._key_codes = {}
+        self._key_stamps = {}
+        self._key_serial = itertools.count(1)
+        master = _Scheduler()
+        super().__init__(master, memory_kb)
+        master.app = self
+
+    def _build_gui(self):
+        self.is_raspberry_pi = False
+        self.scale_factor = 1
+        self.base_font_size = 14
+        self.input_font_size = 14
+        self.pixel_size = trs80.PIXEL_SIZE
+        self._char_w = self.pixel_size * 2
+        self._char_h = self.pixel_size * 3
+        self._screen_font = ("Courier", self.base_font_size)
+        self.screen = _HeadlessWidget()
+        self.input_area = _TextBuffer()
+        for name in ('run_button', 'reset_button', 'stop_button', 'step_button',
+                     'new_button', 'clear_button', 'save_button', 'load_button',
+                     'tape_button', 'copy_screen_button', 'debug_button',
+                     'help_button', 'scale_button', 'llm_button'):
+            setattr(self, name, _HeadlessWidget())
+        self.master.bind('<Key>', self.on_key_press)
+        self.master.bind('<KeyRelease>', self.on_key_release)
+        self.master.bind_all('<Control-c>', self._on_ctrl_c_break)
+        self.master.bind_all('<Escape>', self._on_escape_key)
+
+    # Tk-only windows and timers have no terminal counterpart.
+    def create_debug_window(self):
+        pass
+
+    def blink_cursor(self):
+        pass
+
+    def optimize_for_7inch_screen(self):
+        pass
+
+    def _apply_initial_code_pane_sash(self):
+        pass
+
+    def update_cursor_display(self):
+        if self.renderer is not None:
+            self.renderer.move_cursor(self.cursor_row, self.cursor_col)
+
+    def _flush_graphics(self):
+        dirty = self._dirty_cells
+        if not dirty:
+            return
+        if self.renderer is not None:
+            self.renderer.draw_cells(self.video_ram, dirty)
+        dirty.clear()
+
+    def clear_screen(self):
+        super().clear_screen()
+        self._dirty_cells |= trs80._ALL_CELLS
+
+    def redraw_screen(self):
+        self._dirty_cells |= trs80._ALL_CELLS
+        self._flush_graphics()
+
+    def refresh_terminal(self):
+        """Push dirty cells, cursor and status to the terminal."""
+        renderer = self.renderer
+        if renderer is None:
+            self._dirty_cells.clear()
+            return
+        self._flush_graphics()
+        if not self.program_running:
+            state = "READY"
+        elif self.waiting_for_input:
+            state = "INPUT"
+        elif self.program_paused:
+            state = "PAUSED"
+        else:
+            state = "RUN"
+        renderer.set_status(f" TRS-80 {state:<6} Esc/Ctrl+C BREAK  Ctrl+D quit ")
+        renderer.refresh()
+
+    def _ask_open_filename(self, title, filetypes):
+        if self.renderer is None:
+            return ''
+        return self.renderer.prompt(title)
+
+    def _ask_save_filename(self, defaultextension):
+        if self.renderer is None:
+            return ''
+        name = self.renderer.prompt("Save as")
+        if name and not os.path.splitext(name)[1]:
+            name += defaultextension
+        return name
+
+    def create_tape_file(self):
+        # PRINT#-1 appends to the --tape file rather than asking for a new one
+        if self.tape_path:
+            self.tape_file = self.tape_path
+        else:
+            super().create_tape_file()
+
+    def select_tape_file(self):
+        # RUN forgets the tape (new_program), so --tape answers every prompt
+        if self.tape_path:
+            self.tape_file = self.tape_path
+        else:
+            super().select_tape_file()
+
+    def process_immediate_command(self, command):
+        if command.strip().upper() == "SYSTEM":
+            self.quit_requested = True
+            return
+        return super().process_immediate_command(command)
+
+    # ----- keys -----------------------------------------------------------
+
+    def poll_keys(self):
+        if self.renderer is None:
+            return
+        for key in self.renderer.read_keys():
+            self.press_key(key)
+
+    def press_key(self, key):
+        """Deliver one curses key (str or KEY_* int) the way Tk would."""
+        import curses
+        state = 0
+        if isinstance(key, int):
+            keysym = {curses.KEY_UP: 'Up', curses.KEY_DOWN: 'Down',
+                      curses.KEY_LEFT: 'Left', curses.KEY_RIGHT: 'Right',
+                      curses.KEY_BACKSPACE: 'BackSpace',
+                      curses.KEY_ENTER: 'Return'}.get(key)
+            if keysym is None:
+                return
+            char = {'BackSpace': '\x08', 'Return': '\r'}.get(keysym, '')
+        elif key in ('\r', '\n'):
+            keysym, char = 'Return', '\r'
+        elif key in ('\x7f', '\x08'):
+            keysym, char = 'BackSpace', '\x08'
+        elif key == '\x1b':
+            keysym, char = 'Escape', '\x1b'
+        elif key == '\x04':
+            self.quit_requested = True
+            return
+        elif key == '\x03':
+            keysym, char, state = 'c', '\x03', 0x4
+        elif key == '\t':
+            keysym, char = 'Tab', '\t'
+        elif key.isprintable():
+            keysym, char = _CHAR_KEYSYMS.get(key, key), key
+        else:
+            return
+        base = keysym.lower() if len(keysym) == 1 else keysym
+        keycode = self._key_codes.setdefault(base, len(self._key_codes) + 1)
+        event = _KeyEvent(self.screen, keysym, char, keycode, state)
+        self._dispatch(event)
+        stamp = next(self._key_serial)
+        self._key_stamps[keycode] = stamp
+        self.master.after(KEY_HOLD_MS, self._auto_release, event, stamp)
+
+    def _auto_release(self, event, stamp):
+        # Auto-repeat re-stamps the key, so only the last press releases it.
+        if self._key_stamps.get(event.keycode) == stamp:
+            del self._key_stamps[event.keycode]
+            self.on_key_release(event)
+
+    def _dispatch(self, event):
+        """Tk bindtag order: screen, toplevel, all; "break" stops the chain."""
+        sequences = [f"<{event.keysym}>", "<Key>"]
+        if event.state & 0x4:
+            sequences.insert(0, f"<Control-{event.keysym}>")
+        for table in (self.screen.bindings, self.master.bindings, self.master.all_bindings):
+            for sequence in sequences:
+                handlers = table.get(sequence)
+                if handlers:
+                    if any([handler(event) == "break" for handler in handlers]):
+                        return
+                    break
+
+    # ----- headless helpers -----------------------------------------------
+
+    def screen_text(self, ascii_graphics=False):
+        glyphs = _glyph_table(ascii_graphics)
+        vram = self.video_ram
+        rows = [''.join(glyphs[c] for c in vram[r * 64:(r + 1) * 64]).rstrip()
+                for r in range(16)]
+        while rows and not rows[-1]:
+            rows.pop()
+        return '\n'.join(rows)
+
+
+def _start(app, args):
+    app.tape_path = args.tape
+    if args.disk:
+        app.mount(0, args.disk)
+    for spec in args.drive or ():
+        number, _, target = spec.partition('=')
+        if not number.strip().isdigit() or not target:
+            app.print_to_screen(f"?BF ERROR: --drive {spec} (use N=PATH)")
+            continue
+        app.mount(int(number), target)
+    if args.program:
+        app.load_program(args.program)
+    run = bool(args.program)
+    if args.state and os.path.exists(args.state):
+        # A state saved from another program is left alone (not resumed,
+        # overwritten or deleted) and the program waits at READY for RUN
+        message = app.load_state(args.state, app.program.text() if args.program else None)
+        if message is None:
+            run = False  # resumed where it was saved
+        else:
+            app.print_to_screen(message)
+            if message == trs80.STATE_OTHER_PROGRAM:
+                args.state = None
+                run = False
+            elif args.program:
+                app.load_program(args.program)  # a failed load may have replaced it
+    if args.keys:
+        with open(args.keys, 'r', encoding='utf-8', errors='replace') as f:
+            app.queue_keys(f.read())
+    if args.type:
+        app.queue_keys(args.type.replace('\\n', '\n'))
+    if run and app.input_area.text.strip():
+        app.run_program()
+
+
+def _finish(app, args):
+    """At exit: save a program that is still running (--state), or delete the
+    state once the program has finished so the next launch starts afresh;
+    then metrics."""
+    if args.state:
+        if app.program_running:
+            app.save_state(args.state)
+        elif os.path.exists(args.state):
+            os.remove(args.state)
+    if args.stats:
+        _write_stats(app, args.stats)
+
+
+def run_headless(args):
+    app = TerminalSimulator(None, memory_kb=args.mem)
+    master = app.master
+    master.deadline = time.monotonic() + args.timeout
+    _start(app, args)
+    while master.pending() and master.deadline is not None:
+        if app.waiting_for_input and not app._key_buffer:
+            break  # the script ran out of keys
+        if not app.program_running and not master._idle:
+            break
+        wait = master.seconds_to_next_timer()
+        if wait:
+            time.sleep(min(wait, 0.05))
+        master.update()
+    print(app.screen_text(args.ascii))
+    _finish(app, args)
+
+
+def _write_stats(app, path):
+    """Metrics of the run as JSON, to a file or (path '-') stdout."""
+    if app._run_started is not None:  # still running when the headless run stopped
+        app.metrics.seconds['run'] += time.perf_counter() - app._run_started
+        app._run_started = None
+    text = json.dumps(app.metrics.snapshot(), indent=2)
+    if path == '-':
+        print(text)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+
+def run_terminal(stdscr, args):
+    renderer = CursesScreen(stdscr, args.ascii)
+    app = TerminalSimulator(renderer, memory_kb=args.mem)
+    master = app.master
+    app.redraw_screen()
+    _start(app, args)
+    while not app.quit_requested:
+        master.update()
+        if app.quit_requested:
+            break
+        wait = master.seconds_to_next_timer()
+        if wait is None or wait > 0:
+            renderer.wait_for_key(None if wait is None else min(wait, 0.1))
+    app._flush_graphics()
+    _finish(app, args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TRS-80 Model I Level II BASIC in a terminal")
+    parser.add_argument('program', nargs='?', help="BASIC program to load and RUN")
+    parser.add_argument('--type', help="keys to type (\\n = ENTER) into INKEY$/INPUT")
+    parser.add_argument('--keys', help="file whose contents are typed as keys")
+    parser.add_argument('--headless', action='store_true',
+                        help="no terminal UI: run, then print the final screen")
+    parser.add_argument('--ascii', action='store_true', help="draw graphics as '#'")
+    parser.add_argument('--mem', type=int, choices=(4, 16, 48), default=trs80.MEMORY_SIZE_KB,
+                        help="user RAM in KB (default %(default)s)")
+    parser.add_argument('--tape', help="tape file for INPUT#-1")
+    parser.add_argument('--disk', help="drive :0 - host folder or JV1 .DSK image")
+    parser.add_argument('--drive', action='append', metavar='N=PATH',
+                        help="mount a folder or .DSK image as drive :N (0-3)")
+    parser.add_argument('--timeout', type=float, default=HEADLESS_TIMEOUT,
+                        help="headless: BREAK after this many seconds")
+    parser.add_argument('--stats', metavar='FILE',
+                        help="write interpreter metrics as JSON at exit ('-' = stdout)")
+    parser.add_argument('--state', metavar='FILE',
+                        help="resume from this SAVE STATE file if it exists, and save "
+                             "the program's state there if it is still running at exit")
+    args = parser.parse_args(argv)
+
+    if args.headless:
+        run_headless(args)
+        return
+    import curses
+    locale.setlocale(locale.LC_ALL, '')
+    os.environ.setdefault('ESCDELAY', '25')
+    curses.wrapper(run_terminal, args)
+
+
+if __name__ == "__main__":
+    main()
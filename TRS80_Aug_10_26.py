@@ -50,6 +50,84 @@
 #                  like PRINT newline (scroll on last row — no OKAKE FOOD)
 #    Aug 10 2026 - OPEN "I": if not in RAM _seq_files, load from host disk
 #                  (program dir / Basic_Code_Examples / cwd) so ADVENT CAVE.DAT works
+#    Oct 18 2026 - Screen is one 1K video RAM bytearray (15360-16383): PRINT
+#                  and POKE write bytes, SET/RESET flip semigraphic bits 128-191,
+#                  PEEK/POINT read them back; Canvas redraws only dirty cells
+#    Oct 18 2026 - TRS80Memory: full 64K map (ROM stub, keyboard, video, 4K/
+#                  16K/48K user RAM) with per-page PEEK/POKE handlers; MEM and
+#                  FRE computed from program/variable/string allocation; CLEAR n
+#    Oct 19 2026 - Keyboard matrix 14336-15359 from KeyPress/KeyRelease (held
+#                  keys, several at once); PEEK never pumps Tk — the run loop
+#                  does a full update() every 16 ms for keyboard pollers
+#    Oct 19 2026 - Type-ahead ring buffer (KEY_BUFFER_DEPTH) for INKEY$,
+#                  PEEK(14400) and INPUT; queue_keys() pre-fills it from a script
+#    Oct 19 2026 - GUI construction split into _build_gui() and file dialogs
+#                  into _ask_open/_ask_save_filename() so TRS80Terminal.py
+#                  (curses / headless front end) can reuse the interpreter;
+#                  LOAD/SAVE "NAME" use the typed name instead of a dialog
+#    Oct 19 2026 - INPUT#-1 reads through TapeReader (mmap + line-offset index,
+#                  cached per path/size/mtime) instead of readlines() per
+#                  record; bare MEM is only computed when an expression uses it
+#    Oct 19 2026 - PRINT#-1 goes through TapeWriter: buffered and appended to
+#                  the tape in place (not atomic: a crash mid-commit can leave
+#                  a partial last record), committed (fsync; cut back on an
+#                  OSError) on CLOSE, END, STOP, BREAK, errors, program end
+#                  and interpreter exit
+#    Oct 19 2026 - .CAS cassette images (CasImage, lazily decoded via mmap/
+#                  memoryview): CLOAD of tokenised BASIC (SYSTEM tapes load
+#                  into memory), INPUT#-1/PRINT#-1 data records, CSAVE -> .CAS
+#    Oct 19 2026 - Sequential files on channels #1-#15 (SequentialFile over
+#                  io.StringIO or a streamed host file), OPEN "E", CLOSE n,
+#                  EOF(n)/LOC(n); disk_dir writes OPEN "O" files to a host folder
+#    Oct 19 2026 - Random files: OPEN "R" (RandomFile, mmap'd host file),
+#                  FIELD, GET/PUT, LSET/RSET, LOF; MKI$/MKS$/MKD$ and
+#                  CVI/CVS/CVD (struct, MBF); binary-safe string literals
+#    Oct 19 2026 - Virtual drives :0-:3 (FolderDrive = host folder, DiskImageDrive
+#                  = read-only JV1 TRSDOS 2.3 image) with cached case-insensitive
+#                  name indexes refreshed by mtime; "FILE:d" names, DIR/KILL/NAME,
+#                  MOUNT n "PATH" / MOUNT n OFF from the keyboard
+#    Oct 19 2026 - Program kept tokenised in Level II layout (ProgramStore: one
+#                  bytearray, bisect index); LIST detokenises, MEM counts the
+#                  real bytes, CSAVE/CLOAD copy the bytes as they are
+#    Oct 19 2026 - RUN's preprocessed tables cached on disk (CompiledProgramCache:
+#                  marshal files keyed by source + interpreter hash, LRU-trimmed)
+#    Oct 19 2026 - Line edits are incremental: a numbered line typed on the
+#                  green screen is one bisect + splice in ProgramStore and one
+#                  row of the editor; editor keystrokes sync just the edited row
+#    Oct 19 2026 - Editor uppercases only the edited (or pasted) rows, and not
+#                  inside "strings"; other rows are never rewritten, and the
+#                  program store gets set_line for the rows that changed
+#    Oct 19 2026 - Debug log: debug_print appends to a bounded DebugLog ring,
+#                  the window is filled in batches every 100 ms and trimmed
+#                  to the same cap; level filter and Export in the window
+#    Oct 19 2026 - PROFILE ON/OFF/n/LIST: per-statement hit and time arrays
+#                  (LineProfiler), top-N lines, time by statement type, and an
+#                  annotated listing
+#    Oct 19 2026 - RUN PROFILE: StackSampler thread samples the interpreter's
+#                  Python stack, writes collapsed stacks for flame graphs and
+#                  sums time by evaluator stage / handler / renderer / GUI yield
+#    Oct 19 2026 - Metrics registry (Counter counts + seconds): statements,
+#                  eval fast/full, regex and compile cache hits, canvas items,
+#                  flushes, Tk update time; STATS, variables window, --stats
+#    Oct 19 2026 - TRON/TROFF (TRON RECORD = silent): TraceRecorder keeps
+#                  (index, kind, statement clock) in an array('I') ring;
+#                  TRACE "F.CSV"/"F.TRC" exports it
+#    Oct 19 2026 - Breakpoints: BREAK n [COUNT c] [IF cond] (and the debug
+#                  window's Break box) flag statement indexes in a bytearray;
+#                  conditions compiled once to Python code
+#    Oct 19 2026 - Watchpoints: WATCH X / A(i[,j]) / A() [IF cond] hook
+#                  _set_scalar and the LET/INPUT/READ array stores (only while
+#                  something is watched) and report line, old and new value
+#    Oct 19 2026 - HISTORY ON / BACK: checkpoint ring of the run state every n
+#                  statements plus a log of INKEY$/keyboard PEEK/INPUT reads;
+#                  BACK restores a checkpoint and replays forward to the target
+#                  (in-memory files are checkpointed; disk writes never replay)
+#    Oct 19 2026 - Program State window is a ttk.Treeview refreshed on a timer:
+#                  only variables written since the last refresh are redrawn,
+#                  arrays load page by page when expanded (no full scans)
+#    Oct 19 2026 - SAVE STATE / LOAD STATE: program, compiled tables, variables,
+#                  stacks, files, memory/screen and pending INPUT in a versioned
+#                  zlib+marshal file; closing the window mid-run saves it
 #
 # ---------------------------------------------------------------------------
 #  HOW THE INTERPRETER WORKS  (read this before diving into the code)
@@ -61,12 +139,14 @@
 #  1. EDITING & STORAGE
 #     The user types BASIC lines into the input area (ScrolledText widget)
 #     or directly on the green screen in immediate mode.  Lines with a
-#     leading number are stored in `self.stored_program`; lines without a
-#     number execute immediately.
+#     leading number are stored tokenised in `self.program` (ProgramStore,
+#     the Level II byte layout; `self.stored_program` is its detokenised
+#     listing); lines without a number execute immediately.
 #
-#  2. PREPROCESSING  (preprocess_program)
-#     Before RUN, multi-statement lines like "10 A=1: B=2" are split on
-#     colons into separate entries ("10 A=1", "10.1 B=2").  Colons that
+#  2. PREPROCESSING  (_compile_program / _split_statements)
+#     Before RUN, each line of self.program (read from the store, not from
+#     the listing text) is split on colons into separate entries:
+#     "10 A=1: B=2" becomes "10 A=1" and "10.1 B=2".  Colons that
 #     appear inside quoted strings or after IF/THEN/ELSE are preserved.
 #     DATA statements are pre-scanned into self.data_values so READ can
 #     access them in program order regardless of execution flow.
@@ -113,13 +193,17 @@
 #          comparison/logic wrappers.
 #
 #  SCREEN MODEL
-#     Text: 64 columns x 16 rows stored in self.screen_content[][].
-#     Graphics: 128 x 48 pixel grid stored in self.pixel_matrix[][].
-#     Each text cell covers a 2x3 block of graphics pixels.
-#     The Tkinter Canvas draws text items tagged "c{row}_{col}" and pixel
-#     rectangles tagged "p{x}_{y}" so items are bounded and reusable.
-#     Graphics SET/RESET calls are batched in _pending_graphics and flushed
-#     every 20 operations or at GUI-update boundaries.
+#     self.video_ram is a bytearray(1024) mirroring Model I video memory
+#     at 15360-16383: cell = row*64 + col, 64 columns x 16 rows.  It is the
+#     only screen state.  Bytes 32-127 are characters; 128-191 are 2x3
+#     semigraphic blocks (bit0 top-left .. bit5 bottom-right), giving the
+#     128 x 48 SET/RESET/POINT grid.  PRINT and POKE store bytes, SET/RESET
+#     flip bits, PEEK/POINT read them back.
+#     Every write adds the cell to _dirty_cells; _flush_graphics diffs those
+#     against _drawn_codes and updates only what changed on the Canvas
+#     (text items tagged "c{row}_{col}", pixel rectangles tagged "p{x}_{y}",
+#     both reused via itemconfigure).  SET/RESET flush every 256 cells or
+#     at GUI-update boundaries; PRINT flushes at the end of each call.
 #
 #  KEY DATA STRUCTURES
 #     scalar_variables   – dict {name: value}  (e.g. {"A": 5, "N$": "HI"})
@@ -130,16 +214,39 @@
 #
 # ===========================================================================
 import tkinter as tk
-from tkinter import scrolledtext, filedialog, messagebox
+from tkinter import scrolledtext, filedialog, messagebox, ttk
 import re
 import random
 import os
 import math
 import time
 import platform
+import mmap
+import tempfile
+import atexit
+import io
+import struct
+import sys
+import threading
+import linecache
+import hashlib
+import marshal
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
 
 # SET/RESET ops before _flush_graphics (matches web_TRS_80 GRAPHICS_PENDING_BATCH — Mar 2026)
 _GRAPHICS_PENDING_BATCH = 256
+# Model I video RAM: 64 x 16 cells at 15360-16383 (0x3C00-0x3FFF)
+VIDEO_RAM_START = 15360
+VIDEO_RAM_SIZE = 1024
+_BLANK_SCREEN = b' ' * VIDEO_RAM_SIZE
+_ALL_CELLS = frozenset(range(VIDEO_RAM_SIZE))
+# Glyph for each video RAM byte: the Model I character generator has no bit 6,
+# so 0-31 show as @A-Z[\]^_; 128-255 are graphics blocks drawn as pixels.
+_CELL_CHARS = tuple(chr(code + 64) if code < 32 else chr(code) if code < 128 else ' '
+                    for code in range(256))
 # TRS80LLMSupport is imported lazily in open_llm_support() to avoid
 # pulling in torch/transformers at startup (faster launch, smaller binary).
 TRS80LLMSupport = None
@@ -147,6 +254,1798 @@ PIXEL_SIZE = 6  # Reduced from 6 to 4 for smaller screen
 INITIAL_WIDTH = 768  # 128 pixels * 6 (Level II graphics x: 0-127)
 INITIAL_HEIGHT = 288  # Reduced from 288 to 192 for 7" screen
 
+# Model I address map (Level II).  User RAM runs from 16384 to the top set by
+# MEMORY_SIZE_KB (4 -> 20479, 16 -> 32767, 48 -> 65535).
+MEMORY_SIZE_KB = 48
+ROM_END = 12288            # 0-12287 Level II ROM
+KEYBOARD_START = 14336     # 0x3800-0x3BFF keyboard matrix (decoded every 256 bytes)
+RAM_START = 16384
+PROGRAM_START = 17129      # 0x42E9: first byte of the BASIC program (TXTTAB)
+DEFAULT_STRING_SPACE = 50  # Level II reserves 50 bytes until CLEAR n
+# Stack + scratch kept below the string area; makes a fresh 4K machine report
+# MEM 3284 and 16K report 15572, as the real ROM does.
+_STACK_RESERVE = 14
+# Model I keyboard matrix: Tk keysym -> (row, bit mask).  A read of 14336+n
+# ORs every row whose bit is set in n (14337 = row 0 ... 14464 = row 7).
+_KEY_MATRIX = {}
+for _row, _keys in enumerate(('@ABCDEFG', 'HIJKLMNO', 'PQRSTUVW', 'XYZ', '01234567', '89:;,-./')):
+    for _bit, _ch in enumerate(_keys):
+        _KEY_MATRIX[_ch] = _KEY_MATRIX[_ch.lower()] = (_row, 1 << _bit)
+for _sym, _ch in (('at', '@'), ('colon', ':'), ('semicolon', ';'), ('comma', ','),
+                  ('minus', '-'), ('period', '.'), ('slash', '/'),
+                  # shifted symbols live on the key that types them on a Model I
+                  ('exclam', '1'), ('quotedbl', '2'), ('numbersign', '3'), ('dollar', '4'),
+                  ('percent', '5'), ('ampersand', '6'), ('apostrophe', '7'),
+                  ('parenleft', '8'), ('parenright', '9'), ('asterisk', ':'), ('plus', ';'),
+                  ('less', ','), ('equal', '-'), ('greater', '.'), ('question', '/')):
+    _KEY_MATRIX[_sym] = _KEY_MATRIX[_ch]
+for _bit, _syms in enumerate((('Return', 'KP_Enter'), ('Home',), ('Escape',), ('Up',), ('Down',),
+                              ('Left', 'BackSpace'), ('Right',), ('space',))):
+    for _sym in _syms:
+        _KEY_MATRIX[_sym] = (6, 1 << _bit)
+_KEY_MATRIX['Shift_L'] = _KEY_MATRIX['Shift_R'] = (7, 1)
+del _row, _keys, _bit, _ch, _sym, _syms
+# Type-ahead: keys pressed while a program runs wait here for INKEY$,
+# PEEK(14400) and INPUT; further keys are dropped once it is full.
+KEY_BUFFER_DEPTH = 32
+# INKEY$ codes for keys that have no event.char (Level II arrow codes)
+_INKEY_SPECIAL = {'Up': chr(91), 'Down': chr(10), 'Left': chr(8), 'Right': chr(9)}
+# Level II variable table sizes: type + 2 name bytes + value (string = descriptor)
+_VAR_BYTES = {'I': 5, 'F': 7, 'D': 11, 'S': 6}
+_ELEMENT_BYTES = {'I': 2, 'F': 4, 'D': 8, 'S': 3}
+# The few ROM bytes programs actually PEEK (PEEK(293)=73 identifies a Model I)
+_ROM_STUB = {293: 73}
+
+
+class TRS80Memory:
+    """64K Model I address space: one bytearray, dispatched per 256-byte page.
+
+    Region map:
+        0-12287        ROM stub (reads _ROM_STUB or 0, writes ignored)
+        12288-14335    memory-mapped I/O, not fitted (reads 255)
+        14336-15359    keyboard matrix
+        15360-16383    video RAM
+        16384-ram_top  user RAM
+        above ram_top  not fitted (reads 255, writes ignored)
+
+    _readers/_writers hold one handler per page, so peek/poke are a list
+    index plus a call; plain RAM pages use the bytearray's own
+    __getitem__/__setitem__.  map_region() lets the simulator hook the
+    keyboard and video pages.  video/ram are zero-copy memoryview slices.
+    """
+
+    def __init__(self, ram_kb=MEMORY_SIZE_KB):
+        if ram_kb not in (4, 16, 48):
+            raise ValueError(f"RAM size must be 4, 16 or 48 KB, not {ram_kb}")
+        self.data = bytearray(0x10000)
+        self.view = memoryview(self.data)
+        self.ram_top = RAM_START + ram_kb * 1024 - 1
+        self.video = self.view[VIDEO_RAM_START:VIDEO_RAM_START + VIDEO_RAM_SIZE]
+        self.ram = self.view[RAM_START:self.ram_top + 1]
+        for address, value in _ROM_STUB.items():
+            self.data[address] = value
+
+        def unmapped_read(address):
+            return 255
+
+        def ignore_write(address, value):
+            pass
+
+        read_ram = self.data.__getitem__
+        write_ram = self.data.__setitem__
+        self._readers = [unmapped_read] * 256
+        self._writers = [ignore_write] * 256
+        self.map_region(0, ROM_END, reader=read_ram)
+        self.map_region(VIDEO_RAM_START, VIDEO_RAM_START + VIDEO_RAM_SIZE, read_ram, write_ram)
+        self.map_region(RAM_START, self.ram_top + 1, read_ram, write_ram)
+
+    def map_region(self, start, end, reader=None, writer=None):
+        """Install handlers for the pages covering start..end-1 (256-byte aligned)."""
+        for page in range(start >> 8, end >> 8):
+            if reader is not None:
+                self._readers[page] = reader
+            if writer is not None:
+                self._writers[page] = writer
+
+    def peek(self, address):
+        return self._readers[address >> 8](address)
+
+    def poke(self, address, value):
+        self._writers[address >> 8](address, value)
+
+    def peek_word(self, address):
+        return self.data[address] | (self.data[address + 1] << 8)
+
+    def poke_word(self, address, value):
+        self.data[address] = value & 0xFF
+        self.data[address + 1] = (value >> 8) & 0xFF
+
+
+# Line-offset indexes of recently read tapes, keyed by (path, size, mtime_ns)
+# so a RUN that re-reads the same .dat skips the scan.  Oldest dropped first.
+TAPE_INDEX_CACHE_SIZE = 8
+_tape_index_cache = {}
+
+
+class TapeReader:
+    """A line-oriented .dat tape, opened once and read by line number.
+
+    The file is mmap'd and scanned once for line starts (an array of
+    offsets; offsets[-1] is the file size), so record n is one slice
+    instead of a readlines() of the whole tape per INPUT#-1.
+    """
+
+    def __init__(self, path):
+        stat = os.stat(path)
+        self.path = path
+        self.key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        if stat.st_size:
+            with open(path, 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+        self.offsets = self._index()
+
+    def _index(self):
+        cache = _tape_index_cache
+        offsets = cache.pop(self.key, None)
+        if offsets is None:
+            data = self._data
+            size = len(data)
+            offsets = array('Q', [0] if size else [])
+            find = data.find
+            pos = find(b'\n') + 1
+            while 0 < pos < size:
+                offsets.append(pos)
+                pos = find(b'\n', pos) + 1
+            offsets.append(size)
+        cache[self.key] = offsets
+        while len(cache) > TAPE_INDEX_CACHE_SIZE:
+            del cache[next(iter(cache))]
+        return offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, number):
+        """Record `number` (0-based) without its line ending, or None past the end."""
+        if number >= len(self.offsets) - 1:
+            return None
+        raw = self._data[self.offsets[number]:self.offsets[number + 1]]
+        return raw.decode('utf-8', 'replace').strip()
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = b''
+
+
+# PRINT#-1 records are buffered and appended to the tape in chunks this big.
+TAPE_WRITE_CHUNK = 8192
+
+
+class TapeWriter:
+    """PRINT#-1 output: buffered, and appended to the tape in place.
+
+    Opened on the first record; the tape's old records are never rewritten,
+    so opening is O(1) however long the tape is and PRINT#-1 / INPUT#-1
+    can alternate freely.  Records are appended in TAPE_WRITE_CHUNK pieces
+    and commit() fsyncs them.  A .CAS tape gets one leader/sync/CR record
+    per PRINT#-1, as the Model I writes it.
+
+    Trade-off: this is not an atomic replacement.  Copying the tape to a
+    temp file and os.replace()ing it on every commit survived a crash
+    intact, but cost O(n) per commit.  Now a write or fsync that fails with
+    OSError cuts the tape back to its length when this writer opened it,
+    but a process killed (or power lost) mid-commit can leave a partial
+    last record.  The records before it are never touched.  A text tape
+    that doesn't end in a newline (cut off like that, or hand-edited) gets
+    one before the first new record, so records never run together.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._cas = path.lower().endswith('.cas')
+        self._file = open(path, 'ab')
+        self._start = self._file.tell()
+        self._pending = []
+        self._pending_bytes = 0
+        self.records = 0
+        if self._start and not self._cas:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._pending.append(b'\n')
+                    self._pending_bytes = 1
+
+    def write(self, text):
+        if self._cas:
+            data = CAS_LEADER + bytes((CAS_SYNC,)) + f"{text}\r".encode('latin-1', 'replace')
+        else:
+            data = f"{text}\n".encode('utf-8')
+        self._pending.append(data)
+        self._pending_bytes += len(data)
+        self.records += 1
+        if self._pending_bytes >= TAPE_WRITE_CHUNK:
+            self._write_pending()
+
+    def _write_pending(self):
+        if self._pending:
+            try:
+                self._file.write(b''.join(self._pending))
+            except OSError:
+                self._rollback()
+                raise
+            self._pending.clear()
+            self._pending_bytes = 0
+
+    def _rollback(self):
+        """Drop everything this writer appended (after a failed write)."""
+        self._pending.clear()
+        self._pending_bytes = 0
+        try:
+            self._file.close()
+        except OSError:
+            pass  # the unflushed tail is what is being dropped anyway
+        try:
+            os.truncate(self.path, self._start)
+        except OSError:
+            pass
+
+    def commit(self):
+        self._write_pending()
+        try:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        except OSError:
+            self._rollback()
+            raise
+
+
+# Level II keyword tokens, in code order from 0x80 (END) to 0xFA (MID$).
+# Stored programs (CSAVE / .CAS images) hold these bytes instead of words.
+LEVEL2_TOKENS = (
+    'END', 'FOR', 'RESET', 'SET', 'CLS', 'CMD', 'RANDOM', 'NEXT',
+    'DATA', 'INPUT', 'DIM', 'READ', 'LET', 'GOTO', 'RUN', 'IF',
+    'RESTORE', 'GOSUB', 'RETURN', 'REM', 'STOP', 'ELSE', 'TRON', 'TROFF',
+    'DEFSTR', 'DEFINT', 'DEFSNG', 'DEFDBL', 'LINE', 'EDIT', 'ERROR', 'RESUME',
+    'OUT', 'ON', 'OPEN', 'FIELD', 'GET', 'PUT', 'CLOSE', 'LOAD',
+    'MERGE', 'NAME', 'KILL', 'LSET', 'RSET', 'SAVE', 'SYSTEM', 'LPRINT',
+    'DEF', 'POKE', 'PRINT', 'CONT', 'LIST', 'LLIST', 'DELETE', 'AUTO',
+    'CLEAR', 'CLOAD', 'CSAVE', 'NEW', 'TAB(', 'TO', 'FN', 'USING',
+    'VARPTR', 'USR', 'ERL', 'ERR', 'STRING$', 'INSTR', 'POINT', 'TIME$',
+    'MEM', 'INKEY$', 'THEN', 'NOT', 'STEP', '+', '-', '*',
+    '/', '^', 'AND', 'OR', '>', '=', '<', 'SGN',
+    'INT', 'ABS', 'FRE', 'INP', 'POS', 'SQR', 'RND', 'LOG',
+    'EXP', 'COS', 'SIN', 'TAN', 'ATN', 'PEEK', 'CVI', 'CVS',
+    'CVD', 'EOF', 'LOC', 'LOF', 'MKI$', 'MKS$', 'MKD$', 'CINT',
+    'CSNG', 'CDBL', 'FIX', 'LEN', 'STR$', 'VAL', 'ASC', 'CHR$',
+    'LEFT$', 'RIGHT$', 'MID$',
+)
+_TOKEN_CODES = {word: 0x80 + i for i, word in enumerate(LEVEL2_TOKENS)}
+# Longest word first so INPUT is not read as INP + UT
+_TOKEN_RE = re.compile('|'.join(re.escape(w) for w in sorted(LEVEL2_TOKENS, key=len, reverse=True)))
+_TOKEN_REM_QUOTE = 0xFB   # ':' REM 0xFB is how Level II stores the ' remark
+_TEXT_ESCAPE = 0xFF       # not a token: the UTF-8 bytes of one non-ASCII character follow
+_TOKEN_REM = _TOKEN_CODES['REM']
+_TOKEN_DATA = _TOKEN_CODES['DATA']
+
+
+def tokenize_line(text):
+    """Crunch the text of one program line (no line number) to Level II bytes.
+
+    Words inside quotes, after REM and in DATA items stay as typed, so
+    detokenize_line() gives the text back unchanged.  Strings, remarks and
+    DATA items are UTF-8, so a REM with an em dash survives the round trip;
+    a ' remark is stored as :REM 0xFB like Level II does.  A non-ASCII
+    character anywhere else is _TEXT_ESCAPE plus its UTF-8 bytes, since
+    bytes 0x80-0xFA there would read back as keywords.
+    """
+    out = bytearray()
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if ch == '"':
+            j = text.find('"', i + 1)
+            j = n if j < 0 else j + 1
+            out += text[i:j].encode('utf-8')
+            i = j
+            continue
+        if ch == "'":
+            out += bytes((ord(':'), _TOKEN_REM, _TOKEN_REM_QUOTE))
+            out += text[i + 1:].encode('utf-8')
+            break
+        m = _TOKEN_RE.match(text, i)
+        if m is None:
+            if ch < '\x80':
+                out.append(ord(ch))
+            else:
+                out.append(_TEXT_ESCAPE)
+                out += ch.encode('utf-8')
+            i += 1
+            continue
+        code = _TOKEN_CODES[m.group()]
+        out.append(code)
+        i = m.end()
+        if code == _TOKEN_REM:
+            out += text[i:].encode('utf-8')
+            break
+        if code == _TOKEN_DATA:
+            # DATA items run to the next colon outside quotes
+            j = i
+            quoted = False
+            while j < n and (quoted or text[j] != ':'):
+                quoted ^= text[j] == '"'
+                j += 1
+            out += text[i:j].encode('utf-8')
+            i = j
+    return bytes(out)
+
+
+def _decode_text(raw):
+    # Strings and remarks: UTF-8 from tokenize_line, else a tape's raw bytes
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw.decode('latin-1')
+
+
+def detokenize_line(data):
+    """Expand Level II token bytes back to program text."""
+    data = bytes(data)
+    out = []
+    i = 0
+    n = len(data)
+    while i < n:
+        byte = data[i]
+        if byte == 34:
+            j = data.find(b'"', i + 1)
+            j = n if j < 0 else j + 1
+            out.append(_decode_text(data[i:j]))
+            i = j
+            continue
+        i += 1
+        if byte < 0x80:
+            out.append(chr(byte))
+            continue
+        if byte == _TEXT_ESCAPE:
+            # One UTF-8 character; its lead byte gives the length
+            lead = data[i] if i < n else 0
+            size = 4 if lead >= 0xF0 else 3 if lead >= 0xE0 else 2
+            out.append(_decode_text(data[i:i + size]))
+            i += size
+            continue
+        index = byte - 0x80
+        out.append(LEVEL2_TOKENS[index] if index < len(LEVEL2_TOKENS) else '?')
+        if byte == _TOKEN_REM:
+            rest = data[i:]
+            if rest[:1] == bytes((_TOKEN_REM_QUOTE,)) and out[-2:] == [':', 'REM']:
+                out[-2:] = ["'"]
+                rest = rest[1:]
+            out.append(_decode_text(rest))
+            break
+        if byte == _TOKEN_DATA:
+            j = i
+            quoted = False
+            while j < n and (quoted or data[j] != 58):
+                quoted ^= data[j] == 34
+                j += 1
+            out.append(_decode_text(data[i:j]))
+            i = j
+    return ''.join(out)
+
+
+def upper_outside_strings(line):
+    """line uppercased except inside "quoted" strings (an open quote runs to the end)."""
+    if '"' not in line:
+        return line.upper()
+    parts = line.split('"')
+    parts[::2] = [part.upper() for part in parts[::2]]
+    return '"'.join(parts)
+
+
+def parse_program_line(line):
+    """(number, text) of a "NNN text" program line, or None without a line number.
+
+    Decimal line numbers (8389.1) are accepted; whole ones come back as int.
+    """
+    parts = line.strip().split(None, 1)
+    if not parts or not parts[0].replace('.', '', 1).isdigit():
+        return None
+    number = float(parts[0])
+    if number.is_integer():
+        number = int(number)
+    return number, parts[1].rstrip() if len(parts) > 1 else ''
+
+
+# Editor edits touching more rows than this re-load the whole program instead
+# of one set_line per row (pasting a listing into an empty editor, say).
+EDITOR_SYNC_MAX_ROWS = 64
+
+
+class ProgramStore:
+    """The BASIC program as Level II keeps it: tokenised lines in one bytearray.
+
+    Each line is a 2-byte link, a 2-byte line number, the tokenize_line()
+    bytes and a zero; a zero link ends the program, so len(data) is what
+    the program takes in RAM from PROGRAM_START.  numbers and offsets index
+    the lines in order: a line is found with bisect and an edit is one
+    bytearray splice.  Links (addresses from PROGRAM_START) are only filled
+    in by image().  Decimal line numbers, a simulator extension, keep their
+    exact value in numbers and the integer part in the 2-byte field.
+    Rows typed without a line number are not program lines; they are kept
+    as typed in loose and listed after the program, so the editor never
+    loses them.
+    """
+
+    def __init__(self):
+        self.data = bytearray(2)
+        self.numbers = []
+        self.offsets = []
+        self.loose = []
+        self._listing = None
+        self._linked = True
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def __contains__(self, number):
+        i = bisect_left(self.numbers, number)
+        return i < len(self.numbers) and self.numbers[i] == number
+
+    def _changed(self):
+        self._listing = None
+        self._linked = False
+
+    @staticmethod
+    def _record(number, text):
+        return struct.pack('<HH', 0, int(number) & 0xFFFF) + tokenize_line(text) + b'\x00'
+
+    def load(self, lines):
+        """Replace the program with "NNN text" lines (any order; the last one of a number wins)."""
+        entries = {}
+        loose = []
+        for line in lines:
+            parsed = parse_program_line(line)
+            if parsed is None:
+                if line.strip():
+                    loose.append(line.rstrip())
+                continue
+            number, text = parsed
+            if text:
+                entries[number] = text
+            else:
+                entries.pop(number, None)
+        data = bytearray()
+        offsets = []
+        numbers = sorted(entries)
+        for number in numbers:
+            offsets.append(len(data))
+            data += self._record(number, entries[number])
+        data += b'\x00\x00'
+        self.data, self.numbers, self.offsets = data, numbers, offsets
+        self.loose = loose
+        self._changed()
+
+    def load_image(self, image):
+        """Replace the program with Level II program bytes (a CSAVE record), unchanged.
+
+        A tape whose line numbers are out of order or repeated is put in
+        order, the last line of a number winning (as load() does).
+        """
+        image = bytes(image)
+        records = {}
+        ordered = True
+        last = -1
+        pos = 0
+        while pos + 4 <= len(image) and (image[pos] or image[pos + 1]):
+            end = image.find(b'\x00', pos + 4)
+            if end < 0:
+                end = len(image)
+            number = image[pos + 2] | image[pos + 3] << 8
+            ordered = ordered and number > last
+            last = number
+            records[number] = image[pos:end] + b'\x00'
+            pos = end + 1
+        numbers = list(records) if ordered else sorted(records)
+        data = bytearray()
+        offsets = []
+        for number in numbers:
+            offsets.append(len(data))
+            data += records[number]
+        data += b'\x00\x00'
+        self.data, self.numbers, self.offsets = data, numbers, offsets
+        self.loose = []
+        self._changed()
+
+    def _replace(self, first, last, numbers, records):
+        """Lines first..last-1 become records (one bytearray splice)."""
+        offsets = self.offsets
+        start = offsets[first] if first < len(offsets) else len(self.data) - 2
+        end = offsets[last] if last < len(offsets) else len(self.data) - 2
+        blob = b''.join(records)
+        self.data[start:end] = blob
+        delta = len(blob) - (end - start)
+        placed = []
+        for record in records:
+            placed.append(start)
+            start += len(record)
+        tail = offsets[last:]
+        if delta:
+            tail = [offset + delta for offset in tail]
+        offsets[first:] = placed + tail
+        self.numbers[first:last] = numbers
+        listing = self._listing
+        self._changed()
+        if listing is not None:
+            # Patch the cached listing rather than detokenising every line again
+            listing[first:last] = [f"{number} {detokenize_line(record[4:-1])}"
+                                   for number, record in zip(numbers, records)]
+            self._listing = listing
+
+    def set_line(self, number, text):
+        """Add or replace line number; empty text deletes it (as typing "10" does).
+
+        Returns (index, 'replace' | 'insert' | 'delete'), or (index, None)
+        when there was nothing to delete, so a view can patch just that line.
+        """
+        numbers = self.numbers
+        i = bisect_left(numbers, number)
+        found = i < len(numbers) and numbers[i] == number
+        if text:
+            self._replace(i, i + found, [number], [self._record(number, text)])
+            return i, 'replace' if found else 'insert'
+        if found:
+            self._replace(i, i + 1, [], [])
+            return i, 'delete'
+        return i, None
+
+    def delete_range(self, first, last):
+        """Delete lines first..last inclusive; returns how many went."""
+        i = bisect_left(self.numbers, first)
+        j = bisect_right(self.numbers, last)
+        if j > i:
+            self._replace(i, j, [], [])
+        return max(0, j - i)
+
+    def line_text(self, index):
+        start = self.offsets[index] + 4
+        return detokenize_line(self.data[start:self.data.find(b'\x00', start)])
+
+    def listing(self):
+        """"NNN text" lines in order, detokenised once (edits patch it), then loose."""
+        if self._listing is None:
+            self._listing = [f"{number} {self.line_text(i)}" for i, number in enumerate(self.numbers)]
+        return self._listing + self.loose if self.loose else self._listing
+
+    def text(self):
+        return '\n'.join(self.listing())
+
+    def lines(self):
+        """(number, text) of each program line in order, detokenised (loose rows are not lines)."""
+        for i, number in enumerate(self.numbers):
+            yield number, self.line_text(i)
+
+    def image(self):
+        """The program bytes with every link pointing at the next line's address.
+
+        Raises ValueError(number) for the first decimal line number: the
+        2-byte field can't hold it, and CLOAD would get two lines with one
+        number.
+        """
+        for number in self.numbers:
+            if number != int(number):
+                raise ValueError(number)
+        data = self.data
+        if not self._linked:
+            offsets = self.offsets
+            ends = offsets[1:] + [len(data) - 2]
+            for offset, following in zip(offsets, ends):
+                struct.pack_into('<H', data, offset, PROGRAM_START + following)
+            self._linked = True
+        return bytes(data)
+
+
+# Model I 500-baud cassette layout (.CAS images hold the decoded bytes):
+# a leader of zero bytes, the A5 sync byte, then one record.
+CAS_LEADER = bytes(255)
+CAS_SYNC = 0xA5
+_CAS_BASIC = b'\xd3\xd3\xd3'  # CSAVE header, followed by a one-letter name
+_CAS_SYSTEM = 0x55              # SYSTEM tape header, followed by a 6-byte name
+_CAS_BLOCK = 0x3C               # SYSTEM data block: length, address, data, checksum
+_CAS_ENTRY = 0x78               # SYSTEM end: entry address
+
+
+def encode_cas_program(program_image, name='A'):
+    """CSAVE image of a program's Level II bytes (ProgramStore.image())."""
+    out = bytearray(CAS_LEADER)
+    out.append(CAS_SYNC)
+    out += _CAS_BASIC
+    out += (name[:1] or 'A').upper().encode('ascii', 'replace')
+    out += program_image
+    return bytes(out)
+
+
+# Compiled-program cache: RUN's preprocessed line tables, keyed by source hash.
+# Bump COMPILE_CACHE_VERSION when the table layout changes (edits to this
+# file already change the key).
+COMPILE_CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+                                 'trs80sim')
+COMPILE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+COMPILE_CACHE_VERSION = 1
+# A .tmp file in the cache older than this was left by a crashed put()
+COMPILE_CACHE_TEMP_AGE = 3600
+
+
+class CompiledProgramCache:
+    """RUN tables of programs already run, kept on disk with marshal.
+
+    One file per program, named by a SHA-1 of the interpreter (this file's
+    bytes + COMPILE_CACHE_VERSION) and the program listing.  A hit touches
+    the file's mtime, and once the folder grows past max_bytes the oldest
+    files are deleted, so the cache is LRU.  Any I/O or format problem just
+    means a miss, and so does a file that doesn't hold RUN's six tables:
+    the cache can never stop a program from running.
+    """
+
+    def __init__(self, folder=COMPILE_CACHE_DIR, max_bytes=COMPILE_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        digest = hashlib.sha1(str(COMPILE_CACHE_VERSION).encode())
+        try:
+            with open(__file__, 'rb') as f:
+                digest.update(f.read())
+        except OSError:
+            pass
+        self._interpreter = digest.digest()
+
+    def key(self, source):
+        return hashlib.sha1(self._interpreter + source.encode('utf-8', 'replace')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + '.marshal')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                tables = marshal.load(f)
+            os.utime(path)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        return tables if self._valid(tables) else None
+
+    @staticmethod
+    def _valid(tables):
+        """The shape _compile_program returns: four per-line lists of one
+        length, the DATA values and the INKEY$ flag."""
+        if not isinstance(tables, tuple) or len(tables) != 6:
+            return False
+        *lists, uses_inkey = tables
+        return (all(isinstance(table, list) for table in lists)
+                and len({len(table) for table in lists[:4]}) == 1
+                and isinstance(uses_inkey, bool))
+
+    def put(self, key, tables):
+        temp_path = None
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.folder, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(tables, f)
+            os.replace(temp_path, self._path(key))
+            temp_path = None
+            self._evict()
+        except (OSError, ValueError):
+            if temp_path is not None:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        stale = time.time() - COMPILE_CACHE_TEMP_AGE
+        with os.scandir(self.folder) as it:
+            for entry in it:
+                if entry.name.endswith('.marshal'):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                    total += st.st_size
+                elif entry.name.endswith('.tmp') and entry.stat().st_mtime < stale:
+                    os.remove(entry.path)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+
+# Debug window log: messages go to a bounded ring, and the Text widget is
+# brought up to date from it at most every DEBUG_LOG_FLUSH_MS.
+DEBUG_LOG_MAX_LINES = 5000
+DEBUG_LOG_FLUSH_MS = 100
+DEBUG_LEVELS = {'info': 0, 'warning': 1, 'error': 2}
+
+# Program State window: refresh period, and array elements per expandable page
+STATE_VIEW_REFRESH_MS = 250
+STATE_ARRAY_PAGE = 100
+
+
+class DebugLog:
+    """The debug trace: a deque of (level, text) capped at max_lines.
+
+    append() is all debug_print pays per message; take_new() hands the
+    entries added since the last call to the window in one batch (if more
+    than max_lines arrived in between, only the newest survive), take_all()
+    fills a new window, and export() writes the whole ring.  Messages below
+    min_level are not kept.
+    """
+
+    def __init__(self, max_lines=DEBUG_LOG_MAX_LINES):
+        self.entries = deque(maxlen=max_lines)
+        self.min_level = DEBUG_LEVELS['info']
+        self._new = 0
+
+    def wants(self, level):
+        return DEBUG_LEVELS.get(level, 0) >= self.min_level
+
+    def append(self, level, text):
+        self.entries.append((level, text))
+        self._new += 1
+
+    def take_new(self):
+        count = min(self._new, len(self.entries))
+        self._new = 0
+        return [self.entries[i] for i in range(len(self.entries) - count, len(self.entries))]
+
+    def take_all(self):
+        """The whole ring, for a newly created window (nothing is new after it)."""
+        self._new = 0
+        return list(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self._new = 0
+
+    def export(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for _, text in self.entries:
+                f.write(text + '\n')
+
+
+class LineProfiler:
+    """Hit counts and wall time per statement of one RUN (PROFILE ON).
+
+    hits and seconds are arrays indexed like _line_numbers, so recording
+    a statement is two array updates.  lines and kinds give each
+    statement's program line and keyword, for the reports: by_line (a
+    line's hits are those of its busiest statement) and by_kind.
+    """
+
+    def __init__(self, lines, kinds):
+        self.lines = lines
+        self.kinds = kinds
+        self.hits = array('Q', bytes(8 * len(lines)))
+        self.seconds = array('d', bytes(8 * len(lines)))
+
+    def record(self, index, seconds):
+        self.hits[index] += 1
+        self.seconds[index] += seconds
+
+    def total_seconds(self):
+        return sum(self.seconds)
+
+    def by_line(self):
+        """{line number: (hits, seconds)} for every line that ran."""
+        totals = {}
+        for index, number in enumerate(self.lines):
+            if self.hits[index]:
+                hits, seconds = totals.get(number, (0, 0.0))
+                totals[number] = (max(hits, self.hits[index]), seconds + self.seconds[index])
+        return totals
+
+    def by_kind(self):
+        """{statement keyword: (hits, seconds)} summed over statements."""
+        totals = {}
+        for index, kind in enumerate(self.kinds):
+            if self.hits[index]:
+                hits, seconds = totals.get(kind, (0, 0.0))
+                totals[kind] = (hits + self.hits[index], seconds + self.seconds[index])
+        return totals
+
+
+# RUN PROFILE: Python stack samples of the interpreter, written as collapsed
+# stacks ("frame;frame;frame count" - flamegraph.pl / speedscope input).
+RUN_PROFILE_INTERVAL = 0.002
+RUN_PROFILE_FILE = 'trs80_profile.folded'
+# Innermost interpreter frames that name a subsystem by themselves
+RENDERER_FUNCTIONS = frozenset((
+    '_flush_graphics', '_put_screen_char', '_scroll_screen_up', 'print_to_screen',
+    'update_cursor_display', 'clear_screen'))
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread.
+
+    Every interval the target's frame (sys._current_frames) is walked into
+    a root-first tuple of labels and counted.  Functions of this module are
+    labelled by name, others "module:function"; _eval_nested frames also
+    name the evaluator Stage their line is in, so flame graphs split the
+    expression pipeline.  subsystems() folds the same counts into
+    evaluator stage / statement handler / renderer / GUI yield / regex.
+    """
+
+    def __init__(self, thread_id=None, interval=RUN_PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._labels = {}
+        self._stage_code = TRS80Simulator._eval_nested.__code__
+        self._stage_lines, self._stage_names = self._eval_stages(self._stage_code)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='StackSampler', daemon=True)
+
+    @staticmethod
+    def _eval_stages(code):
+        """First line and name of each "# --- Stage N: ..." block of _eval_nested."""
+        starts, names = [code.co_firstlineno], ['_eval_nested']
+        lines = linecache.getlines(code.co_filename)
+        header = lines[code.co_firstlineno - 1] if lines else ''
+        next_method = header[:len(header) - len(header.lstrip())] + 'def '
+        for lineno in range(code.co_firstlineno, len(lines)):
+            if lines[lineno].startswith(next_method):
+                break
+            text = lines[lineno].strip()
+            if text.startswith('# --- Stage '):
+                starts.append(lineno + 1)
+                names.append('_eval_nested:' + text[6:].split(':')[0])
+        return starts, names
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _label(self, frame):
+        code = frame.f_code
+        if code is self._stage_code:
+            lineno = frame.f_lineno or code.co_firstlineno
+            return self._stage_names[bisect_right(self._stage_lines, lineno) - 1]
+        label = self._labels.get(code)
+        if label is None:
+            module = frame.f_globals.get('__name__') or code.co_filename
+            label = code.co_name if frame.f_globals is globals() else f"{module}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame))
+                frame = frame.f_back
+            key = tuple(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1]):
+                f.write(';'.join(stack) + f' {count}\n')
+
+    @staticmethod
+    def subsystem(stack):
+        """What a sampled stack was doing, from its innermost interpreter frames."""
+        deeper = []
+        for label in reversed(stack):
+            if ':' in label and not label.startswith('_eval_nested:'):
+                deeper.append(label)
+                continue
+            if any(frame.startswith(('re:', 're.', 'sre_')) for frame in deeper):
+                return 'regex'
+            if label.startswith('_eval_nested:'):
+                return 'evaluator ' + label.split(':', 1)[1]
+            if label in ('evaluate_expression', '_eval_nested') or label.startswith('_func_'):
+                return 'evaluator'
+            if label in RENDERER_FUNCTIONS:
+                return 'renderer'
+            if label.startswith('_cmd_'):
+                return 'handler ' + label[5:].upper()
+            if label == 'execute_command':
+                return 'dispatch'
+            if label == 'execute_next_line':
+                return 'GUI yield' if any(frame.startswith('tkinter') for frame in deeper) else 'run loop'
+            if label == '<module>':
+                return 'idle (waiting in Tk)'
+        return 'other'
+
+    def subsystems(self):
+        totals = {}
+        for stack, count in self.stacks.items():
+            name = self.subsystem(stack)
+            totals[name] = totals.get(name, 0) + count
+        return sorted(totals.items(), key=lambda item: -item[1])
+
+
+class Metrics:
+    """Counters and timers behind STATS, the variables window and --stats.
+
+    counts and seconds are Counters, so a hot path pays one dict update
+    (metrics.counts['statements'] += 1).  Names are "subsystem.event";
+    a .hits/.misses pair is also reported as a hit rate.  RUN resets them.
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.seconds = Counter()
+
+    def reset(self):
+        self.counts.clear()
+        self.seconds.clear()
+
+    def hit_rates(self):
+        rates = {}
+        for name in self.counts:
+            if name.endswith('.hits'):
+                base = name[:-5]
+                lookups = self.counts[name] + self.counts[base + '.misses']
+                rates[base] = self.counts[name] / lookups if lookups else 0.0
+        return rates
+
+    def snapshot(self):
+        """Plain dict of everything, for JSON."""
+        return {'counts': dict(sorted(self.counts.items())),
+                'seconds': {name: round(value, 6) for name, value in sorted(self.seconds.items())},
+                'hit_rates': {name: round(rate, 4) for name, rate in sorted(self.hit_rates().items())}}
+
+    def report(self):
+        """Screen lines: name, count and milliseconds, then hit rates."""
+        lines = []
+        for name in sorted(set(self.counts) | set(self.seconds)):
+            count = self.counts[name] if name in self.counts else ''
+            ms = f"{self.seconds[name] * 1000:10.1f}" if name in self.seconds else ''
+            lines.append(f"{name:<26}{count:>10}{ms}")
+        run_time = self.seconds.get('run')
+        if run_time:
+            lines.append(f"{'statements/second':<26}{self.counts['statements'] / run_time:>10.0f}")
+        for name, rate in sorted(self.hit_rates().items()):
+            lines.append(f"{name + ' hit rate':<26}{100 * rate:>9.1f}%")
+        return lines
+
+
+# TRON trace ring: TRACE_RING_RECORDS statements of 3 uint32 each (12 bytes).
+# A .TRC export is TRACE_FILE_MAGIC, then little-endian <HIII (version,
+# statements, kind-name bytes, records), the kind names joined by NULs, one
+# float64 program line per statement index, then the records.
+TRACE_RING_RECORDS = 65536
+TRACE_FILE_MAGIC = b'TRS80TRC'
+TRACE_FILE_VERSION = 1
+
+
+class TraceRecorder:
+    """TRON's trace: (statement index, kind, virtual time) in an array('I') ring.
+
+    The ring keeps the last capacity statements; the virtual time is the
+    run's statement count, so two traces of the same input line up.
+    prepare() takes RUN's statement table (program line and keyword of
+    each index) and turns keywords into small codes, so record() is three
+    array stores.  Exports are CSV or the compact .TRC layout above.
+    """
+
+    def __init__(self, capacity=TRACE_RING_RECORDS):
+        self.capacity = capacity
+        self.ring = array('I', bytes(12 * capacity))
+        self.recorded = 0
+        self.lines = []
+        self.kind_names = []
+        self.kinds = array('B')
+        self.starts = array('B')
+
+    def prepare(self, lines, kinds):
+        self.kind_names = sorted(set(kinds))
+        codes = {name: code for code, name in enumerate(self.kind_names)}
+        self.kinds = array('B', [codes[kind] for kind in kinds])
+        # A statement starts its line unless the one before it is on the same line
+        self.starts = array('B', [i == 0 or lines[i] != lines[i - 1] for i in range(len(lines))])
+        self.lines = lines
+        self.recorded = 0
+
+    def record(self, index, clock):
+        ring = self.ring
+        slot = self.recorded % self.capacity * 3
+        ring[slot] = index
+        ring[slot + 1] = self.kinds[index]
+        ring[slot + 2] = clock & 0xFFFFFFFF
+        self.recorded += 1
+
+    def records(self):
+        """The kept records, oldest first, as a flat array('I') of index, kind, time."""
+        if self.recorded <= self.capacity:
+            return self.ring[:self.recorded * 3]
+        split = self.recorded % self.capacity * 3
+        return self.ring[split:] + self.ring[:split]
+
+    def write_csv(self, path):
+        records = self.records()
+        lines, names = self.lines, self.kind_names
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('time,line,index,kind\n')
+            for i in range(0, len(records), 3):
+                index = records[i]
+                f.write(f"{records[i + 2]},{lines[index]:g},{index},{names[records[i + 1]]}\n")
+
+    def write_binary(self, path):
+        records = self.records()
+        lines = array('d', self.lines)
+        names = '\0'.join(self.kind_names).encode('ascii', 'replace')
+        if sys.byteorder == 'big':
+            records.byteswap()
+            lines.byteswap()
+        with open(path, 'wb') as f:
+            f.write(TRACE_FILE_MAGIC)
+            f.write(struct.pack('<HIII', TRACE_FILE_VERSION, len(lines), len(names), len(records) // 3))
+            f.write(names)
+            f.write(lines.tobytes())
+            f.write(records.tobytes())
+
+
+# Breakpoint conditions: BASIC relational/logical expressions over variables
+# and array elements, compiled once to Python (AND/OR/NOT test truth).
+_CONDITION_TOKEN = re.compile(
+    r'\s*(?:((?:\d*\.\d+|\d+\.?)(?:E[-+]?\d+)?)|"([^"]*)"?|([A-Z][A-Z0-9]*[%!#$]?)'
+    r'|(<>|><|<=|=<|>=|=>|[-+*/^()<>=,]))')
+_CONDITION_OPS = {'=': '==', '<>': '!=', '><': '!=', '=<': '<=', '=>': '>=', '^': '**',
+                  'AND': ' and ', 'OR': ' or ', 'NOT': ' not '}
+
+
+def compile_basic_condition(text):
+    """Code object for a breakpoint condition, evaluated with _v(name) and
+    _a(name, *indexes) bound to the variables.  None if the condition calls
+    a function (it is then evaluated as BASIC each time); ValueError if it
+    cannot be parsed.
+    """
+    out = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _CONDITION_TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"bad condition at {text[pos:]!r}")
+        pos = match.end()
+        number, string, name, op = match.groups()
+        if number:
+            out.append(number)
+        elif string is not None:
+            out.append(repr(string))
+        elif name in _CONDITION_OPS:
+            out.append(_CONDITION_OPS[name])
+        elif name:
+            if name in LEVEL2_TOKENS or name + '(' in LEVEL2_TOKENS:
+                return None
+            rest = text[pos:].lstrip()
+            if rest.startswith('('):
+                pos = len(text) - len(rest) + 1
+                out.append(f"_a({name!r},")
+            else:
+                out.append(f"_v({name!r})")
+        else:
+            out.append(_CONDITION_OPS.get(op, op))
+    try:
+        return compile(''.join(out).strip(), '<breakpoint>', 'eval')
+    except SyntaxError as e:
+        raise ValueError(f"bad condition {text!r}") from e
+
+
+class Breakpoint:
+    """BREAK line [COUNT n] [IF condition]: stop before the line runs.
+
+    With a condition only passes where it is true count; the program stops
+    on the count-th such pass and every one after it.
+    """
+
+    def __init__(self, line, count=0, condition=''):
+        self.line = line
+        self.count = count
+        self.condition = condition
+        self.code = compile_basic_condition(condition) if condition else None
+        self.hits = 0
+
+    def __str__(self):
+        text = f"{self.line:g}"
+        if self.count:
+            text += f" COUNT {self.count}"
+        if self.condition:
+            text += f" IF {self.condition}"
+        return text
+
+
+class Watchpoint:
+    """WATCH target [IF condition]: pause after a write to a variable or array element.
+
+    indexes is None for a scalar, () for every element of an array, or
+    the (i,) / (i, j) subscripts of one element.  The condition is tested
+    after the write, so it sees the new value.
+    """
+
+    def __init__(self, name, indexes=None, condition=''):
+        self.name = name
+        self.indexes = indexes
+        self.condition = condition
+        self.code = compile_basic_condition(condition) if condition else None
+        self.hits = 0
+
+    def covers(self, index, dims):
+        """True if flat array index is (one of) the watched element(s)."""
+        if not self.indexes:
+            return True
+        if len(self.indexes) == 1:
+            return index == self.indexes[0]
+        return index == self.indexes[0] * (dims[1] + 1) + self.indexes[1]
+
+    def __str__(self):
+        text = self.name
+        if self.indexes is not None:
+            text += '(' + ','.join(map(str, self.indexes)) + ')'
+        if self.condition:
+            text += f" IF {self.condition}"
+        return text
+
+
+# HISTORY ON: a checkpoint every HISTORY_INTERVAL statements, the newest
+# HISTORY_CHECKPOINTS kept (each is about 64K of memory plus the variables).
+HISTORY_INTERVAL = 1000
+HISTORY_CHECKPOINTS = 64
+
+
+class ExecutionHistory:
+    """Checkpoints and an input log of the current RUN, for BACK.
+
+    step counts the statements run since RUN.  Every interval steps the
+    interpreter's state is copied into a ring of checkpoints, and every
+    nondeterministic read (an INKEY$ or keyboard PEEK result, a line typed
+    at INPUT) is appended to events in program order.  RND needs no log:
+    the checkpoint holds the random module's state.
+
+    BACK restores the newest checkpoint at or before the target step and
+    runs forward with replay_at set, so those reads take their values from
+    events instead of the keyboard and the rerun follows the same path.
+    In-memory files are in the checkpoint; a disk file can't be put back,
+    so file_writes lists the steps that opened one for writing, killed or
+    renamed one, and BACK refuses a replay that would run one of them again.
+    """
+
+    def __init__(self, interval=HISTORY_INTERVAL, size=HISTORY_CHECKPOINTS):
+        self.interval = interval
+        self.checkpoints = deque(maxlen=size)
+        self.reset('')
+
+    def reset(self, source):
+        self.source = source        # program text the log belongs to
+        self.step = 0
+        self.next_checkpoint = 0
+        self.checkpoints.clear()
+        self.events = []
+        self.event_base = 0         # event number of events[0]
+        self.file_writes = []       # steps that changed a disk file, in order
+        self.replay_at = None       # next event number to replay; None = recording
+        self.stop_at = None         # step the run loop pauses at while replaying
+
+    def event_count(self):
+        return self.event_base + len(self.events)
+
+    def next_event(self, default):
+        """The next logged read while replaying (default if the log ran out)."""
+        offset = self.replay_at - self.event_base
+        if offset >= len(self.events):
+            return default
+        self.replay_at += 1
+        return self.events[offset]
+
+    def add(self, checkpoint):
+        checkpoints = self.checkpoints
+        checkpoints.append(checkpoint)
+        # Events before the oldest checkpoint can never be replayed again
+        drop = checkpoints[0]['event'] - self.event_base
+        if drop > 0:
+            del self.events[:drop]
+            self.event_base += drop
+        del self.file_writes[:bisect_left(self.file_writes, checkpoints[0]['step'])]
+
+    def note_file_write(self):
+        """The statement running now changes a disk file (BACK won't replay it)."""
+        if self.replay_at is None:
+            self.file_writes.append(self.step - 1)
+
+    def writes_files(self, first, last):
+        """True if a step in first..last-1 changed a disk file."""
+        i = bisect_left(self.file_writes, first)
+        return i < len(self.file_writes) and self.file_writes[i] < last
+
+    def nearest(self, step):
+        """Newest checkpoint taken at or before step, or None."""
+        for checkpoint in reversed(self.checkpoints):
+            if checkpoint['step'] <= step:
+                return checkpoint
+        return None
+
+    def truncate(self):
+        """After BACK: forget the checkpoints and reads after the current step."""
+        while self.checkpoints and self.checkpoints[-1]['step'] > self.step:
+            self.checkpoints.pop()
+        del self.file_writes[bisect_left(self.file_writes, self.step):]
+        if self.replay_at is not None:
+            del self.events[self.replay_at - self.event_base:]
+            self.replay_at = None
+        self.next_checkpoint = (self.checkpoints[-1]['step'] + self.interval
+                                if self.checkpoints else self.step)
+
+
+# SAVE STATE / LOAD STATE file: magic, version, then the zlib-compressed
+# marshal of plain lists/dicts/bytes (see save_state).  Bump the version
+# when the payload layout changes; older files are then refused.
+STATE_FILE = 'trs80.state'
+STATE_FILE_MAGIC = b'TRS80STA'
+STATE_FILE_VERSION = 2
+_STATE_HEADER = struct.Struct('<8sH')
+STATE_OTHER_PROGRAM = "?STATE FILE IS FOR ANOTHER PROGRAM"
+
+
+class CasImage:
+    """A .CAS cassette image, decoded lazily.
+
+    The file is mmap'd and read through a memoryview.  Records are located
+    only as far as a caller asks (record n scans up to the n-th), and their
+    bytes are decoded on demand, so a large image costs almost nothing until
+    it is read.  Record kinds:
+        'basic'   CSAVE program (D3 D3 D3, name, tokenised lines)
+        'system'  SYSTEM tape (55, name, checksummed 3C blocks, 78 entry)
+        'data'    PRINT#-1 record (text up to a carriage return)
+    Used as a tape (line(n) = n-th data record) and by CLOAD.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if os.path.getsize(path):
+            with open(path, 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = b''
+        self._view = memoryview(self._data)
+        self._records = []        # (kind, start, end) found so far
+        self._data_records = []   # indexes into _records of 'data' records
+        self._scan_pos = 0
+
+    def _next_record(self):
+        view = self._view
+        size = len(view)
+        pos = self._scan_pos
+        while pos < size and view[pos] == 0:
+            pos += 1
+        if pos >= size or view[pos] != CAS_SYNC:
+            self._scan_pos = size
+            return None
+        start = pos + 1
+        if view[start:start + 3] == _CAS_BASIC:
+            kind, end = 'basic', self._basic_end(start + 4)
+        elif start + 7 < size and view[start] == _CAS_SYSTEM and view[start + 7] in (_CAS_BLOCK, _CAS_ENTRY):
+            kind, end = 'system', self._system_end(start + 7)
+        else:
+            cr = self._data.find(b'\r', start)
+            kind, end = 'data', size if cr < 0 else cr + 1
+        if kind == 'data':
+            self._data_records.append(len(self._records))
+        record = (kind, start, end)
+        self._records.append(record)
+        self._scan_pos = end
+        return record
+
+    def _basic_end(self, pos):
+        view = self._view
+        size = len(view)
+        while pos + 1 < size and (view[pos] or view[pos + 1]):
+            end = self._data.find(b'\x00', pos + 4)
+            if end < 0:
+                return size
+            pos = end + 1
+        return min(pos + 2, size)
+
+    def _system_end(self, pos):
+        view = self._view
+        size = len(view)
+        while pos < size:
+            if view[pos] == _CAS_BLOCK and pos + 1 < size:
+                pos += 5 + (view[pos + 1] or 256)
+            elif view[pos] == _CAS_ENTRY:
+                return min(pos + 3, size)
+            else:
+                break
+        return min(pos, size)
+
+    def record(self, index):
+        while len(self._records) <= index:
+            if self._next_record() is None:
+                return None
+        return self._records[index]
+
+    def __len__(self):
+        while self._next_record() is not None:
+            pass
+        return len(self._data_records)
+
+    def line(self, number):
+        """The number-th PRINT#-1 record as text (INPUT#-1), or None past the end."""
+        while len(self._data_records) <= number:
+            if self._next_record() is None:
+                return None
+        _, start, end = self._records[self._data_records[number]]
+        return bytes(self._view[start:end]).rstrip(b'\r').decode('latin-1').strip()
+
+    def first_program(self):
+        """The first 'basic' or 'system' record, or None."""
+        index = 0
+        while True:
+            record = self.record(index)
+            if record is None or record[0] != 'data':
+                return record
+            index += 1
+
+    def basic_image(self, record):
+        """The Level II program bytes of a CSAVE record (for ProgramStore.load_image)."""
+        _, start, end = record
+        return bytes(self._view[start + 4:end])
+
+    def record_name(self, record):
+        kind, start, _ = record
+        if kind == 'basic':
+            return chr(self._view[start + 3])
+        if kind == 'system':
+            return bytes(self._view[start + 1:start + 7]).decode('latin-1').strip()
+        return ''
+
+    def system_blocks(self, record):
+        """Yield (address, data) per SYSTEM block; raises ValueError('BAD') on a checksum error.
+
+        The entry address is returned by the generator (StopIteration.value).
+        """
+        _, start, end = record
+        view = self._view
+        pos = start + 7
+        while pos < end and view[pos] == _CAS_BLOCK:
+            length = view[pos + 1] or 256
+            address = view[pos + 2] | (view[pos + 3] << 8)
+            data = view[pos + 4:pos + 4 + length]
+            checksum = view[pos + 4 + length] if pos + 4 + length < end else -1
+            if (view[pos + 2] + view[pos + 3] + sum(data)) & 0xFF != checksum:
+                raise ValueError('BAD')
+            yield address, data
+            pos += 5 + length
+        if pos + 2 < end and view[pos] == _CAS_ENTRY:
+            return view[pos + 1] | (view[pos + 2] << 8)
+        return None
+
+    def close(self):
+        self._view.release()
+        if isinstance(self._data, mmap.mmap):
+            try:
+                self._data.close()
+            except BufferError:
+                pass  # a record slice is still referenced; the map goes with it
+        self._data = b''
+        self._view = memoryview(b'')
+
+
+class SequentialFile:
+    """One OPEN "I"/"O"/"E" channel (#1-#15) over a text stream.
+
+    The stream is an io.StringIO for files kept in memory (_seq_files) or a
+    buffered host file.  LINE INPUT# reads one line at a time and PRINT#
+    writes straight to the stream, so neither side holds the file as one
+    growing string.  records counts lines read or written (LOC).
+    """
+
+    def __init__(self, name, mode, stream, path=None):
+        self.name = name
+        self.mode = mode
+        self.stream = stream
+        self.path = path
+        self.records = 0
+        self._lookahead = None
+
+    def read_line(self):
+        """Next line without its line ending, or None at end of file."""
+        line = self._lookahead if self._lookahead is not None else self.stream.readline()
+        self._lookahead = None
+        if not line:
+            return None
+        self.records += 1
+        if line.endswith('\n'):
+            line = line[:-1]
+        if line.endswith('\r'):
+            line = line[:-1]
+        return line
+
+    def at_end(self):
+        if self.mode != 'I':
+            return False
+        if self._lookahead is None:
+            self._lookahead = self.stream.readline()
+        return not self._lookahead
+
+    def write(self, text):
+        self.stream.write(text)
+        self.records += text.count('\n')
+
+    def close(self):
+        """Close the stream; returns the text of an in-memory output file, else None."""
+        text = None
+        if self.path is None and self.mode != 'I':
+            text = self.stream.getvalue()
+        self.stream.close()
+        return text
+
+
+# Disk BASIC OPEN "R" record length when none is given
+RANDOM_RECORD_LENGTH = 256
+
+
+class RandomFile:
+    """An OPEN "R" channel: fixed-length records of a memory-mapped host file.
+
+    buffer is the channel's record buffer and FIELD variables are slices of
+    it.  GET copies record n from the map into the buffer and PUT copies it
+    back, each one slice assignment through a memoryview (no intermediate
+    bytes).  PUT past the end grows the file and re-maps it.
+    """
+
+    mode = 'R'
+
+    def __init__(self, name, path, record_length=RANDOM_RECORD_LENGTH):
+        self.name = name
+        self.path = path
+        self.record_length = record_length
+        self.buffer = bytearray(record_length)
+        self.fields = []   # (variable, offset, width) from FIELD
+        self.records = 0   # LOC: last record read or written
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'w+b')
+        self._map = None
+        self._view = memoryview(b'')
+        self._remap()
+
+    def _remap(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), size) if size else None
+        self._view = memoryview(self._map) if size else memoryview(b'')
+
+    def __len__(self):
+        return -(-len(self._view) // self.record_length)
+
+    def at_end(self):
+        return self.records >= len(self)
+
+    def get(self, number):
+        length = self.record_length
+        start = (number - 1) * length
+        view = self._view
+        if start + length <= len(view):
+            self.buffer[:] = view[start:start + length]
+        else:
+            tail = bytes(view[start:]) if start < len(view) else b''
+            self.buffer[:] = tail.ljust(length, b'\x00')
+        self.records = number
+
+    def put(self, number):
+        end = number * self.record_length
+        if len(self._view) < end:
+            self._file.truncate(end)
+            self._remap()
+        self._view[end - self.record_length:end] = self.buffer
+        self.records = number
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+        self._file.close()
+        return None
+
+
+def _basic_str_literal(text):
+    """Python literal for a BASIC string, safe for any character 0-255.
+
+    Binary strings (MKI$, CHR$(0), CHR$(92)) need escapes; everything else
+    keeps the cheap quote-only form.
+    """
+    if text.isprintable() and '\\' not in text:
+        return "'" + text.replace("'", "\\'") + "'"
+    return "'" + text.encode('unicode_escape').decode('ascii').replace("'", "\\'") + "'"
+
+
+def _to_mbf(value, size):
+    """Microsoft Binary Format bytes (MKS$ size 4, MKD$ size 8) of a number."""
+    if value == 0:
+        return bytes(size)
+    if size == 4:
+        bits = struct.unpack('<I', struct.pack('<f', value))[0]
+        sign, exponent, mantissa = bits >> 31, (bits >> 23) & 0xFF, bits & 0x7FFFFF
+        exponent += 2          # IEEE bias 127 -> MBF bias 129 (hidden bit before the point)
+        if exponent > 255:
+            raise OverflowError(value)
+        return struct.pack('<I', (exponent << 24) | (sign << 23) | mantissa)
+    bits = struct.unpack('<Q', struct.pack('<d', value))[0]
+    sign, exponent, mantissa = bits >> 63, (bits >> 52) & 0x7FF, bits & ((1 << 52) - 1)
+    exponent -= 1023 - 129
+    if exponent > 255:
+        raise OverflowError(value)
+    if exponent <= 0:
+        return bytes(size)
+    return struct.pack('<Q', (exponent << 56) | (sign << 55) | (mantissa << 3))
+
+
+def _from_mbf(data):
+    """Number from 4-byte (CVS) or 8-byte (CVD) Microsoft Binary Format."""
+    if len(data) == 4:
+        bits = struct.unpack('<I', data)[0]
+        exponent = bits >> 24
+        if exponent <= 2:
+            return 0.0
+        ieee = (((bits >> 23) & 1) << 31) | ((exponent - 2) << 23) | (bits & 0x7FFFFF)
+        return struct.unpack('<f', struct.pack('<I', ieee))[0]
+    bits = struct.unpack('<Q', data)[0]
+    exponent = bits >> 56
+    if exponent == 0:
+        return 0.0
+    ieee = (((bits >> 55) & 1) << 63) | ((exponent + 1023 - 129) << 52) | ((bits >> 3) & ((1 << 52) - 1))
+    return struct.unpack('<d', struct.pack('<Q', ieee))[0]
+
+
+# Virtual TRSDOS drives :0-:3
+DISK_DRIVES = 4
+# JV1 disk images: single-sided, 10 sectors of 256 bytes per track;
+# TRSDOS 2.3 keeps its directory on track 17 (GAT, HIT, then 48-byte entries)
+JV1_SECTOR_SIZE = 256
+JV1_SECTORS_PER_TRACK = 10
+TRSDOS_DIR_TRACK = 17
+TRSDOS_DIR_ENTRY = 48
+TRSDOS_GRANULE_SECTORS = 5
+# An entry's extent pairs start at byte 22: FF ends the list, FE links to
+# an extension entry (FXDE) whose directory entry code follows it
+TRSDOS_EXTENT_START = 22
+TRSDOS_EXTENT_SLOTS = 5
+
+
+def trsdos_name(name):
+    """Index key for a file name: upper case, extension after '/' (CAVE.DAT -> CAVE/DAT)."""
+    name = name.strip().upper()
+    if '/' not in name:
+        stem, dot, ext = name.rpartition('.')
+        if dot and stem:
+            name = stem + '/' + ext
+    return name
+
+
+def split_drive_spec(name):
+    """("CAVE.DAT", None) for "CAVE.DAT"; ("CAVE.DAT", 1) for "CAVE.DAT:1".
+
+    A drive number outside 0-3 comes back as -1.
+    """
+    stem, colon, drive = name.rpartition(':')
+    if not colon or not drive.strip().isdigit():
+        return name, None
+    number = int(drive)
+    return stem, number if number < DISK_DRIVES else -1
+
+
+class FolderDrive:
+    """A TRSDOS drive backed by a host folder.
+
+    index maps trsdos_name() keys to host file names.  It is built with one
+    os.scandir and rebuilt only when a lookup misses and the folder's mtime
+    has changed, so finding a known file is a dict lookup.
+    """
+
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+        self.index = {}
+        self._mtime = None
+        self.refresh()
+
+    def refresh(self):
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            self.index, self._mtime = {}, None
+            return
+        if mtime == self._mtime:
+            return
+        index = {}
+        try:
+            with os.scandir(self.folder) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        index.setdefault(trsdos_name(entry.name), entry.name)
+        except OSError:
+            pass
+        self.index, self._mtime = index, mtime
+
+    def find(self, name):
+        """Host path of name (any case, CAVE.DAT or CAVE/DAT), or None."""
+        key = trsdos_name(name)
+        fn = self.index.get(key)
+        if fn is None:
+            self.refresh()
+            fn = self.index.get(key)
+        return None if fn is None else os.path.join(self.folder, fn)
+
+    def names(self):
+        """(name, bytes) of every file, sorted, for DIR."""
+        self.refresh()
+        listing = []
+        for key, fn in sorted(self.index.items()):
+            try:
+                listing.append((key, os.path.getsize(os.path.join(self.folder, fn))))
+            except OSError:
+                pass
+        return listing
+
+    def open_input(self, name):
+        return open(self.find(name), 'r', encoding='utf-8-sig', errors='replace')
+
+    def output_path(self, name):
+        """Host path to write name to (an existing file keeps its case)."""
+        path = self.find(name)
+        if path is None:
+            fn = trsdos_name(name).replace('/', '.')
+            self.index[trsdos_name(name)] = fn
+            path = os.path.join(self.folder, fn)
+        return path
+
+    def kill(self, name):
+        os.remove(self.find(name))
+        self.index.pop(trsdos_name(name), None)
+
+    def rename(self, old, new):
+        if self.find(new):
+            raise FileExistsError(new)
+        fn = trsdos_name(new).replace('/', '.')
+        os.rename(self.find(old), os.path.join(self.folder, fn))
+        self.index.pop(trsdos_name(old), None)
+        self.index[trsdos_name(new)] = fn
+
+
+class DiskImageDrive:
+    """A read-only TRSDOS 2.3 drive from a JV1 disk image (.DSK).
+
+    The directory sectors are parsed once into index (name -> extents, size,
+    hidden; extents continued in extension entries are joined on) and again
+    only when the image file's mtime changes.  A file is
+    read by joining its extents' sectors; writes raise PermissionError.
+    """
+
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.index = {}
+        self._mtime = None
+        self.refresh()
+
+    def refresh(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        with open(self.path, 'rb') as f:
+            self.index = self._read_directory(f.read())
+        self._mtime = mtime
+
+    @staticmethod
+    def _read_directory(data):
+        index = {}
+        track = TRSDOS_DIR_TRACK * JV1_SECTORS_PER_TRACK * JV1_SECTOR_SIZE
+        # Sector 0 is the GAT and sector 1 the HIT; entries follow
+        for sector in range(2, JV1_SECTORS_PER_TRACK):
+            base = track + sector * JV1_SECTOR_SIZE
+            for start in range(base, base + JV1_SECTOR_SIZE - TRSDOS_DIR_ENTRY + 1, TRSDOS_DIR_ENTRY):
+                entry = data[start:start + TRSDOS_DIR_ENTRY]
+                if len(entry) < TRSDOS_DIR_ENTRY:
+                    return index
+                attributes = entry[0]
+                if not attributes & 0x10 or attributes & 0x80:
+                    continue  # free slot or extension entry
+                stem = entry[5:13].decode('latin-1').rstrip()
+                ext = entry[13:16].decode('latin-1').rstrip()
+                if not stem:
+                    continue
+                extents = DiskImageDrive._extents(data, track, entry)
+                eof, ern = entry[3], entry[20] | entry[21] << 8
+                size = (ern - 1) * JV1_SECTOR_SIZE + eof if eof and ern else ern * JV1_SECTOR_SIZE
+                hidden = bool(attributes & 0x48)   # SYS or invisible
+                index[trsdos_name(stem + ('/' + ext if ext else ''))] = (extents, size, hidden)
+        return index
+
+    @staticmethod
+    def _extents(data, directory, entry):
+        """An entry's extents, following FE links through its extension entries.
+
+        Raises OSError for a link that is out of range, not to an extension
+        entry, or back to one already read.
+        """
+        extents = []
+        seen = set()
+        while True:
+            for i in range(TRSDOS_EXTENT_START, TRSDOS_EXTENT_START + 2 * TRSDOS_EXTENT_SLOTS, 2):
+                if entry[i] == 0xFF:
+                    return extents
+                if entry[i] == 0xFE:
+                    break
+                # track, then granule (bits 5-7) and granule count - 1 (bits 0-4)
+                extents.append((entry[i], entry[i + 1] >> 5, (entry[i + 1] & 0x1F) + 1))
+            else:
+                return extents
+            # Directory entry code: sector - 2 in bits 0-4, entry in the sector in bits 5-7
+            code = entry[i + 1]
+            sector, slot = 2 + (code & 0x1F), code >> 5
+            start = directory + sector * JV1_SECTOR_SIZE + slot * TRSDOS_DIR_ENTRY
+            entry = data[start:start + TRSDOS_DIR_ENTRY]
+            if (code in seen or sector >= JV1_SECTORS_PER_TRACK
+                    or (slot + 1) * TRSDOS_DIR_ENTRY > JV1_SECTOR_SIZE
+                    or len(entry) < TRSDOS_DIR_ENTRY or not entry[0] & 0x80):
+                raise OSError(f"bad TRSDOS extension directory link {code:#04x}")
+            seen.add(code)
+
+    def find(self, name):
+        key = trsdos_name(name)
+        if key not in self.index:
+            self.refresh()
+        return key if key in self.index else None
+
+    def names(self):
+        self.refresh()
+        return [(key, size) for key, (_, size, hidden) in sorted(self.index.items()) if not hidden]
+
+    def read(self, name):
+        extents, size, _ = self.index[trsdos_name(name)]
+        chunks = []
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            for track, granule, count in extents:
+                start = (track * JV1_SECTORS_PER_TRACK + granule * TRSDOS_GRANULE_SECTORS) * JV1_SECTOR_SIZE
+                chunks.append(image[start:start + count * TRSDOS_GRANULE_SECTORS * JV1_SECTOR_SIZE])
+        return b''.join(chunks)[:size]
+
+    def open_input(self, name):
+        # Disk BASIC ends lines with CR
+        text = self.read(name).decode('latin-1')
+        return io.StringIO(text.replace('\r\n', '\n').replace('\r', '\n'))
+
+    def output_path(self, name):
+        raise PermissionError(self.path)
+
+    def kill(self, name):
+        raise PermissionError(self.path)
+
+    def rename(self, old, new):
+        raise PermissionError(self.path)
+
+
+def open_tape(path):
+    """Reader for a tape file: .CAS image or line-per-record .dat text."""
+    if path.lower().endswith('.cas'):
+        return CasImage(path)
+    return TapeReader(path)
+
+
 class TRS80Simulator:
     # Shared Tk tag for all text glyphs; tag_raise after graphics flush keeps text above p{x}_{y} rects (like web text layer).
     CANVAS_TEXT_LAYER_TAG = 'txt'
@@ -157,9 +2056,33 @@ class TRS80Simulator:
     #  interpreter state, compile regex patterns, and initialize
     #  the command/function dispatch tables.
     # ============================================================
-    def __init__(self, master):
+    def __init__(self, master, memory_kb=MEMORY_SIZE_KB):
         self.master = master
-        master.title("JMR's TRS-80 Simulator v1.8")
+        self._build_gui()
+        self._init_interpreter_state(memory_kb)
+
+        self.new_program()
+        self.create_debug_window()
+        self.replaced = False
+        
+        # Bind input area changes to sync with stored_program
+        self.input_area.bind('<KeyRelease>', self.sync_input_to_stored, add='+')
+        
+        # Start cursor blinking after all initialization is complete
+        self.blink_cursor()
+        
+        # Enable immediate mode input
+        self.enable_immediate_mode()
+        
+        # Set main window size and position for 7" screen
+        self.optimize_for_7inch_screen()
+        # After geometry is applied, place sash so code pane ~4 lines (not half the window); keeps buttons visible.
+        self.master.after_idle(self._apply_initial_code_pane_sash)
+
+    def _build_gui(self):
+        """Create the Tk widgets and key bindings (front ends without Tk override this)."""
+        self.master.title("JMR's TRS-80 Simulator v1.8")
+        self.master.protocol("WM_DELETE_WINDOW", self.on_main_window_close)
 
         # Detect if running on Raspberry Pi to disable 2x scaling
         self.is_raspberry_pi = self.detect_raspberry_pi()
@@ -170,7 +2093,7 @@ class TRS80Simulator:
         self.input_font_size = 14  # Reduced from 14 to 10 for 7" screen
 
         # Set up the main frame
-        self.main_frame = tk.Frame(master, bg="lightgrey")
+        self.main_frame = tk.Frame(self.master, bg="lightgrey")
         self.main_frame.pack(fill=tk.BOTH, expand=True)
 
         # Vertical splitter: screen (min height = canvas + padding) + BASIC editor (drag sash to resize height).
@@ -281,6 +2204,8 @@ class TRS80Simulator:
 
         # Bind key press event to the main window
         self.master.bind('<Key>', self.on_key_press) # DO NOT REMOVE if removed the peek will not work
+        self.master.bind('<KeyRelease>', self.on_key_release)
+        self.master.bind('<FocusOut>', self._release_all_keys)
         # Explicit bindings: INPUT's Canvas <Key> returns "break" and would
         # otherwise swallow these before on_key_press runs.
         self.master.bind_all('<Control-c>', self._on_ctrl_c_break)
@@ -296,8 +2221,27 @@ class TRS80Simulator:
             self.screen.bind(button, self.show_right_click_menu)
             self.input_area.bind(button, self.show_right_click_menu)
 
-        # Initialize screen content
-        self.screen_content = [[' ' for _ in range(64)] for _ in range(16)]
+        self.input_area.bind('<KeyRelease>', self.capitalize_input)
+        self.input_area.bind('<<Paste>>', self._editor_paste)
+        # <<PasteSelection>> (middle button) inserts at the mouse, not the cursor
+        self.input_area.bind('<<PasteSelection>>',
+                             lambda event: self._editor_paste(event, f'@{event.x},{event.y}'))
+
+        # Add button to open LLM support window
+        self.llm_button = tk.Button(button_frame, text="Assistant: ON", command=self.toggle_llm_support, font=("Arial", 8), width=10, height=1)
+        self.llm_button.pack(side=tk.LEFT, padx=1)
+
+    def _init_interpreter_state(self, memory_kb):
+        """Memory map, screen, variables and dispatch tables — everything except the GUI."""
+        # Address space; video RAM (a view into it) is the single source of screen truth
+        self.memory = TRS80Memory(memory_kb)
+        self.memory.map_region(KEYBOARD_START, VIDEO_RAM_START, reader=self._peek_keyboard)
+        self.memory.map_region(VIDEO_RAM_START, VIDEO_RAM_START + VIDEO_RAM_SIZE, writer=self._poke_video)
+        self.string_space = DEFAULT_STRING_SPACE
+        self._update_memory_pointers()
+        self.video_ram = self.memory.video
+        self.video_ram[:] = _BLANK_SCREEN
+        self._dirty_cells = set()
         self.cursor_row = 0
         self.cursor_col = 0
         
@@ -333,23 +2277,40 @@ class TRS80Simulator:
         self._error_line_index = 0
         self._pending_goto = 0
         self._seq_files = {}
-        self._seq_chan = None
+        self._seq_channels = {}   # channel number -> SequentialFile
+        # Drives :0-:3 (FolderDrive / DiskImageDrive, see mount()).  OPEN
+        # "O"/"E" without a drive goes to :0; with :0 unmounted such files
+        # stay in _seq_files (memory) until the simulator exits.
+        self.drives = [None] * DISK_DRIVES
+        self._host_drives = {}    # folder -> FolderDrive for the fallback search
         # NEW: directory of last LOADed .bas — OPEN "I" looks here for CAVE.DAT etc.
         self._program_dir = None
-        self.last_key_pressed = None
+        self._key_buffer = deque()
+        self.key_buffer_depth = KEY_BUFFER_DEPTH
+        # Held keys: keycode -> (row, mask); _key_matrix is their OR per matrix row
+        self._held_keys = {}
+        self._key_matrix = bytearray(8)
         self.tape_file = None
         self.tape_data = []
         self.tape_pointer = 0
+        self._tape_reader = None
+        self._tape_writer = None
+        atexit.register(self._commit_tape_writer)
+        atexit.register(self._close_all_channels)
         self.stepping = False
         
         # Add immediate mode support
         self.immediate_mode = True
         self.command_buffer = ""
-        self.stored_program = []  # Store program lines entered in immediate mode
+        self.program = ProgramStore()  # the program, tokenised; stored_program lists it
+        self._editor_lines = None      # input_area rows as last synced (see _sync_editor_rows)
+        self.compile_cache = CompiledProgramCache()  # None disables it
         
         # Add variables window tracking
         self.variables_window_open = False
         self.variables_window = None
+        self._dirty_scalars = None     # scalar keys written since the state view refreshed;
+        self._dirty_arrays = None      # ...and array names.  None while the view is closed
         self.debug_window_open = False
         self.debug_window = None
         
@@ -359,17 +2320,36 @@ class TRS80Simulator:
 
         # Initialize missing variables
         self.sorted_program = []
-        self.input_area.bind('<KeyRelease>', self.capitalize_input)
         self.remaining_commands = []
         self.debug_text = None
         self.debug_mode = False
+        self.debug_log = DebugLog()
+        self._debug_flush_pending = False
+        self.profiling = False         # PROFILE ON: RUN fills line_profile
+        self.line_profile = None       # LineProfiler of the last profiled RUN
+        self._run_sampler = None       # StackSampler during RUN PROFILE
+        self.metrics = Metrics()       # STATS counters, reset by RUN
+        self.tron = False              # TRON: record each statement in tracer
+        self.tron_print = False        # ...and print <line> (TRON, not TRON RECORD)
+        self.tracer = None             # TraceRecorder, made by the first TRON
+        self.breakpoints = {}          # line number -> Breakpoint (BREAK n)
+        self._break_flags = None       # bytearray per statement index; None = no breakpoints
+        self._break_resume_index = None  # statement a CONT resumes at (skip its breakpoint once)
+        self.watchpoints = {}          # "X" / "A(3)" -> Watchpoint (WATCH)
+        self._watch_scalars = {}       # canonical scalar key -> Watchpoint
+        self._watch_arrays = {}        # array name -> [Watchpoint]; empty = no write hooks
+        self._watch_stop = None        # (watchpoint, old, new, line) to report after the statement
+        self.history = None            # ExecutionHistory while HISTORY ON (BACK)
+        self._run_started = None       # perf_counter() of RUN, until it ends
+        self._run_profile_path = RUN_PROFILE_FILE
         self._last_debug_command = ""
         self._last_eval_original = ""
         self._last_eval_substituted = ""
         self.original_program = []
-        self._pending_graphics = []
-        self._active_pixels = set()
-        # Canvas item id per (x,y) for SET/RESET — itemconfigure instead of delete+create each flush
+        # What the Canvas currently shows per cell, so a flush only touches changed bits/glyphs
+        self._drawn_codes = bytearray(_BLANK_SCREEN)
+        # Canvas item id per text cell and per (x,y) pixel — itemconfigure instead of delete+create
+        self._text_item_ids = {}
         self._gfx_pixel_item_ids = {}
         
         # Initialize screen dimensions early for window positioning
@@ -377,13 +2357,6 @@ class TRS80Simulator:
         self.screen_height = 460
         self.taskbar_height = 20
         
-        self.new_program()
-        self.create_debug_window()
-        self.replaced = False
-        
-        # Bind input area changes to sync with stored_program
-        self.input_area.bind('<KeyRelease>', self.sync_input_to_stored, add='+')
-        
         # Initialize LLM support without creating the window
         self.llm_support_active = False
 
@@ -417,23 +2390,6 @@ class TRS80Simulator:
             "_ior":  lambda a, b: int(a) | int(b),
         }
 
-        # Add button to open LLM support window
-        self.llm_button = tk.Button(button_frame, text="Assistant: ON", command=self.toggle_llm_support, font=("Arial", 8), width=10, height=1)
-        self.llm_button.pack(side=tk.LEFT, padx=1)
-        
-        # Add Debug button (duplicate removed - already styled above)
-        
-        # Start cursor blinking after all initialization is complete
-        self.blink_cursor()
-        
-        # Enable immediate mode input
-        self.enable_immediate_mode()
-        
-        # Set main window size and position for 7" screen
-        self.optimize_for_7inch_screen()
-        # After geometry is applied, place sash so code pane ~4 lines (not half the window); keeps buttons visible.
-        self.master.after_idle(self._apply_initial_code_pane_sash)
-
     def optimize_for_7inch_screen(self):
         """Optimize window layout for 7" Raspberry Pi screen (800x480)"""
         # Set main window size and position
@@ -568,7 +2524,7 @@ class TRS80Simulator:
         self._regex_cache['tab'] = re.compile(r'TAB\((\d+)\)')
         # ATN must be listed: else ATN(x) reaches eval() unnamed and _eval_nested falls back to returning the raw expr string,
         # which can be stored in arrays (e.g. F(0,4)=A after 12500) and later breaks SIN(F(I,4)) with float() on that string.
-        self._regex_cache['func_match'] = re.compile(r'(INT|SIN|COS|TAN|ATN|SQR|LOG|EXP|SGN|FIX|CHR\$|STRING\$|VAL|RND|ASC|PEEK|POINT|STR\$|LEN|LEFT\$|RIGHT\$|MID\$|ABS|INSTR|FRE)\(')
+        self._regex_cache['func_match'] = re.compile(r'(INT|SIN|COS|TAN|ATN|SQR|LOG|EXP|SGN|FIX|CHR\$|STRING\$|VAL|RND|ASC|PEEK|POINT|STR\$|LEN|LEFT\$|RIGHT\$|MID\$|ABS|INSTR|FRE|EOF|LOC|LOF|MKI\$|MKS\$|MKD\$|CVI|CVS|CVD)\(')
         self._regex_cache['on_error_goto'] = re.compile(r'ON\s+ERROR\s+GOTO\s+(.*)$', re.I)
         self._regex_cache['mem_bare'] = re.compile(r'\bMEM\b')
         self._regex_cache['err_bare'] = re.compile(r'\bERR\b')
@@ -586,6 +2542,8 @@ class TRS80Simulator:
         self._regex_cache['not_equal_op'] = re.compile(r'<>')
         self._regex_cache['exp_op'] = re.compile(r'\^')
         self._regex_cache['inkey'] = re.compile(r'\bINKEY\$')
+        # PEEK of a keyboard address (14336-15359) — marks a keyboard-polling program
+        self._regex_cache['keyboard_peek'] = re.compile(r'PEEK\s*\(\s*(?:14[3-9]\d\d|15[0-3]\d\d)\s*\)')
         # Combined keyword regex for single-pass replacement in _eval_nested
         self._regex_cache['all_keywords'] = re.compile(
             r'\bRND\b(?!\()'     # bare RND (no parens)
@@ -642,56 +2600,155 @@ class TRS80Simulator:
 
 
     def capitalize_input(self, event):
-        # Get the current cursor position
-        cursor_pos = self.input_area.index(tk.INSERT)
-        
-        # Get all the text
-        text = self.input_area.get("1.0", tk.END)
-        
-        # Capitalize the text
-        capitalized_text = text.upper()
-        
-        # Check if the text has actually changed
-        if text != capitalized_text:
-            # Remember the current view
-            first, last = self.input_area.yview()
-            
-            # Replace the text
-            self.input_area.delete("1.0", tk.END)
-            self.input_area.insert("1.0", capitalized_text)
-            
-            # Restore the cursor position
-            self.input_area.mark_set(tk.INSERT, cursor_pos)
-            
-            # Ensure the cursor is visible
-            self.input_area.see(cursor_pos)
-            
-            # Adjust the view if it has scrolled too far
-            new_first, new_last = self.input_area.yview()
-            if new_first > first:
-                self.input_area.yview_moveto(first)
-    
+        """Uppercase the line being typed on (string literals keep their case)."""
+        if event.keysym not in ['Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R']:
+            row = self._editor_row(tk.INSERT)
+            self._capitalize_rows(row, row)
+
+    def _editor_row(self, index):
+        return int(self.input_area.index(index).split('.')[0])
+
+    def _capitalize_rows(self, first, last):
+        """Uppercase editor rows first..last; the rest of the text is not touched."""
+        area = self.input_area
+        text = area.get(f'{first}.0', f'{last}.end')
+        upper = '\n'.join(map(upper_outside_strings, text.split('\n')))
+        if upper != text:
+            cursor_pos = area.index(tk.INSERT)
+            area.delete(f'{first}.0', f'{last}.end')
+            area.insert(f'{first}.0', upper)
+            area.mark_set(tk.INSERT, cursor_pos)
+
+    def _editor_paste(self, event, at=tk.INSERT):
+        """Before a paste lands, note its first row; after it, fix up just those rows."""
+        first = self._editor_row(at)
+        if self.input_area.tag_ranges(tk.SEL):
+            first = min(first, self._editor_row(tk.SEL_FIRST))
+        self.master.after_idle(self._editor_pasted, first)
+
+    def _editor_pasted(self, first):
+        self._capitalize_rows(first, self._editor_row(tk.INSERT))
+        self._sync_editor_rows()
+
     def sync_input_to_stored(self, event):
         """Sync input area changes to stored_program"""
         # Only sync if we're not in the middle of capitalizing
         if event.keysym not in ['Shift_L', 'Shift_R', 'Control_L', 'Control_R', 'Alt_L', 'Alt_R']:
-            current_program = self.input_area.get(1.0, tk.END).strip().split('\n')
-            self.stored_program = self._sort_program_lines(current_program)
-
-    def _sort_program_lines(self, lines):
-        """Keep BASIC program lines in numeric line-number order."""
-        cleaned = [line.rstrip() for line in lines if line.strip()]
+            row = self._editor_row(tk.INSERT)
+            self._sync_editor_rows(row, row)
+
+    @property
+    def stored_program(self):
+        """The program as sorted "NNN text" lines, detokenised from self.program."""
+        return self.program.listing()
+
+    @stored_program.setter
+    def stored_program(self, lines):
+        self.program.load(lines)
+        self._editor_lines = None
+
+    def _sync_program_from_editor(self):
+        """Re-tokenise the input area into self.program if its text changed."""
+        text = self.input_area.get(1.0, tk.END).strip()
+        if text != self.program.text():
+            self.program.load(text.split('\n'))
+        self._editor_lines = self.input_area.get('1.0', 'end-1c').split('\n')
+
+    def _sync_editor_rows(self, first=None, last=None):
+        """Apply an edit in the editor to the program store, changed rows only.
+
+        _editor_lines mirrors the editor as last synced.  While the row
+        count is unchanged only rows first..last (the cursor's row, for a
+        keystroke) are compared; otherwise the text is diffed against the
+        mirror by common prefix and suffix.  The rows that differ become
+        set_line calls.  A block too big to be worth it, a row without a
+        line number, or a line number that another row also carries, falls
+        back to the full _sync_program_from_editor.  RUN/LIST/SAVE still do that full
+        comparison, so the store is exact whenever it is used.
+        """
+        mirror = self._editor_lines
+        area = self.input_area
+        if mirror is None:
+            self._sync_program_from_editor()
+            return
+        if first is not None and self._editor_row('end-1c') == len(mirror):
+            start, stop = first - 1, last
+            new = [area.get(f'{row}.0', f'{row}.end') for row in range(first, last + 1)]
+        else:
+            lines = area.get('1.0', 'end-1c').split('\n')
+            start, limit = 0, min(len(lines), len(mirror))
+            while start < limit and lines[start] == mirror[start]:
+                start += 1
+            tail = 0
+            while tail < limit - start and lines[-1 - tail] == mirror[-1 - tail]:
+                tail += 1
+            stop = len(mirror) - tail
+            new = lines[start:len(lines) - tail]
+        old = mirror[start:stop]
+        if new == old:
+            return
+        mirror[start:stop] = new
+        if len(old) + len(new) > EDITOR_SYNC_MAX_ROWS:
+            self._sync_program_from_editor()
+            return
+        old_lines = [line for line in map(parse_program_line, old) if line is not None]
+        new_lines = [line for line in map(parse_program_line, new) if line is not None]
+        if (len(old_lines) < sum(1 for line in old if line.strip())
+                or len(new_lines) < sum(1 for line in new if line.strip())):
+            # A row without a line number: the full load keeps it in program.loose
+            self._sync_program_from_editor()
+            return
+        old_numbers = {number for number, _ in old_lines}
+        new_numbers = {number for number, _ in new_lines}
+        gone = old_numbers - new_numbers
+        if (len(new_numbers) < len(new_lines)
+                or any(number in self.program for number in new_numbers - old_numbers)
+                or (gone and any((parse_program_line(line) or (None,))[0] in gone for line in mirror))):
+            # Two rows with one number: let the full load decide which wins
+            self._sync_program_from_editor()
+            return
+        for number in gone:
+            self.program.set_line(number, '')
+        for line in new_lines:
+            self.program.set_line(*line)
 
-        def sort_key(line):
-            parts = line.split(maxsplit=1)
-            if not parts:
-                return (1, float('inf'))
-            try:
-                return (0, float(parts[0]))
-            except ValueError:
-                return (1, float('inf'))
+    def _show_program_in_editor(self):
+        self.input_area.delete(1.0, tk.END)
+        self.input_area.insert(tk.END, self.program.text())
+        self._editor_lines = list(self.program.listing()) or ['']
+
+    def _update_editor_line(self, index, action):
+        """Patch editor row index+1 after program.set_line instead of redrawing it all."""
+        area = self.input_area
+        mirror = self._editor_lines
+        row = index + 1
+        if action == 'replace':
+            text = self.program.listing()[index]
+            area.delete(f'{row}.0', f'{row}.end')
+            area.insert(f'{row}.0', text)
+            mirror[index] = text
+        elif action == 'insert':
+            text = self.program.listing()[index]
+            if mirror == ['']:
+                area.insert('1.0', text)
+                mirror[0] = text
+            elif row > len(mirror):
+                area.insert('end-1c', '\n' + text)
+                mirror.append(text)
+            else:
+                area.insert(f'{row}.0', text + '\n')
+                mirror.insert(index, text)
+        elif action == 'delete':
+            if len(mirror) == 1:
+                area.delete('1.0', 'end-1c')
+                mirror[0] = ''
+            elif row == len(mirror):
+                area.delete(f'{row - 1}.end', f'{row}.end')
+                mirror.pop()
+            else:
+                area.delete(f'{row}.0', f'{row + 1}.0')
+                del mirror[index]
 
-        return sorted(cleaned, key=sort_key)
     
     # ============================================================
     #  SECTION: Debug & Variables Windows
@@ -723,10 +2780,29 @@ class TRS80Simulator:
             self.find_button = tk.Button(find_frame, text="Find", command=self.find_in_debug, font=("Arial", 7), width=5, height=1)
             self.find_button.pack(side=tk.LEFT, padx=2, pady=2)
 
+            # Breakpoint entry: "100", "100 COUNT 10000", "100 IF X>5", "OFF [100]"
+            self.break_entry = tk.Entry(find_frame, width=20, font=("Arial", 7))
+            self.break_entry.pack(side=tk.LEFT, padx=2, pady=2)
+            self.break_button = tk.Button(find_frame, text="Break", command=self.set_breakpoint_from_window, font=("Arial", 7), width=5, height=1)
+            self.break_button.pack(side=tk.LEFT, padx=2, pady=2)
+            self.back_button = tk.Button(find_frame, text="Back", command=self.step_back_from_window, font=("Arial", 7), width=5, height=1)
+            self.back_button.pack(side=tk.LEFT, padx=2, pady=2)
+
             # Add Clear button
-            self.clear_button = tk.Button(button_frame, text="Clear", command=lambda: self.debug_text.delete(1.0, tk.END), font=("Arial", 7), width=5, height=1)
+            self.clear_button = tk.Button(button_frame, text="Clear", command=self.clear_debug_log, font=("Arial", 7), width=5, height=1)
             self.clear_button.pack(side=tk.LEFT, padx=1, pady=2)
 
+            # Add Export button (the whole log ring, not just what the window shows)
+            self.export_button = tk.Button(button_frame, text="Export", command=self.export_debug_log, font=("Arial", 7), width=5, height=1)
+            self.export_button.pack(side=tk.LEFT, padx=1, pady=2)
+
+            # Level filter: messages below it are not formatted or kept
+            self.debug_level_var = tk.StringVar(value='info')
+            level_menu = tk.OptionMenu(button_frame, self.debug_level_var, *DEBUG_LEVELS,
+                                       command=self.set_debug_level)
+            level_menu.config(font=("Arial", 7))
+            level_menu.pack(side=tk.LEFT, padx=1, pady=2)
+
             # Add List button
             self.list_button = tk.Button(button_frame, text="List", command=self.list_preprocessed_program, font=("Arial", 7), width=5, height=1)
             self.list_button.pack(side=tk.LEFT, padx=1, pady=2)
@@ -750,6 +2826,8 @@ class TRS80Simulator:
             # Create debug text area
             self.debug_text = scrolledtext.ScrolledText(self.debug_window, wrap=tk.WORD)
             self.debug_text.pack(expand=True, fill='both')
+            self.debug_text.tag_config('error', foreground='red')
+            self.debug_text.tag_config('warning', foreground='orange')
 
             # Add right-click menu for debug window
             self.debug_right_click_menu = tk.Menu(self.debug_window, tearoff=0)
@@ -757,6 +2835,9 @@ class TRS80Simulator:
             self.debug_right_click_menu.add_command(label="Select All", command=self.select_all_debug)
             self.debug_text.bind("<Button-3>", self.show_debug_right_click_menu)
 
+            # Messages logged before the window existed (RUN PROFILE, WATCH reports)
+            self._insert_debug_entries(self.debug_log.take_all())
+
             self.debug_window.withdraw()  # Hide the window initially
         self.debug_window.protocol("WM_DELETE_WINDOW", self.on_debug_window_close)
 
@@ -797,6 +2878,16 @@ class TRS80Simulator:
         self.debug_text.mark_set(tk.INSERT, "1.0")
         self.debug_text.see(tk.INSERT)
 
+    def on_main_window_close(self):
+        """Closing the window while a program runs saves it to STATE_FILE first
+        (LOAD STATE picks the game up again, even mid-INPUT)."""
+        if self.program_running:
+            try:
+                self.save_state(STATE_FILE)
+            except OSError:
+                pass
+        self.master.destroy()
+
     def toggle_variables_window(self):
         if not self.variables_window_open:
             self.show_variables()
@@ -812,87 +2903,238 @@ class TRS80Simulator:
             # Position variables window below debug window
             self.position_child_window(self.variables_window, 280, 180, 200, 180)
 
-            self.state_text = scrolledtext.ScrolledText(self.variables_window, wrap=tk.WORD)
-            self.state_text.pack(expand=True, fill='both')
-            
+            tree = self.state_tree = ttk.Treeview(self.variables_window, columns=('value',))
+            tree.heading('#0', text='Name', anchor=tk.W)
+            tree.heading('value', text='Value', anchor=tk.W)
+            tree.column('#0', width=110, stretch=False)
+            scrollbar = ttk.Scrollbar(self.variables_window, orient=tk.VERTICAL, command=tree.yview)
+            tree.configure(yscrollcommand=scrollbar.set)
+            scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+            tree.pack(expand=True, fill='both')
+            tree.bind('<<TreeviewOpen>>', self._state_view_opened)
+
             # Add right-click menu for variables window
             self.variables_right_click_menu = tk.Menu(self.variables_window, tearoff=0)
             self.variables_right_click_menu.add_command(label="Copy", command=self.copy_variables)
             self.variables_right_click_menu.add_command(label="Select All", command=self.select_all_variables)
-            self.state_text.bind("<Button-3>", self.show_variables_right_click_menu)
-            
+            tree.bind("<Button-3>", self.show_variables_right_click_menu)
+
+            self._build_state_view()
             self.variables_window_open = True
             self.variables_window.protocol("WM_DELETE_WINDOW", self.close_variables_window)
+            self._state_view_timer = self.variables_window.after(STATE_VIEW_REFRESH_MS, self._state_view_tick)
 
         # Update the content of the variables window
         self.update_variables_content()
 
+    def _build_state_view(self):
+        """Empty Program State tree: one node per section, filled by update_variables_content."""
+        tree = self.state_tree
+        tree.delete(*tree.get_children())
+        for iid, title, is_open in (('status', 'STATUS', True), ('line', 'CURRENT LINE', True),
+                                    ('scalars', 'SCALAR VARIABLES', True), ('arrays', 'ARRAYS', True),
+                                    ('for', 'ACTIVE FOR LOOPS', True), ('gosub', 'GOSUB STACK', True),
+                                    ('metrics', 'METRICS', False)):
+            tree.insert('', tk.END, iid=iid, text=title, open=is_open)
+        self._state_shown = {}          # iid -> value text on screen
+        self._state_scalars_of = None   # the scalar_variables dict the rows show
+        self._state_scalar_names = []   # sorted keys with a row
+        self._state_arrays_of = None
+        self._state_array_lists = {}    # array name -> the list its node shows
+        self._state_pages = {}          # array name -> {page iid: (first, stop)} filled in
+        self._dirty_scalars = set()
+        self._dirty_arrays = set()
+
+    def _state_view_tick(self):
+        """Timer refresh, independent of how many lines the program runs."""
+        if not self.variables_window_open:
+            self._dirty_scalars = self._dirty_arrays = None
+            return
+        self.update_variables_content()
+        self._state_view_timer = self.variables_window.after(STATE_VIEW_REFRESH_MS, self._state_view_tick)
+
     def update_variables_content(self):
-        self.state_text.config(state=tk.NORMAL)
-        self.state_text.delete(1.0, tk.END)
-
-        # Program execution state
-        self.state_text.insert(tk.END, "STATUS\n")
-        self.state_text.insert(tk.END, f"Program Running: {self.program_running}\n")
-        self.state_text.insert(tk.END, f"Program Paused: {self.program_paused}\n")
-        self.state_text.insert(tk.END, f"Stepping Mode: {self.stepping}\n")
-        self.state_text.insert(tk.END, f"Last Key Pressed: {self.last_key_pressed}\n")
-        self.state_text.insert(tk.END, f"Data Pointer: {self.data_pointer}\n\n")
-
-        # Current line information - use the live parsed line tables when available.
-        self.state_text.insert(tk.END, "CURRENT LINE\n")
+        """Bring the Program State tree up to date.
+
+        The small sections are rewritten in place (and only while open).
+        Scalars and arrays are touched only where _set_scalar and the array
+        stores marked them dirty, and array elements only on pages the
+        user has expanded, so a refresh costs the same however big the
+        arrays are.  RUN/NEW/CLEAR/BACK replace the variable tables, which
+        rebuilds those two sections once.
+        """
+        tree = self.state_tree
+        self._state_rows('status', [
+            ("Program Running", self.program_running),
+            ("Program Paused", self.program_paused),
+            ("Stepping Mode", self.stepping),
+            ("Key Buffer", repr(''.join(self._key_buffer))),
+            ("Data Pointer", self.data_pointer),
+        ])
         if 0 <= self.current_line_index < len(self._line_numbers):
-            line_number = self._line_numbers[self.current_line_index]
-            command = self._line_commands[self.current_line_index]
-            self.state_text.insert(tk.END, f"Line Number: {line_number}\n")
-            self.state_text.insert(tk.END, f"Command: {command}\n\n")
+            self._state_rows('line', [
+                ("Line Number", f"{self._line_numbers[self.current_line_index]:g}"),
+                ("Command", self._line_commands[self.current_line_index]),
+            ])
         else:
-            self.state_text.insert(tk.END, "Program execution completed or not started\n\n")
-
-        # Scalar variables
-        self.state_text.insert(tk.END, "SCALAR VARIABLES\n")
-        if self.scalar_variables:
-            for var, value in sorted(self.scalar_variables.items()):
-                self.state_text.insert(tk.END, f"{var} = {self._format_state_value(value)}\n")
-        else:
-            self.state_text.insert(tk.END, "None\n")
-
-        # Arrays - summarize instead of dumping entire arrays.
-        self.state_text.insert(tk.END, "\nARRAYS\n")
-        if self.array_variables:
-            for var, value in sorted(self.array_variables.items()):
-                self.state_text.insert(tk.END, f"{self._summarize_state_array(var, value)}\n")
-        else:
-            self.state_text.insert(tk.END, "None\n")
-
-        # Active FOR loops
-        self.state_text.insert(tk.END, "\nACTIVE FOR LOOPS\n")
-        if self.for_loops:
-            for var, loop_info in self.for_loops.items():
-                next_line = loop_info.get('next_line_number')
-                self.state_text.insert(
-                    tk.END,
-                    f"{var}: current={loop_info.get('current')} start={loop_info.get('start')} "
-                    f"end={loop_info.get('end')} step={loop_info.get('step')} next={next_line}\n"
-                )
-        else:
-            self.state_text.insert(tk.END, "None\n")
-
-        # GOSUB stack as target line numbers when possible.
-        self.state_text.insert(tk.END, "\nGOSUB STACK\n")
-        if self.gosub_stack:
+            self._state_rows('line', [("Not running", "")])
+        self._update_state_scalars()
+        self._update_state_arrays()
+        if tree.item('for', 'open'):
+            self._state_rows('for', [
+                (var, f"current={loop.get('current')} start={loop.get('start')} end={loop.get('end')} "
+                      f"step={loop.get('step')} next={loop.get('next_line_number')}")
+                for var, loop in self.for_loops.items()])
+        if tree.item('gosub', 'open'):
             stack_lines = []
             for entry in self.gosub_stack:
                 return_index = entry[0] if isinstance(entry, tuple) else entry
                 if 0 <= return_index < len(self._line_numbers):
-                    stack_lines.append(str(self._line_numbers[return_index]))
+                    stack_lines.append(f"{self._line_numbers[return_index]:g}")
                 else:
                     stack_lines.append(str(return_index))
-            self.state_text.insert(tk.END, " -> ".join(stack_lines) + "\n")
-        else:
-            self.state_text.insert(tk.END, "Empty\n")
+            self._state_rows('gosub', [("Returns to", " -> ".join(stack_lines))] if stack_lines else [])
+        if tree.item('metrics', 'open'):
+            self._state_rows('metrics', [(line, "") for line in self.metrics.report()])
+
+    def _state_row(self, parent, iid, text, value, index=tk.END):
+        """Insert or update one row, skipping Tk when the value shown is unchanged."""
+        shown = self._state_shown
+        if iid not in shown:
+            self.state_tree.insert(parent, index, iid=iid, text=text, values=(value,))
+        elif shown[iid] != value:
+            self.state_tree.set(iid, 'value', value)
+        shown[iid] = value
+
+    def _state_rows(self, section, rows):
+        """Make a small section's children exactly rows ((text, value) pairs)."""
+        tree = self.state_tree
+        shown = self._state_shown
+        for i, (text, value) in enumerate(rows):
+            iid = f"{section}:{i}"
+            if iid in shown and tree.item(iid, 'text') != text:
+                tree.item(iid, text=text)
+            self._state_row(section, iid, text, str(value))
+        i = len(rows)
+        while f"{section}:{i}" in shown:
+            tree.delete(f"{section}:{i}")
+            del shown[f"{section}:{i}"]
+            i += 1
 
-        self.state_text.config(state=tk.DISABLED)
+    def _update_state_scalars(self):
+        tree = self.state_tree
+        shown = self._state_shown
+        scalars = self.scalar_variables
+        names = self._state_scalar_names
+        if scalars is not self._state_scalars_of:
+            for name in names:
+                tree.delete(f"s:{name}")
+                del shown[f"s:{name}"]
+            names[:] = sorted(scalars)
+            for name in names:
+                self._state_row('scalars', f"s:{name}", name, self._format_state_value(scalars[name]))
+            self._state_scalars_of = scalars
+            self._dirty_scalars.clear()
+            return
+        for name in self._dirty_scalars:
+            iid = f"s:{name}"
+            if name in scalars:
+                position = bisect_left(names, name)
+                if iid not in shown:
+                    names.insert(position, name)
+                self._state_row('scalars', iid, name, self._format_state_value(scalars[name]), position)
+            elif iid in shown:  # a DEF FN parameter that only existed during the call
+                tree.delete(iid)
+                del shown[iid]
+                names.remove(name)
+        self._dirty_scalars.clear()
+
+    def _update_state_arrays(self):
+        arrays = self.array_variables
+        dirty = self._dirty_arrays
+        if arrays is not self._state_arrays_of or len(arrays) != len(self._state_array_lists):
+            for name in list(self._state_array_lists):
+                if name not in arrays:
+                    self._drop_state_array(name)
+            dirty.update(arrays)
+            self._state_arrays_of = arrays
+        for name in dirty:
+            values = arrays.get(name)
+            if values is None:
+                continue
+            if self._state_array_lists.get(name) is not values:
+                self._add_state_array(name, values)
+                continue
+            tree = self.state_tree
+            for page, (first, stop) in self._state_pages[name].items():
+                if tree.item(page, 'open'):
+                    self._fill_state_page(name, page, first, stop)
+        dirty.clear()
+
+    def _drop_state_array(self, name):
+        """Delete an array's node; Tk takes its pages and element rows with it."""
+        shown = self._state_shown
+        self.state_tree.delete(f"a:{name}")
+        prefix = f"a:{name}"
+        elements = f"e:{name}:"
+        for iid in [iid for iid in shown
+                    if iid == prefix or iid.startswith(prefix + ':') or iid.startswith(elements)]:
+            del shown[iid]
+        del self._state_array_lists[name]
+        del self._state_pages[name]
+
+    def _add_state_array(self, name, values):
+        """An array's node: size only (no element scan); elements load when expanded."""
+        if name in self._state_array_lists:
+            self._drop_state_array(name)
+        names = sorted(self._state_array_lists)
+        dims = self.array_dimensions.get(name)
+        label = f"{name}({dims[0]},{dims[1]})" if dims else f"{name}({len(values) - 1})"
+        iid = f"a:{name}"
+        self.state_tree.insert('arrays', bisect_left(names, name), iid=iid, text=label,
+                               values=(f"{len(values)} elements",))
+        self.state_tree.insert(iid, tk.END, iid=f"{iid}:more", text="...")
+        self._state_shown[iid] = None
+        self._state_array_lists[name] = values
+        self._state_pages[name] = {}
+
+    def _state_view_opened(self, event):
+        """<<TreeviewOpen>>: load an array node's pages, or a page's elements."""
+        tree = self.state_tree
+        iid = tree.focus()
+        if not iid.startswith('a:') or not tree.exists(f"{iid}:more"):
+            return
+        tree.delete(f"{iid}:more")
+        parts = iid.split(':')
+        name = parts[1]
+        values = self.array_variables.get(name)
+        if values is None:
+            return
+        if len(parts) == 3:
+            first = int(parts[2])
+            self._state_pages[name][iid] = (first, min(first + STATE_ARRAY_PAGE, len(values)))
+            self._fill_state_page(name, iid, *self._state_pages[name][iid])
+        elif len(values) <= STATE_ARRAY_PAGE:
+            self._state_pages[name][iid] = (0, len(values))
+            self._fill_state_page(name, iid, 0, len(values))
+        else:
+            for first in range(0, len(values), STATE_ARRAY_PAGE):
+                page = f"{iid}:{first}"
+                stop = min(first + STATE_ARRAY_PAGE, len(values))
+                tree.insert(iid, tk.END, iid=page, text=f"[{first}-{stop - 1}]")
+                tree.insert(page, tk.END, iid=f"{page}:more", text="...")
+
+    def _fill_state_page(self, name, page, first, stop):
+        """Show (or refresh) elements first..stop-1 of name under page."""
+        values = self.array_variables[name]
+        dims = self.array_dimensions.get(name)
+        fmt = self._format_state_value
+        for k in range(first, stop):
+            if dims:
+                label = f"{name}({k // (dims[1] + 1)},{k % (dims[1] + 1)})"
+            else:
+                label = f"{name}({k})"
+            self._state_row(page, f"e:{name}:{k}", label, fmt(values[k]))
 
     def _format_state_value(self, value):
         """Compact variable formatting for the Variables window."""
@@ -902,47 +3144,36 @@ class TRS80Simulator:
             return str(int(value))
         return str(value)
 
-    def _summarize_state_array(self, name, value):
-        """Show only the useful parts of arrays instead of dumping full contents."""
-        if not isinstance(value, list):
-            return f"{name} = {self._format_state_value(value)}"
-
-        if name.endswith('$'):
-            active = [(i, v) for i, v in enumerate(value) if v != ""]
-        else:
-            active = [(i, v) for i, v in enumerate(value) if v != 0]
-
-        if not active:
-            return f"{name}({len(value) - 1}) = [all default]"
-
-        preview = ", ".join(
-            f"[{i}]={self._format_state_value(v)}" for i, v in active[:8]
-        )
-        if len(active) > 8:
-            preview += f", ... ({len(active)} used)"
-
-        return f"{name}({len(value) - 1}) = {preview}"
-
     def show_variables_right_click_menu(self, event):
         self.variables_right_click_menu.tk_popup(event.x_root, event.y_root)
 
     def copy_variables(self):
-        try:
-            selected_text = self.state_text.selection_get()
+        tree = self.state_tree
+        lines = []
+        for iid in tree.selection():
+            value = tree.set(iid, 'value')
+            lines.append(f"{tree.item(iid, 'text')} = {value}" if value else tree.item(iid, 'text'))
+        if lines:
             self.variables_window.clipboard_clear()
-            self.variables_window.clipboard_append(selected_text)
-        except tk.TclError:
-            pass  # No selection
+            self.variables_window.clipboard_append('\n'.join(lines))
 
     def select_all_variables(self):
-        self.state_text.tag_add(tk.SEL, "1.0", tk.END)
-        self.state_text.mark_set(tk.INSERT, "1.0")
-        self.state_text.see(tk.INSERT)
+        """Select every row loaded so far (array pages not yet opened are skipped)."""
+        tree = self.state_tree
+        items = []
+        stack = list(tree.get_children())
+        while stack:
+            iid = stack.pop()
+            items.append(iid)
+            stack.extend(tree.get_children(iid))
+        tree.selection_set(items)
 
     def close_variables_window(self):
         if self.variables_window_open:
+            self.variables_window.after_cancel(self._state_view_timer)
             self.variables_window.destroy()
             self.variables_window_open = False
+            self._dirty_scalars = self._dirty_arrays = None
             self.variables_button.config(text="Variables: ON")
 
     def toggle_debug(self):
@@ -965,18 +3196,70 @@ class TRS80Simulator:
         self.debug_mode = False
         self.debug_button.config(text="Debug: ON")
 
+    def debug_enabled(self, level='info'):
+        """True if a debug_print at this level would be kept; guard costly messages with it."""
+        return self.debug_mode and self.debug_log.wants(level)
+
     def debug_print(self, message, level='info'):
-        if self.debug_mode:
+        """Add a message to the debug log; the window catches up on a timer.
+
+        message may be a callable returning the text, so it is only built
+        when debugging at this level is on.
+        """
+        if self.debug_mode and self.debug_log.wants(level):
+            if callable(message):
+                message = message()
             # Show both BASIC line and step so traces match the program.
             timestamp = f"[Line {self._get_current_line_number()} | Step {self.current_line_index + 1}]"
-            
             if level == 'error':
-                self.debug_text.insert(tk.END, f"{timestamp} ERROR: {message}\n", 'error')
+                self.debug_log.append(level, f"{timestamp} ERROR: {message}")
             elif level == 'warning':
-                self.debug_text.insert(tk.END, f"{timestamp} WARNING: {message}\n", 'warning')
+                self.debug_log.append(level, f"{timestamp} WARNING: {message}")
             else:
-                self.debug_text.insert(tk.END, f"{timestamp} {message}\n")
-            self.debug_text.see(tk.END)
+                self.debug_log.append(level, f"{timestamp} {message}")
+            if not self._debug_flush_pending:
+                self._debug_flush_pending = True
+                self.master.after(DEBUG_LOG_FLUSH_MS, self.flush_debug_log)
+
+    def flush_debug_log(self):
+        """Insert the log entries added since the last flush, one insert per run of a level."""
+        self._debug_flush_pending = False
+        if self.debug_text is None:
+            return  # no window yet: the entries wait in the ring for create_debug_window
+        self._insert_debug_entries(self.debug_log.take_new())
+
+    def _insert_debug_entries(self, entries):
+        text_widget = self.debug_text
+        if not entries:
+            return
+        run_level, run = entries[0][0], []
+        for level, text in entries:
+            if level != run_level:
+                text_widget.insert(tk.END, '\n'.join(run) + '\n', run_level)
+                run_level, run = level, []
+            run.append(text)
+        text_widget.insert(tk.END, '\n'.join(run) + '\n', run_level)
+        # The window keeps no more lines than the ring does
+        lines = int(text_widget.index('end-1c').split('.')[0]) - 1
+        excess = lines - self.debug_log.entries.maxlen
+        if excess > 0:
+            text_widget.delete('1.0', f'{excess + 1}.0')
+        text_widget.see(tk.END)
+
+    def clear_debug_log(self):
+        self.debug_log.clear()
+        self.debug_text.delete(1.0, tk.END)
+
+    def set_debug_level(self, level):
+        self.debug_log.min_level = DEBUG_LEVELS[level]
+
+    def export_debug_log(self):
+        filename = self._ask_save_filename(".log")
+        if filename:
+            try:
+                self.debug_log.export(filename)
+            except OSError as e:
+                messagebox.showerror("Export", f"Could not write {filename}: {e}")
 
     # ============================================================
     #  SECTION: Input Handling
@@ -1018,7 +3301,31 @@ class TRS80Simulator:
             self._paste_into_green_screen()
             return "break"
 
+    def _update_key_matrix(self, event, pressed):
+        """Track held keys by keycode (so Shift order cannot leave a bit stuck)."""
+        held = self._held_keys
+        if pressed:
+            pos = _KEY_MATRIX.get(event.keysym)
+            if pos is None:
+                return
+            held[event.keycode] = pos
+        elif held.pop(event.keycode, None) is None:
+            return
+        matrix = self._key_matrix
+        matrix[:] = bytes(8)
+        for row, mask in held.values():
+            matrix[row] |= mask
+
+    def on_key_release(self, event):
+        self._update_key_matrix(event, False)
+
+    def _release_all_keys(self, event=None):
+        """Focus left the window — its KeyRelease events will never arrive."""
+        self._held_keys.clear()
+        self._key_matrix[:] = bytes(8)
+
     def on_key_press(self, event):
+        self._update_key_matrix(event, True)
         # Ctrl+C = BREAK whenever a program is running (including INPUT)
         if self.program_running and (event.state & 0x4) and event.keysym.lower() == 'c':
             self.break_program()
@@ -1054,12 +3361,38 @@ class TRS80Simulator:
         if self.program_running and event.widget == self.screen:
             if self.waiting_for_input:
                 pass  # INPUT mode — handle_input_key handles this
-            # Only update if no key is currently stored (simulate keyboard buffer)
-            elif not self.last_key_pressed and event.char and not (event.state & 0x4):
-                self.last_key_pressed = event.char.upper()
+            elif not (event.state & 0x4):
+                key = _INKEY_SPECIAL.get(event.keysym) or event.char.upper()
+                if key and len(self._key_buffer) < self.key_buffer_depth:
+                    self._key_buffer.append(key)
         elif self.immediate_mode and not self.program_running and event.widget == self.screen:
             self.handle_immediate_mode_key(event)
     
+    def queue_keys(self, text):
+        """Pre-fill the type-ahead buffer from a script (headless runs, pastes).
+
+        Not limited by key_buffer_depth — the whole script is kept.  Newlines
+        become ENTER, which completes a pending INPUT.
+        """
+        self._key_buffer.extend(text.replace('\r\n', '\r').replace('\n', '\r'))
+        if self.waiting_for_input:
+            self.master.after_idle(self._feed_type_ahead)
+
+    def _feed_type_ahead(self):
+        """Replay buffered keys into the pending INPUT; ENTER submits it."""
+        buf = self._key_buffer
+        fed = False
+        while buf and self.waiting_for_input:
+            key = buf.popleft()
+            if key == '\r':
+                self._submit_input()
+                return
+            if key >= ' ':
+                self._insert_input_char(key.upper())
+                fed = True
+        if fed:
+            self.update_cursor_display()
+
     def on_input_area_click(self, event):
         self.input_area.focus_set()
 
@@ -1152,27 +3485,24 @@ class TRS80Simulator:
                 if ch >= ' ' and ch.isprintable():
                     uc = ch.upper()
                     self.command_buffer += uc
-                    x = self.cursor_col * self._char_w
-                    y = self.cursor_row * self._char_h
-                    self.screen.create_text(x, y, text=uc, font=self._screen_font, fill="lime", anchor="nw",
-                        tags=(f"c{self.cursor_row}_{self.cursor_col}", self.CANVAS_TEXT_LAYER_TAG))
-                    self.screen_content[self.cursor_row][self.cursor_col] = uc
+                    self._put_screen_char(self.cursor_row, self.cursor_col, uc)
                     self.cursor_col += 1
                     if self.cursor_col >= 64:
                         self.cursor_row += 1
                         self.cursor_col = 0
                         if self.cursor_row >= 16:
                             self._scroll_screen_up()
+            self._flush_graphics()
             self.update_cursor_display()
 
     def copy_screen(self):
         """Copy both text and graphics as a visual representation"""
         # Check if there are any graphics pixels set
-        has_graphics = any(any(row) for row in self.pixel_matrix)
+        has_graphics = any(code & 0x80 and code & 0x3F for code in self.video_ram)
         
         if not has_graphics:
             # No graphics - just copy text content as before
-            screen_text = '\n'.join(''.join(row) for row in self.screen_content)
+            screen_text = '\n'.join(self._screen_row_text(row) for row in range(16))
             self.master.clipboard_clear()
             self.master.clipboard_append(screen_text.rstrip())
             self.debug_print("Screen text content copied to clipboard")
@@ -1192,18 +3522,11 @@ class TRS80Simulator:
             for text_row in range(16):
                 line = []
                 for text_col in range(64):
-                    char = self.screen_content[text_row][text_col]
-                    
-                    # Check corresponding pixel area (each char covers 2x3 pixels)
-                    pixel_x_start = text_col * 2
-                    pixel_y_start = text_row * 3
+                    code = self.video_ram[text_row * 64 + text_col]
+                    char = _CELL_CHARS[code]
                     
-                    # Count pixels in this character area
-                    pixel_count = 0
-                    for py in range(pixel_y_start, min(pixel_y_start + 3, 48)):
-                        for px in range(pixel_x_start, min(pixel_x_start + 2, 128)):
-                            if self.pixel_matrix[py][px]:
-                                pixel_count += 1
+                    # Count pixels in this character area (each cell is a 2x3 block)
+                    pixel_count = bin(code & 0x3F).count('1') if code & 0x80 else 0
                     
                     # Determine what to display
                     if char != ' ':
@@ -1226,8 +3549,8 @@ class TRS80Simulator:
             combined_output.extend(visual_screen)
             combined_output.append("")
             combined_output.append("=== Raw Text Content (64x16) ===")
-            for row in self.screen_content:
-                combined_output.append(''.join(row).rstrip())
+            for row in range(16):
+                combined_output.append(self._screen_row_text(row).rstrip())
             
             # Copy to clipboard
             final_output = '\n'.join(combined_output)
@@ -1238,25 +3561,39 @@ class TRS80Simulator:
     # ============================================================
     #  SECTION: Screen Rendering
     #  The TRS-80 display is a Tkinter Canvas (green on black).
-    #  Text characters are Canvas text items tagged "c{row}_{col}";
+    #  Everything on screen lives in self.video_ram (1024 bytes, one
+    #  per cell).  Writers store a byte and add the cell index to
+    #  _dirty_cells; _flush_graphics renders just those cells:
+    #  text characters are Canvas text items tagged "c{row}_{col}",
     #  graphics pixels are rectangles tagged "p{x}_{y}".
-    #  print_to_screen redraws the 2x3 graphics dots per cell from
-    #  pixel_matrix, then draws text (full-cell black used to erase SET).
-    #  _scroll_screen_up shifts screen_content and pixel_matrix up
-    #  by one text row (3 pixel rows), then redraws.
-    #  redraw_screen does a full repaint from the data arrays.
+    #  _scroll_screen_up moves video RAM up one row (64 bytes) and
+    #  lets the dirty diff repaint only cells that actually changed.
+    #  redraw_screen does a full repaint from video RAM (rescale).
     # ============================================================
     def clear_input_area(self):
         self.input_area.delete(1.0, tk.END)
 
+    def _put_screen_char(self, row, col, char):
+        """Store one character in video RAM and mark its cell dirty."""
+        code = ord(char)
+        cell = row * 64 + col
+        self.video_ram[cell] = code if code < 256 else 63  # '?' — not a Model I glyph
+        self._dirty_cells.add(cell)
+
+    def _screen_row_text(self, row):
+        """Text of one screen row (graphics cells read as spaces)."""
+        start = row * 64
+        return ''.join([_CELL_CHARS[code] for code in self.video_ram[start:start + 64]])
+
     def _scroll_screen_up(self):
         """Scroll screen content and graphics up by one text line"""
-        self.screen_content = self.screen_content[1:] + [[' ' for _ in range(64)]]
+        vram = self.video_ram
+        vram[:VIDEO_RAM_SIZE - 64] = vram[64:]
+        vram[VIDEO_RAM_SIZE - 64:] = _BLANK_SCREEN[:64]
         self.cursor_row = 15
-        self.pixel_matrix = self.pixel_matrix[3:] + [[0 for _ in range(128)] for _ in range(3)]
-        # O(active) set-shift instead of O(6144) full scan
-        self._active_pixels = {(x, y - 3) for x, y in self._active_pixels if y >= 3}
-        self.redraw_screen()
+        # Every cell may have moved; the flush diff skips the ones that did not change
+        self._dirty_cells |= _ALL_CELLS
+        self._flush_graphics()
 
     def clear_variables_button_cmd(self):
         # CLEAR matches TRS-80 BASIC: clear variables, keep the program.
@@ -1275,7 +3612,7 @@ class TRS80Simulator:
         self.gosub_stack = []
         self.data_pointer = 0
         self.data_values = []
-        self.last_key_pressed = None
+        self._key_buffer.clear()
         self.print_to_screen("VARIABLES CLEARED")
 
     def clear_memory_button_cmd(self):
@@ -1291,19 +3628,15 @@ class TRS80Simulator:
         self.set_screen_focus()
 
     def clear_screen(self):
-        # Flush any pending graphics before clearing
-        self._flush_graphics()
-
         self.screen.delete("all")
         self._gfx_pixel_item_ids.clear()
-        self.screen_content = [[' ' for _ in range(64)] for _ in range(16)]
-        self.pixel_matrix = [[0 for _ in range(128)] for _ in range(48)]
-        self._active_pixels = set()
+        self._text_item_ids.clear()
+        self.video_ram[:] = _BLANK_SCREEN
+        self._drawn_codes[:] = _BLANK_SCREEN
+        self._dirty_cells.clear()
         self.cursor_row = 0
         self.cursor_col = 0
         self.update_cursor_display()
-
-        self._pending_graphics = []
     
 
     def new_program(self):
@@ -1323,7 +3656,6 @@ class TRS80Simulator:
         self.gosub_stack = []
         self.program_running = False
         self.program_paused = False
-        self.last_key_pressed = None
         self.data_pointer = 0
         self.data_values = []
         # NEW: reset Level II error + sequential file state
@@ -1332,7 +3664,7 @@ class TRS80Simulator:
         self.erl_value = 0
         self._error_line_index = 0
         self._pending_goto = 0
-        self._seq_chan = None
+        self._close_all_channels()
         # Optimization 2: Pre-parsed line number/command arrays
         self._line_numbers = []
         self._line_commands = []
@@ -1343,12 +3675,11 @@ class TRS80Simulator:
         self._array_patterns = {}
         # Cached compiled variable regex patterns
         self._var_regex_cache = {}
-        self.screen_content = [[' ' for _ in range(64)] for _ in range(16)]
-        self.pixel_matrix = [[0 for _ in range(128)] for _ in range(48)]
-        self._active_pixels = set()
 
         self.cursor_row = 0
         self.cursor_col = 0
+        self._commit_tape_writer()
+        self._close_tape_reader()
         self.tape_file = None
         self.tape_pointer = 0
         
@@ -1384,66 +3715,50 @@ class TRS80Simulator:
 
     def print_to_screen(self, *args, end='\n'):
         text = ' '.join(str(arg) for arg in args) + end
-        chars_to_draw = []
-        char_w = self._char_w
-        char_h = self._char_h
+        vram = self.video_ram
+        dirty = self._dirty_cells
 
         for char in text:
-            if char == '\n' or self.cursor_col >= 64:
+            code = ord(char)
+            if code < 32:
+                if char != '\n' and char != '\r':
+                    continue  # BEL, TAB etc. have no glyph
                 self.cursor_row += 1
                 self.cursor_col = 0
                 if self.cursor_row >= 16:
                     self._scroll_screen_up()
-                    chars_to_draw = []
-                if char == '\n':
-                    continue
-            self.screen_content[self.cursor_row][self.cursor_col] = char
-            row, col = self.cursor_row, self.cursor_col
-            chars_to_draw.append((col * char_w, row * char_h, char, row, col))
-            self.cursor_col += 1
-
-        screen = self.screen
-        font = self._screen_font
-        for x, y, char, row, col in chars_to_draw:
-            tag = f"c{row}_{col}"
-            items = screen.find_withtag(tag)
-            if items:
-                screen.itemconfigure(items[0], text=char)
-            else:
-                screen.create_rectangle(x, y, x + char_w, y + char_h,
-                    fill="black", outline="black")
-                if char != ' ':
-                    screen.create_text(x, y, text=char,
-                        font=font, fill="lime", anchor="nw",
-                        tags=(tag, self.CANVAS_TEXT_LAYER_TAG))
+                continue
+            count = 1
+            if code >= 192:
+                if code < 256:
+                    # Level II space compression: CHR$(192+n) prints n blanks
+                    count = code - 192
+                    code = 32
+                else:
+                    code = 63  # '?' — not a Model I glyph
+            for _ in range(count):
+                if self.cursor_col >= 64:
+                    self.cursor_row += 1
+                    self.cursor_col = 0
+                    if self.cursor_row >= 16:
+                        self._scroll_screen_up()
+                cell = self.cursor_row * 64 + self.cursor_col
+                vram[cell] = code
+                dirty.add(cell)
+                self.cursor_col += 1
 
+        self._flush_graphics()
         self.update_cursor_display()
 
 
     def redraw_screen(self):
+        """Full repaint from video RAM (after a 1x/2x rescale)."""
         self.screen.delete("all")
         self._gfx_pixel_item_ids.clear()
-        ps = self.pixel_size
-        # Graphics first, text on top
-        for x, y in self._active_pixels:
-            kid = self.screen.create_rectangle(
-                x * ps, y * ps,
-                (x + 1) * ps, (y + 1) * ps,
-                fill="lime", outline="lime",
-                tags=f"p{x}_{y}"
-            )
-            self._gfx_pixel_item_ids[(x, y)] = kid
-        char_w = self._char_w
-        char_h = self._char_h
-        font = self._screen_font
-        for row in range(16):
-            for col in range(64):
-                char = self.screen_content[row][col]
-                if char != ' ':
-                    tag = f"c{row}_{col}"
-                    self.screen.create_text(col * char_w, row * char_h, text=char,
-                        font=font, fill="lime", anchor="nw",
-                        tags=(tag, self.CANVAS_TEXT_LAYER_TAG))
+        self._text_item_ids.clear()
+        self._drawn_codes[:] = _BLANK_SCREEN
+        self._dirty_cells |= _ALL_CELLS
+        self._flush_graphics()
 
     
     def handle_input_key(self, event):
@@ -1480,17 +3795,7 @@ class TRS80Simulator:
             self._scroll_screen_up()
             self.cursor_col = 0
 
-        x = self.cursor_col * self._char_w
-        y = self.cursor_row * self._char_h
-        tag = f"c{self.cursor_row}_{self.cursor_col}"
-        old = self.screen.find_withtag(tag)
-        if old:
-            self.screen.itemconfigure(old[0], text=uc)
-        else:
-            self.screen.create_text(x, y, text=uc, font=self._screen_font, fill="lime", anchor="nw",
-                tags=(tag, self.CANVAS_TEXT_LAYER_TAG))
-
-        self.screen_content[self.cursor_row][self.cursor_col] = uc
+        self._put_screen_char(self.cursor_row, self.cursor_col, uc)
         self._input_buffer = getattr(self, '_input_buffer', '') + uc
         self.cursor_col += 1
         if self.cursor_col >= 64:
@@ -1502,6 +3807,7 @@ class TRS80Simulator:
         if not hasattr(self, 'input_start_pos'):
             self.input_start_pos = f"{self.cursor_row}.{self.cursor_col - 1}"
 
+        self._flush_graphics()
         self.update_cursor_display()
         self.master.update_idletasks()
 
@@ -1516,15 +3822,9 @@ class TRS80Simulator:
                     self.cursor_row -= 1
                     self.cursor_col = 63
 
-                # Clear the character by updating its text to a space
-                # (drawing a rectangle would occlude any text drawn later)
-                tag = f"c{self.cursor_row}_{self.cursor_col}"
-                old = self.screen.find_withtag(tag)
-                if old:
-                    self.screen.itemconfigure(old[0], text=' ')
-
-                # Update the screen content and input buffer
-                self.screen_content[self.cursor_row][self.cursor_col] = ' '
+                # Blank the cell in video RAM (the flush sets its text item to ' ')
+                self._put_screen_char(self.cursor_row, self.cursor_col, ' ')
+                self._flush_graphics()
                 if hasattr(self, '_input_buffer') and self._input_buffer:
                     self._input_buffer = self._input_buffer[:-1]
                 
@@ -1537,44 +3837,54 @@ class TRS80Simulator:
 
     def handle_input_return(self, event):
         if self.waiting_for_input and event.widget == self.screen:
-            # Use the input buffer (accumulated from keystrokes) instead of
-            # reading back from screen_content, which can lose spaces.
-            user_input = getattr(self, '_input_buffer', '')
-
+            return self._submit_input()
+
+    def _submit_input(self, resume=True):
+        """ENTER on INPUT: assign the typed values and resume the program
+        (resume=False: BACK's replay runs the next statements itself)."""
+        # Use the input buffer (accumulated from keystrokes) instead of
+        # reading back from video RAM, which can lose spaces.
+        user_input = getattr(self, '_input_buffer', '')
+        if self.history is not None and self.history.replay_at is None:
+            self.history.events.append(user_input)
+
+        if self.debug_enabled():
             self.debug_print(f"User input received: {user_input!r}")  # Debug print
 
-            parts = self._split_input_line_to_values(user_input, len(self.input_variables))
-            # Level II: wrong type into a numeric variable -> ?REDO, same INPUT again.
-            for var_spec, val in zip(self.input_variables, parts):
-                if not self._assign_input_value(var_spec, val):
-                    self._redo_input()
-                    return "break"
-            
-            # NEW: advance like PRINT newline — scroll when on last row so OK /
-            # next INPUT ">" do not overwrite ">TAKE FOOD" → "OKAKE FOOD".
-            self.cursor_col = 0
-            self.cursor_row += 1
-            if self.cursor_row >= 16:
-                self._scroll_screen_up()
-            self.update_cursor_display()
+        parts = self._split_input_line_to_values(user_input, len(self.input_variables))
+        # Level II: wrong type into a numeric variable -> ?REDO, same INPUT again.
+        for var_spec, val in zip(self.input_variables, parts):
+            if not self._assign_input_value(var_spec, val):
+                self._redo_input()
+                return "break"
+        
+        # NEW: advance like PRINT newline — scroll when on last row so OK /
+        # next INPUT ">" do not overwrite ">TAKE FOOD" → "OKAKE FOOD".
+        self.cursor_col = 0
+        self.cursor_row += 1
+        if self.cursor_row >= 16:
+            self._scroll_screen_up()
+        self.update_cursor_display()
 
-            self.waiting_for_input = False
-            self.input_variables = None
-            self._input_buffer = ""
-            if hasattr(self, 'input_start_pos'):
-                delattr(self, 'input_start_pos')  # Remove the input start position attribute
-            self.screen.unbind("<Key>")
-            self.screen.unbind("<Return>")
-            self.current_line_index += 1
-            # If program ended on this INPUT line, restore immediate-mode
-            if self.current_line_index >= len(self.sorted_program):
-                self.program_running = False
-                self.stop_button.config(state=tk.DISABLED)
-                self.enable_immediate_mode()
-            else:
+        self.waiting_for_input = False
+        self.input_variables = None
+        self._input_buffer = ""
+        if hasattr(self, 'input_start_pos'):
+            delattr(self, 'input_start_pos')  # Remove the input start position attribute
+        self.screen.unbind("<Key>")
+        self.screen.unbind("<Return>")
+        self.current_line_index += 1
+        # If program ended on this INPUT line, restore immediate-mode
+        if self.current_line_index >= len(self.sorted_program):
+            self._commit_tape_writer()
+            self.program_running = False
+            self.stop_button.config(state=tk.DISABLED)
+            self.enable_immediate_mode()
+        elif resume:
+            if self.debug_enabled():
                 self.debug_print(f"Resuming execution from line index: {self.current_line_index}")  # Debug print
-                self.master.after(1, self.execute_next_line)  # Schedule next execution
-            return "break"
+            self.master.after(1, self.execute_next_line)  # Schedule next execution
+        return "break"
 
     def break_program(self):
         """Handle BREAK (Ctrl+C) — like the Model I BREAK key: stop run, show
@@ -1589,6 +3899,7 @@ class TRS80Simulator:
                 self.print_to_screen("BREAK")
 
             # Stop the program and clear INPUT wait/bindings
+            self._commit_tape_writer()
             self.program_running = False
             self.program_paused = False
             self.waiting_for_input = False
@@ -1619,6 +3930,7 @@ class TRS80Simulator:
                 self.disable_immediate_mode()  # Disable immediate mode when continuing
                 self.execute_next_line()
             else:
+                self._commit_tape_writer()
                 self.program_paused = True
                 self.stop_button.config(text="CONT")
                 self.step_button.config(state=tk.NORMAL)
@@ -1638,14 +3950,11 @@ class TRS80Simulator:
 
     def list_program(self):
         # Always sync from input area first
-        current_program = self.input_area.get(1.0, tk.END).strip().split('\n')
-        self.stored_program = self._sort_program_lines(current_program)
-        
-        if self.stored_program:
-            program_text = '\n'.join(self.stored_program)
-            self.input_area.delete(1.0, tk.END)
-            self.input_area.insert(tk.END, program_text)
-            self.print_to_screen(program_text)
+        self._sync_program_from_editor()
+
+        if self.program:
+            self._show_program_in_editor()
+            self.print_to_screen(self.program.text())
         else:
             self.debug_print("No program loaded.")
 
@@ -1671,7 +3980,12 @@ class TRS80Simulator:
         self.stop_button.config(text="CONT")
         self.stepping = False
 
-    def preprocess_program(self, program):
+    def _split_statements(self, content):
+        """(i, statement) pairs of one line's text, split at its safe colons.
+
+        Statement i > 0 runs as line "N.i".  A line with nothing to split
+        comes back whole as [(0, content)].
+        """
         def is_within_quotes(s, pos):
                 quote_count = len(re.findall(r'(?<!\\)"', s[:pos]))
                 return quote_count % 2 == 1
@@ -1714,38 +4028,17 @@ class TRS80Simulator:
                 i += 1
             return positions
 
-        self.debug_print("Preprocessing")
-        preprocessed = []
-        for line in program:
-            if ':' in line:
-                parts = line.split(maxsplit=1)
-                if len(parts) < 2:
-                    preprocessed.append(line)
-                    continue
-                line_number = parts[0]
-                content = parts[1]
-                split_positions = find_split_colons(content)
-                if split_positions:
-                    # Split at the safe colon positions
-                    statements = []
-                    prev = 0
-                    for pos in split_positions:
-                        statements.append(content[prev:pos].strip())
-                        prev = pos + 1
-                    statements.append(content[prev:].strip())
-                    for i, statement in enumerate(statements):
-                        if not statement:
-                            continue
-                        if i == 0:
-                            preprocessed.append(f"{line_number} {statement}")
-                        else:
-                            new_line_number = f"{line_number}.{i}"
-                            preprocessed.append(f"{new_line_number} {statement}")
-                else:
-                    preprocessed.append(line)
-            else:
-                preprocessed.append(line)
-        return preprocessed
+        split_positions = find_split_colons(content) if ':' in content else None
+        if not split_positions:
+            return [(0, content)]
+        # Split at the safe colon positions
+        statements = []
+        prev = 0
+        for pos in split_positions:
+            statements.append(content[prev:pos].strip())
+            prev = pos + 1
+        statements.append(content[prev:].strip())
+        return [(i, statement) for i, statement in enumerate(statements) if statement]
     
     # ============================================================
     #  SECTION: Interpreter Core — Run & Execute
@@ -1757,27 +4050,78 @@ class TRS80Simulator:
     #    forward, dispatching each line through execute_command.
     #    Yields to Tkinter periodically (update_idletasks / update)
     #    so the GUI stays responsive.
-    #  preprocess_program: splits multi-statement lines on unquoted
+    #  _split_statements: splits a line of the program store on unquoted
     #    colons, preserving colons after IF/THEN/ELSE and inside strings.
     # ============================================================
     def run_program(self):
-        """Entry point for RUN.  Resets state, preprocesses the source,
-        builds the three parallel dispatch arrays, pre-scans DATA
-        statements, then kicks off execute_next_line.
+        """Entry point for RUN.  Resets state, loads the compiled line
+        tables (from compile_cache, or _compile_program), then kicks off
+        execute_next_line.
         """
         self.new_program()
         self.input_area.unbind("<Key>")
         self.input_area.unbind("<Return>")
 
-        # Always sync from input area to stored_program before running
+        # Always sync from input area to the program store before running
         program = self.input_area.get(1.0, tk.END).strip().split('\n')
-        self.stored_program = self._sort_program_lines(program)
+        self._sync_program_from_editor()
         self.original_program = program  # Store the original program
-        preprocessed_program = self.preprocess_program(self.stored_program)
-        self.sorted_program = sorted(
-            [line for line in preprocessed_program if line.strip() and line.split()[0].replace('.', '').isdigit()],
-            key=lambda x: float(x.split()[0])
-        )
+        self.metrics.reset()
+        self._run_started = time.perf_counter()
+        cache = self.compile_cache
+        key = cache.key(self.program.text()) if cache is not None else None
+        tables = cache.get(key) if cache is not None else None
+        if tables is None:
+            self.metrics.counts['compile_cache.misses'] += 1
+            tables = self._compile_program()
+            if cache is not None:
+                cache.put(key, tables)
+        else:
+            self.metrics.counts['compile_cache.hits'] += 1
+        if tables is not None and self.debug_enabled():
+            self.debug_print(f"Compiled program from cache ({len(tables[0])} lines)")
+        (self.sorted_program, self._line_numbers, self._line_commands,
+         self._line_cmd_words, data_values, self._uses_inkey) = tables
+        self.data_values = list(data_values)
+        self.data_pointer = 0
+        if self.profiling:
+            self.line_profile = LineProfiler(self._statement_lines(), self._statement_kinds())
+        if self.tracer is not None:
+            self.tracer.prepare(self._statement_lines(), self._statement_kinds())
+        for breakpoint in self.breakpoints.values():
+            breakpoint.hits = 0
+        self._break_resume_index = None
+        self._update_break_flags()
+        for watchpoint in self.watchpoints.values():
+            watchpoint.hits = 0
+        self._update_watch_keys()
+        self._watch_stop = None
+        if self.history is not None:
+            self.history.reset(self.program.text())
+        self.program_running = True
+        self.program_paused = False
+        self.stop_button.config(text="STOP", state=tk.NORMAL)
+        self.step_button.config(state=tk.NORMAL)  # Enable step button
+        self.debug_print("Starting program execution")
+        self.set_screen_focus()  # Set focus to the screen
+        self.update_variables_window()  # Update variables window at start
+        if not self.stepping:
+            self.execute_next_line()
+
+    def _compile_program(self):
+        """Preprocess the program and build RUN's tables.
+
+        Returns (sorted_program, line numbers, commands, command words,
+        DATA values, uses-INKEY$ flag): plain lists/str/float/bool, so the
+        tuple can be marshalled into compile_cache as it is.
+        """
+        # Straight from the tokenised store: no listing text is parsed back
+        self.debug_print("Preprocessing")
+        statements = []
+        for number, text in self.program.lines():
+            for i, statement in self._split_statements(text):
+                statements.append(f"{number}.{i} {statement}" if i else f"{number} {statement}")
+        self.sorted_program = sorted(statements, key=lambda x: float(x.split()[0]))
         # Optimization 2: Pre-parse line numbers, commands, and command words once
         self._line_numbers = []
         self._line_commands = []
@@ -1795,21 +4139,15 @@ class TRS80Simulator:
                 self._line_cmd_words.append(cw)
             else:
                 self._line_cmd_words.append('')
-        # If the program uses INKEY$ or PEEK(14400) for keyboard polling,
-        # we must process Tkinter events every iteration so key presses
-        # are picked up promptly.  Otherwise we can skip most updates.
-        self._uses_inkey = any('INKEY$' in line or 'PEEK(14400)' in line for line in self.sorted_program)
+        # If the program uses INKEY$ or PEEKs the keyboard (14336-15359) for
+        # polling, the run loop must pump Tk events often so key presses and
+        # releases are picked up promptly.  Otherwise we can skip most updates.
+        keyboard_peek = self._regex_cache['keyboard_peek']
+        self._uses_inkey = any('INKEY$' in line or keyboard_peek.search(line) for line in self.sorted_program)
         # Pre-scan all DATA statements before execution (TRS-80 behavior)
         self._prescan_data()
-        self.program_running = True
-        self.program_paused = False
-        self.stop_button.config(text="STOP", state=tk.NORMAL)
-        self.step_button.config(state=tk.NORMAL)  # Enable step button
-        self.debug_print("Starting program execution")
-        self.set_screen_focus()  # Set focus to the screen
-        self.update_variables_window()  # Update variables window at start
-        if not self.stepping:
-            self.execute_next_line()
+        return (self.sorted_program, self._line_numbers, self._line_commands,
+                self._line_cmd_words, self.data_values, self._uses_inkey)
        
     def _prescan_data(self):
         """Pre-scan all DATA statements in program order (TRS-80 Level II BASIC behavior)"""
@@ -1839,11 +4177,16 @@ class TRS80Simulator:
         the Tkinter event loop; handle_input_return resumes via after()).
 
         GUI responsiveness: time-budget yields (mirrors web_TRS_80 Mar 2026) —
-        update_idletasks ~16ms when INKEY$, ~50ms otherwise; full update() ~100ms;
-        _flush_graphics every 25th line (pending ops only; no-op if empty).
+        full update() ~16ms when the program polls the keyboard (INKEY$/PEEK
+        never pump Tk themselves), otherwise update_idletasks ~50ms and full
+        update() ~100ms; _flush_graphics every 25th line (no-op if nothing dirty).
         """
-        update_counter = 0  # Counter for debug / variables window cadence
+        update_counter = 0  # Counter for the graphics flush cadence
         uses_inkey = getattr(self, '_uses_inkey', True)  # Optimization 7
+        profile = self.line_profile if self.profiling else None
+        history = self.history
+        counts = self.metrics.counts
+        seconds = self.metrics.seconds
         last_idle_t = time.perf_counter()
         last_full_t = time.perf_counter()
 
@@ -1851,16 +4194,23 @@ class TRS80Simulator:
             # Time-budget event processing — avoids capping throughput at ~N lines/s (line-stride idletasks)
             now = time.perf_counter()
             if uses_inkey:
-                if now - last_idle_t >= 0.016:
-                    self.master.update_idletasks()
-                    last_idle_t = now
-            else:
-                if now - last_idle_t >= 0.050:
-                    self.master.update_idletasks()
-                    last_idle_t = now
+                # Keyboard pollers: deliver KeyPress/KeyRelease every frame
+                if now - last_full_t >= 0.016:
+                    self._flush_graphics()
+                    self.master.update()
+                    last_full_t = time.perf_counter()
+                    counts['gui.update'] += 1
+                    seconds['gui.update'] += last_full_t - now
+            elif now - last_idle_t >= 0.050:
+                self.master.update_idletasks()
+                last_idle_t = time.perf_counter()
+                counts['gui.update_idletasks'] += 1
+                seconds['gui.update_idletasks'] += last_idle_t - now
             if now - last_full_t >= 0.10:
                 self.master.update()
-                last_full_t = now
+                last_full_t = time.perf_counter()
+                counts['gui.update'] += 1
+                seconds['gui.update'] += last_full_t - now
 
             # Flush any pending SET/RESET periodically between lines (batch size handles heavy lines)
             if update_counter % 25 == 0:
@@ -1868,6 +4218,8 @@ class TRS80Simulator:
             update_counter += 1
 
             if self.current_line_index >= len(self._line_numbers) or not self._line_numbers:
+                self._commit_tape_writer()
+                self._close_all_channels()
                 self.program_running = False
                 self.stop_button.config(state=tk.DISABLED)
                 self.step_button.config(state=tk.NORMAL)
@@ -1884,11 +4236,18 @@ class TRS80Simulator:
             line_number = self._line_numbers[self.current_line_index]
             command = self._line_commands[self.current_line_index]
 
-            # Only debug print every 10th line when not in debug mode for speed
-            if self.debug_mode or update_counter % 10 == 0:
+            if self.debug_enabled():
                 self.debug_print(f"Executing line {line_number}: {command}")
+            if self.tron:
+                self._trace_statement(self.current_line_index)
+            if (self._break_flags is not None and self._break_flags[self.current_line_index]
+                    and self._breakpoint_stops(self.current_line_index)):
+                return
+            if history is not None and self._history_tick(history):
+                break
 
             if command:
+                counts['statements'] += 1
                 # Check if command has a duplicate line number prefix (from preprocessing)
                 parts = command.split(maxsplit=1)
                 if len(parts) > 1 and parts[0].isdigit():
@@ -1896,7 +4255,13 @@ class TRS80Simulator:
                     cmd_word = None  # re-parse needed
                 else:
                     cmd_word = self._line_cmd_words[self.current_line_index] if self.current_line_index < len(self._line_cmd_words) else None
-                result = self.execute_command(command, cmd_word=cmd_word)
+                if profile is None:
+                    result = self.execute_command(command, cmd_word=cmd_word)
+                else:
+                    index = self.current_line_index
+                    started = time.perf_counter()
+                    result = self.execute_command(command, cmd_word=cmd_word)
+                    profile.record(index, time.perf_counter() - started)
                 # NEW: ON ERROR handler jump
                 if self._pending_goto:
                     jump = self._pending_goto
@@ -1923,12 +4288,7 @@ class TRS80Simulator:
                 else:
                     self.current_line_index += 1
 
-            # Variables window refresh (idletasks handled by time budget at loop top)
-            if update_counter % 100 == 0 and self.variables_window_open:
-                self.update_variables_window()
-                
-
-                    
+            # The variables window refreshes itself on a timer (_state_view_tick)
             if self.stepping:
                 self.debug_print("Stepping through the program")
                 # Flush graphics when stepping
@@ -1938,6 +4298,10 @@ class TRS80Simulator:
                     self.set_screen_focus()
                 return
 
+        if self._watch_stop is not None:
+            self._stop_at_watch()
+            return
+
         # END (and similar) sets program_running False without hitting the natural-end block above.
         if not self.program_running and not self.waiting_for_input:
             self.stop_button.config(state=tk.DISABLED)
@@ -1956,6 +4320,7 @@ class TRS80Simulator:
             messagebox.showwarning("LLM Support", "LLM Assistant is not active. Please enable it first.")
             return
         
+        self.flush_debug_log()
         try:
             debug_text = self.debug_text.get(tk.SEL_FIRST, tk.SEL_LAST)
         except tk.TclError:
@@ -2115,12 +4480,12 @@ class TRS80Simulator:
         # Screen and I/O state
         report.append("SCREEN AND I/O STATE:")
         report.append(f"  Cursor Position: Row {self.cursor_row}, Column {self.cursor_col}")
-        report.append(f"  Last Key Pressed: {repr(self.last_key_pressed) if self.last_key_pressed else 'None'}")
+        report.append(f"  Key Buffer: {''.join(self._key_buffer)!r}" if self._key_buffer else "  Key Buffer: empty")
         
         # Show current screen content (non-empty lines only)
         screen_has_content = False
-        for row_idx, row in enumerate(self.screen_content):
-            line_content = ''.join(row).rstrip()
+        for row_idx in range(16):
+            line_content = self._screen_row_text(row_idx).rstrip()
             if line_content:
                 if not screen_has_content:
                     report.append("  Screen Content (non-empty lines):")
@@ -2325,6 +4690,7 @@ class TRS80Simulator:
 
     def _error_stop_program(self):
         """After a printed ?XX ERROR, stop run and match UI to other stop paths."""
+        self._commit_tape_writer()
         self.program_running = False
         self.stop_button.config(state=tk.DISABLED)
 
@@ -2438,6 +4804,16 @@ class TRS80Simulator:
             'RESUME': self._cmd_resume,
             'OPEN': self._cmd_open,
             'CLOSE': self._cmd_close,
+            'FIELD': self._cmd_field,
+            'GET': self._cmd_get,
+            'PUT': self._cmd_put,
+            'LSET': self._cmd_lset,
+            'RSET': self._cmd_rset,
+            'DIR': self._cmd_dir,
+            'KILL': self._cmd_kill,
+            'NAME': self._cmd_name,
+            'TRON': self._cmd_tron,
+            'TROFF': self._cmd_troff,
         }
 
     def execute_command(self, command, cmd_word=None):
@@ -2484,17 +4860,21 @@ class TRS80Simulator:
 
             # Check for implicit LET: cmd_word not in dispatch table and has '='
             handler = self._command_handlers.get(cmd_word)
+            if handler is None and '#' in cmd_word:
+                # FIELD#1 / GET#1 / PUT#1 written without a space
+                handler = self._command_handlers.get(cmd_word.split('#')[0])
             if handler is None and '=' in command:
                 command = 'LET ' + command
                 cmd_word = 'LET'
                 handler = self._command_handlers.get(cmd_word)
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"AUTO LET -> {command}")
 
             if handler:
                 return handler(command)
             else:
-                self.debug_print(f"Unknown command: {command}", 'warning')
+                if self.debug_enabled('warning'):
+                    self.debug_print(f"Unknown command: {command}", 'warning')
 
         except Exception as e:
             self.debug_print(f"Error executing command: {original_command}", 'error')
@@ -2503,6 +4883,7 @@ class TRS80Simulator:
             if self._last_eval_substituted and self._last_eval_substituted != self._last_eval_original:
                 self.debug_print(f"Expanded: {self._last_eval_substituted}", 'error')
             self.debug_print(f"Error details: {str(e)}", 'error')
+            self._commit_tape_writer()
             self.program_running = False
             self.stop_button.config(state=tk.DISABLED)
 
@@ -2631,7 +5012,7 @@ class TRS80Simulator:
                 position = int(self.evaluate_expression(position_expr))
                 self.cursor_row = position // 64
                 self.cursor_col = position % 64
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"PRINT@ {position} -> row {self.cursor_row}, col {self.cursor_col}")
             else:
                 return  # Malformed PRINT@ — bail out
@@ -2728,13 +5109,18 @@ class TRS80Simulator:
                         # NEW: array element type follows DEFINT/DEFSTR of array name
                         kind = self._resolve_var_kind(array_name)
                         ev = self.evaluate_expression(value)
+                        old = self.array_variables[array_name][index] if self._watch_arrays else None
                         if kind == 'S':
                             self.array_variables[array_name][index] = str(ev)
                         elif kind == 'I':
                             self.array_variables[array_name][index] = self._cint(ev)
                         else:
                             self.array_variables[array_name][index] = ev
-                        if self.debug_mode:
+                        if self._watch_arrays:
+                            self._array_written(array_name, index, old)
+                        if self._dirty_arrays is not None:
+                            self._dirty_arrays.add(array_name)
+                        if self.debug_enabled():
                             self.debug_print(f"Array assignment: {array_name}[{index}] = {self.array_variables[array_name][index]}")
                     else:
                         self._error_bs(array_name, index)
@@ -2743,14 +5129,15 @@ class TRS80Simulator:
             else:
                 # NEW: LET uses DEFINT CINT / DEFSTR typing (JMR STORE path)
                 self._set_scalar(var_name, self.evaluate_expression(value))
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"Variable assignment: {var_name} = {self._get_scalar(var_name)}")
 
     def _cmd_rem(self, command):
         pass
 
     def _cmd_poke(self, command):
-        self.debug_print(f"Executing POKE command: {command}")
+        if self.debug_enabled():
+            self.debug_print(f"Executing POKE command: {command}")
         match = self._regex_cache['poke'].match(command)
         if match:
             address_expr, value_expr = match.groups()
@@ -2790,7 +5177,7 @@ class TRS80Simulator:
                 else:
                     self.reset_pixel(x, y)
             else:
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"Invalid {command.split()[0]} command: {command}")
 
     def _cmd_cls(self, command):
@@ -2918,15 +5305,20 @@ class TRS80Simulator:
                 self.debug_print(f"Error: Index {index} out of bounds for array {array_name}", 'error')
                 return True
             # NEW: INPUT array element respects DEFINT/DEFSTR
+            old = self.array_variables[array_name][index] if self._watch_arrays else None
             if self._resolve_var_kind(array_name) == 'S':
                 self.array_variables[array_name][index] = value_str
-                return True
-            number = self._parse_input_number(value_str)
-            if number is None:
-                return False
-            if self._resolve_var_kind(array_name) == 'I':
-                number = self._cint(number)
-            self.array_variables[array_name][index] = number
+            else:
+                number = self._parse_input_number(value_str)
+                if number is None:
+                    return False
+                if self._resolve_var_kind(array_name) == 'I':
+                    number = self._cint(number)
+                self.array_variables[array_name][index] = number
+            if self._watch_arrays:
+                self._array_written(array_name, index, old)
+            if self._dirty_arrays is not None:
+                self._dirty_arrays.add(array_name)
             return True
         # NEW: INPUT scalar via _set_scalar (DEFINT/DEFSTR)
         if self._resolve_var_kind(var_spec) == 'S':
@@ -2954,6 +5346,8 @@ class TRS80Simulator:
         self.screen.focus_set()
         self.update_cursor_display()
         self.master.update_idletasks()
+        if self._key_buffer:
+            self.master.after_idle(self._feed_type_ahead)
 
     def _compute_array_linear_index(self, array_name, index_expr):
         """TRS-80 DIM A(I,J): linear index = I*(max_J+1)+J. Single-subscript arrays unchanged."""
@@ -2992,9 +5386,12 @@ class TRS80Simulator:
                 else:
                     self.array_variables[array_name] = [0] * total
                 self.array_dimensions[array_name] = (d1, d2)
+            if self._dirty_arrays is not None:
+                self._dirty_arrays.add(array_name)
             # Optimization 6: Pre-compile array pattern for this array
             self._array_patterns[array_name] = re.compile(rf'\b{re.escape(array_name)}\(')
-            self.debug_print(f"Array {array_name} dimensioned ({len(self.array_variables[array_name])} elements)")
+            if self.debug_enabled():
+                self.debug_print(f"Array {array_name} dimensioned ({len(self.array_variables[array_name])} elements)")
         else:
             self._error_sn(f"Invalid DIM command: {command}")
 
@@ -3005,17 +5402,22 @@ class TRS80Simulator:
         tape_data = self.read_from_tape()
         if tape_data is not None:
             self._set_scalar(var_name, tape_data)
-            self.debug_print(f"Read from tape: {var_name} = {tape_data}")
+            if self.debug_enabled():
+                self.debug_print(f"Read from tape: {var_name} = {tape_data}")
         else:
             self.debug_print("Error: No more data on tape")
 
     def _cmd_print_tape(self, command):
         if not self.tape_file:
             self.create_tape_file()
+            if not self.tape_file:
+                self._raise_error(5, 'FC')  # the tape file dialog was cancelled
+                return
         _, data = command.split(',', 1)
         data = self.evaluate_expression(data.strip())
         self.write_to_tape(data)
-        self.debug_print(f"Wrote to tape: {data}")
+        if self.debug_enabled():
+            self.debug_print(f"Wrote to tape: {data}")
 
     def _cmd_input(self, command):
         prompt, var_names = self._parse_input_command(command)
@@ -3025,10 +5427,12 @@ class TRS80Simulator:
         # Level II / JMR / web: optional prompt string, then always "? "
         if prompt is not None:
             self.print_to_screen(prompt, end='')
-            self.debug_print(f"INPUT {var_names} prompt={prompt!r}")
+            if self.debug_enabled():
+                self.debug_print(f"INPUT {var_names} prompt={prompt!r}")
         self.print_to_screen("? ", end='')
         if prompt is None:
-            self.debug_print(f"INPUT {var_names}")
+            if self.debug_enabled():
+                self.debug_print(f"INPUT {var_names}")
         self.waiting_for_input = True
         self.input_variables = var_names
         self._input_buffer = ""  # Accumulate typed chars directly
@@ -3037,10 +5441,13 @@ class TRS80Simulator:
         self.screen.bind("<Key>", self.handle_input_key)
         self.screen.bind("<Return>", self.handle_input_return)
         self.screen.focus_set()
+        if self._key_buffer:
+            # After the run loop has seen waiting_for_input and returned
+            self.master.after_idle(self._feed_type_ahead)
 
     def _cmd_goto(self, command):
         line_number = int(command[4:].strip())
-        if self.debug_mode:
+        if self.debug_enabled():
             self.debug_print(f"GOTO {line_number}")
         return line_number
 
@@ -3072,20 +5479,20 @@ class TRS80Simulator:
                 _truth = False
             if _truth:
                 trimmed = then_action.strip()
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"IF {condition} -> TRUE; THEN {then_action}")
                 if trimmed.isdigit():
                     return int(trimmed)
                 return self._execute_multi_statement(then_action)
             elif else_action:
                 trimmed_else = else_action.strip()
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"IF {condition} -> FALSE; ELSE {else_action}")
                 if trimmed_else.isdigit():
                     return int(trimmed_else)
                 return self._execute_multi_statement(else_action)
             else:
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"IF {condition} -> FALSE")
 
     def _execute_multi_statement(self, statements):
@@ -3137,7 +5544,7 @@ class TRS80Simulator:
             }
             # NEW: FOR index uses DEFINT coercion when applicable
             self._set_scalar(var, start)
-            if self.debug_mode:
+            if self.debug_enabled():
                 self.debug_print(f"FOR {var}={start} TO {end} STEP {step}")
 
     def _cmd_next(self, command):
@@ -3161,12 +5568,12 @@ class TRS80Simulator:
             loop['current'] = self._get_scalar(var, loop['current']) + loop['step']
             self._set_scalar(var, loop['current'])
             if (loop['step'] > 0 and loop['current'] <= loop['end']) or (loop['step'] < 0 and loop['current'] >= loop['end']):
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"NEXT {var} -> {loop['current']} (repeat)")
                 # Optimization 8: Use cached next_line_number from FOR time
                 return loop['next_line_number']
             else:
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"NEXT {var} -> done")
                 self.for_loops.pop(var)
         else:
@@ -3188,7 +5595,7 @@ class TRS80Simulator:
             if 1 <= value <= len(targets):
                 line_number = targets[value - 1]
                 self.gosub_stack.append(self.current_line_index + 1)
-                if self.debug_mode:
+                if self.debug_enabled():
                     self.debug_print(f"ON ... GOSUB -> {line_number} (depth {len(self.gosub_stack)})")
                 return line_number
             return None
@@ -3204,7 +5611,7 @@ class TRS80Simulator:
         line_number = int(command[5:].strip())
         # Store return line index directly
         self.gosub_stack.append(self.current_line_index + 1)
-        if self.debug_mode:
+        if self.debug_enabled():
             self.debug_print(f"GOSUB {line_number} (depth {len(self.gosub_stack)})")
         return line_number
 
@@ -3216,7 +5623,7 @@ class TRS80Simulator:
                 return_index, remaining = entry
             else:
                 return_index, remaining = entry, None
-            if self.debug_mode:
+            if self.debug_enabled():
                 self.debug_print(f"RETURN (depth {len(self.gosub_stack)})")
             # Execute any remaining statements from IF..THEN GOSUB X: Y: Z
             if remaining:
@@ -3250,12 +5657,17 @@ class TRS80Simulator:
                     if array_name in self.array_variables:
                         if 0 <= index < len(self.array_variables[array_name]):
                             kind = self._resolve_var_kind(array_name)
+                            old = self.array_variables[array_name][index] if self._watch_arrays else None
                             if kind == 'S':
                                 self.array_variables[array_name][index] = value.strip("'\"")
                             elif kind == 'I':
                                 self.array_variables[array_name][index] = self._cint(self.evaluate_expression(value))
                             else:
                                 self.array_variables[array_name][index] = self.evaluate_expression(value)
+                            if self._watch_arrays:
+                                self._array_written(array_name, index, old)
+                            if self._dirty_arrays is not None:
+                                self._dirty_arrays.add(array_name)
                         else:
                             self._error_bs(array_name, index)
                     else:
@@ -3267,7 +5679,8 @@ class TRS80Simulator:
                     else:
                         self._set_scalar(var, self.evaluate_expression(value))
                 self.data_pointer += 1
-                self.debug_print(f"READ: {var} = {value}")
+                if self.debug_enabled():
+                    self.debug_print(f"READ: {var} = {value}")
             else:
                 self._error_od()
 
@@ -3344,6 +5757,9 @@ class TRS80Simulator:
     def _set_scalar(self, name, value):
         """Assign with DEFINT coercion / DEFSTR string typing (JMR STORE)."""
         key = self._canonical_var_key(name)
+        watchpoint = self._watch_scalars.get(key) if self._watch_scalars else None
+        if watchpoint is not None:
+            old = self._get_scalar(name)
         kind = self._resolve_var_kind(name)
         base, _ = self._parse_var_type(name)
         # A% / A! / A$ are distinct slots — no cross-deletes (JMR VariableEngine).
@@ -3356,6 +5772,10 @@ class TRS80Simulator:
             self.scalar_variables[key] = self._cint(value)
         else:
             self.scalar_variables[key] = value
+        if watchpoint is not None:
+            self._watch_written(watchpoint, old, self.scalar_variables[key])
+        if self._dirty_scalars is not None:
+            self._dirty_scalars.add(key)
         self._last_var_count = -1
         self._var_regex_cache.pop(key, None)
         if base:
@@ -3408,7 +5828,7 @@ class TRS80Simulator:
             first = m.group(1)
             last = m.group(2) or first
             self._set_default_type(first, last, type_code)
-        if self.debug_mode:
+        if self.debug_enabled():
             self.debug_print(f"{command.split()[0]} -> {rest}")
 
     def _cmd_defint(self, command):
@@ -3425,7 +5845,10 @@ class TRS80Simulator:
         self._cmd_def_type(command, 'S')
 
     def _cmd_clear(self, command):
-        """Program CLEAR — zero vars; keep DEFINT/DEFSNG/DEFDBL/DEFSTR table."""
+        """Program CLEAR [n] — zero vars; keep DEFINT/DEFSNG/DEFDBL/DEFSTR table."""
+        size_expr = command[5:].strip()
+        if size_expr:
+            self._set_string_space(size_expr)
         self.scalar_variables = {}
         self.array_variables = {}
         self.array_dimensions = {}
@@ -3439,26 +5862,553 @@ class TRS80Simulator:
         self._var_regex_cache = {}
         self._array_patterns = {}
 
-    def _cmd_def(self, command):
-        """DEF FNx(var) = expression"""
-        import re as _re
-        m = _re.match(r'^DEF\s+FN([A-Z])\s*\(\s*([A-Z][A-Z0-9]*[%!#$]?)\s*\)\s*=\s*(.+)$', command)
-        if m:
-            letter = m.group(1)
-            param = m.group(2)
-            body = m.group(3)
-            self.user_functions[letter] = {'param': param, 'body': body}
-            if self.debug_mode:
-                self.debug_print(f"DEF FN{letter}({param}) = {body}")
+    def _cmd_def(self, command):
+        """DEF FNx(var) = expression"""
+        import re as _re
+        m = _re.match(r'^DEF\s+FN([A-Z])\s*\(\s*([A-Z][A-Z0-9]*[%!#$]?)\s*\)\s*=\s*(.+)$', command)
+        if m:
+            letter = m.group(1)
+            param = m.group(2)
+            body = m.group(3)
+            self.user_functions[letter] = {'param': param, 'body': body}
+            if self.debug_enabled():
+                self.debug_print(f"DEF FN{letter}({param}) = {body}")
+
+    def _cmd_stop(self, command):
+        self._commit_tape_writer()
+        line_number = self._get_current_line_number()
+        self.print_to_screen(f"BREAK IN {line_number}")
+        self.program_paused = True
+        self.stop_button.config(text="CONT", state=tk.NORMAL)
+        self.enable_immediate_mode()
+
+    def _cmd_tron(self, command):
+        """TRON prints <line> as each line starts, like Level II; TRON RECORD
+        only records.  Either way statements go into the TraceRecorder ring."""
+        arg = command[4:].strip()
+        if arg not in ('', 'RECORD'):
+            self._error_sn(f"TRON {arg}")
+            return
+        if self.tracer is None:
+            self.tracer = TraceRecorder()
+            self.tracer.prepare(self._statement_lines(), self._statement_kinds())
+        self.tron = True
+        self.tron_print = not arg
+
+    def _cmd_troff(self, command):
+        self.tron = False
+        self.tron_print = False
+
+    def _trace_statement(self, index):
+        tracer = self.tracer
+        tracer.record(index, self.metrics.counts['statements'])
+        if self.tron_print and tracer.starts[index]:
+            self.print_to_screen(f"<{tracer.lines[index]:g}>", end='')
+
+    def _update_break_flags(self):
+        """Flag the first statement of each breakpoint line for the run loop."""
+        if not self.breakpoints or not self._line_numbers:
+            self._break_flags = None
+            return
+        flags = bytearray(len(self._line_numbers))
+        for line in self.breakpoints:
+            index = self.find_line_index(line)
+            if index != -1:
+                flags[index] = 1
+        self._break_flags = flags
+
+    def _array_element(self, name, *indexes):
+        """Value of name(indexes) for breakpoint conditions (0 or "" if absent)."""
+        values = self.array_variables.get(name)
+        if values is None:
+            return '' if name.endswith('$') else 0
+        index = int(indexes[0])
+        if len(indexes) > 1:
+            index = index * (self.array_dimensions.get(name, (0, 0))[1] + 1) + int(indexes[1])
+        return values[index] if 0 <= index < len(values) else 0
+
+    def _breakpoint_stops(self, index):
+        """Count a pass over a breakpoint line; pause like STOP if it should stop."""
+        if index == self._break_resume_index:
+            self._break_resume_index = None
+            return False
+        breakpoint = self.breakpoints.get(self._line_numbers[index])
+        if breakpoint is None:
+            return False
+        if breakpoint.condition and not self._condition_true(breakpoint):
+            return False
+        breakpoint.hits += 1
+        if breakpoint.hits < breakpoint.count:
+            return False
+        self._break_resume_index = index
+        self._pause_in(breakpoint.line)
+        return True
+
+    def _condition_true(self, point):
+        """A breakpoint's or watchpoint's condition, from its code object if it has one."""
+        try:
+            if point.code is not None:
+                return eval(point.code, {'__builtins__': None},
+                            {'_v': self._get_scalar, '_a': self._array_element})
+            return self.evaluate_expression(point.condition)
+        except Exception as e:
+            self.debug_print(f"{point}: {e}", 'error')
+            return True  # a broken condition stops, so it can be fixed
+
+    def _pause_in(self, line):
+        """Pause the run like STOP: BREAK IN line, CONT/STEP enabled."""
+        self._commit_tape_writer()
+        self._flush_graphics()
+        self.print_to_screen(f"BREAK IN {line:g}")
+        self.program_paused = True
+        self.stop_button.config(text="CONT", state=tk.NORMAL)
+        self.step_button.config(state=tk.NORMAL)
+        if self.variables_window_open:
+            self.update_variables_window()
+        self.enable_immediate_mode()
+
+    def _update_watch_keys(self):
+        """Index watchpoints by canonical scalar key (DEFINT may have changed) and array name."""
+        self._watch_scalars = {}
+        self._watch_arrays = {}
+        for watchpoint in self.watchpoints.values():
+            if watchpoint.indexes is None:
+                self._watch_scalars[self._canonical_var_key(watchpoint.name)] = watchpoint
+            else:
+                self._watch_arrays.setdefault(watchpoint.name, []).append(watchpoint)
+
+    def _array_written(self, name, index, old):
+        """Write hook of array stores; only called while some array is watched."""
+        for watchpoint in self._watch_arrays.get(name, ()):
+            if watchpoint.covers(index, self.array_dimensions.get(name, (0, 0))):
+                self._watch_written(watchpoint, old, self.array_variables[name][index])
+                return
+
+    def _watch_written(self, watchpoint, old, new):
+        """A watched slot was written: stop after this statement if the condition holds."""
+        if not self.program_running or self._watch_stop is not None:
+            return
+        if watchpoint.condition and not self._condition_true(watchpoint):
+            return
+        watchpoint.hits += 1
+        line = self._source_line(self._line_numbers[self.current_line_index])
+        self._watch_stop = (watchpoint, old, new, line)
+        self.program_paused = True  # the run loop ends after this statement
+
+    def _stop_at_watch(self):
+        watchpoint, old, new, line = self._watch_stop
+        self._watch_stop = None
+        self.debug_log.append('warning', f"WATCH {watchpoint}: line {line:g} changed it from "
+                                         f"{self._format_state_value(old)} to {self._format_state_value(new)}")
+        self.flush_debug_log()
+        self._pause_in(line)
+
+    def watch_command(self, args):
+        """WATCH (list) / WATCH X / A(3) / A(2,1) / A() [IF cond] / WATCH OFF [target]."""
+        args = args.strip()
+        if not args:
+            return [f"WATCH {wp}  HITS {wp.hits}" for _, wp in sorted(self.watchpoints.items())] \
+                or ["NO WATCHPOINTS"]
+        if args.split()[0] == "OFF":
+            target = args[3:].replace(' ', '')
+            if target:
+                self.watchpoints.pop(target, None)
+            else:
+                self.watchpoints.clear()
+            self._update_watch_keys()
+            return [f"WATCH OFF {target}".rstrip()]
+        match = re.match(r'^([A-Z][A-Z0-9]*[%!#$]?)\s*(?:\(([^)]*)\))?(?:\s+IF\s+(.+))?$', args)
+        if not match:
+            raise ValueError(args)
+        name, subscripts, condition = match.groups()
+        indexes = None
+        if subscripts is not None:
+            parts = [part for part in subscripts.split(',') if part.strip()]
+            if len(parts) > 2:
+                raise ValueError(args)
+            indexes = tuple(int(self.evaluate_expression(part)) for part in parts)
+        watchpoint = Watchpoint(name, indexes, (condition or '').strip())
+        self.watchpoints[str(Watchpoint(name, indexes))] = watchpoint
+        self._update_watch_keys()
+        return [f"WATCH {watchpoint}"]
+
+    def _history_tick(self, history):
+        """Run loop, before each statement: count it and checkpoint every interval.
+
+        True when a replay has reached its target step (the loop stops there).
+        """
+        step = history.step
+        if step == history.stop_at:
+            self.program_paused = True
+            return True
+        if step >= history.next_checkpoint and history.replay_at is None:
+            # Open channels are not part of a checkpoint: skip while one is
+            if not self._seq_channels and self._tape_writer is None:
+                checkpoint = self._capture_state()
+                checkpoint['step'] = step
+                checkpoint['event'] = history.event_count()
+                history.add(checkpoint)
+            history.next_checkpoint = step + history.interval
+        history.step = step + 1
+        return False
+
+    def _capture_state(self):
+        """Copy of everything a RUN changes, taken between statements.
+
+        Only plain lists, dicts, tuples, str, bytes and numbers, so SAVE
+        STATE can marshal it as it is.
+        """
+        return {
+            'line_index': self.current_line_index,
+            'scalars': dict(self.scalar_variables),
+            'arrays': {name: values[:] for name, values in self.array_variables.items()},
+            'dimensions': dict(self.array_dimensions),
+            'functions': dict(self.user_functions),
+            'types': list(self.default_type_table),
+            'for_loops': {var: dict(loop) for var, loop in self.for_loops.items()},
+            'gosub': list(self.gosub_stack),
+            'data_pointer': self.data_pointer,
+            'errors': (self.error_goto_line, self.err_value, self.erl_value, self._error_line_index),
+            'string_space': self.string_space,
+            'memory': bytes(self.memory.data),
+            'cursor': (self.cursor_row, self.cursor_col),
+            'tape': (self.tape_file, self.tape_pointer),
+            'random': random.getstate(),
+            'last_rnd': getattr(self, '_last_rnd', 0),
+            'seq_files': dict(self._seq_files),
+        }
+
+    def _restore_state(self, state):
+        """Put a _capture_state copy back; the program is left running, paused.
+
+        Channels opened since are closed (a checkpoint has none open); their
+        in-memory files are replaced by the copies in state.
+        """
+        channels = self._seq_channels
+        while channels:
+            channels.popitem()[1].close()
+        self._seq_files = dict(state['seq_files'])
+        self.current_line_index = state['line_index']
+        self.scalar_variables = dict(state['scalars'])
+        self.array_variables = {name: values[:] for name, values in state['arrays'].items()}
+        self.array_dimensions = dict(state['dimensions'])
+        self.user_functions = dict(state['functions'])
+        self.default_type_table[:] = state['types']
+        self.for_loops = {var: dict(loop) for var, loop in state['for_loops'].items()}
+        self.gosub_stack = list(state['gosub'])
+        self.data_pointer = state['data_pointer']
+        (self.error_goto_line, self.err_value, self.erl_value,
+         self._error_line_index) = state['errors']
+        self._pending_goto = 0
+        self.string_space = state['string_space']
+        self.memory.data[:] = state['memory']
+        self._dirty_cells |= _ALL_CELLS
+        self.cursor_row, self.cursor_col = state['cursor']
+        tape_file, self.tape_pointer = state['tape']
+        if tape_file != self.tape_file:
+            self._commit_tape_writer()
+            self._close_tape_reader()
+            self.tape_file = tape_file
+        random.setstate(state['random'])
+        self._last_rnd = state['last_rnd']
+        self.waiting_for_input = False
+        self.input_variables = None
+        self._input_buffer = ""
+        self._watch_stop = None
+        self._last_var_count = -1
+        self._var_regex_cache = {}
+        self.program_running = True
+        self.program_paused = True
+
+    def step_back(self, steps=1, to_step=None):
+        """BACK: return to steps statements ago (or to statement to_step) by
+        restoring the nearest checkpoint and replaying the logged inputs.
+
+        Returns an error message, or None once paused at the target.
+        """
+        history = self.history
+        if history is None:
+            return "HISTORY IS OFF"
+        if not self._line_numbers or history.source != self.program.text():
+            return "?CN ERROR"  # no run, or the program was edited since
+        if self.program_running and not self.program_paused:
+            return "?CN ERROR"
+        target = history.step - steps if to_step is None else to_step
+        checkpoint = history.nearest(target) if 0 <= target < history.step else None
+        if checkpoint is None:
+            return "NOT IN HISTORY"
+        if history.writes_files(checkpoint['step'], target):
+            return "CAN'T REPLAY DISK FILE WRITES"
+        self.disable_immediate_mode()
+        self._restore_state(checkpoint)
+        history.step = checkpoint['step']
+        history.replay_at = checkpoint['event']
+        history.stop_at = target
+        saved = (self.tron, self.profiling, self._break_flags,
+                 self._watch_scalars, self._watch_arrays)
+        self.tron = self.profiling = False
+        self._break_flags = None
+        self._watch_scalars = self._watch_arrays = {}
+        try:
+            while self.program_running and history.step < target:
+                if self.waiting_for_input:
+                    self._input_buffer = history.next_event("")
+                    self._submit_input(resume=False)
+                    continue
+                step = history.step
+                self.program_paused = False
+                self.execute_next_line()
+                if history.step == step and not self.waiting_for_input:
+                    break  # the replay stopped making progress
+        finally:
+            history.stop_at = None
+            (self.tron, self.profiling, self._break_flags,
+             self._watch_scalars, self._watch_arrays) = saved
+        history.truncate()
+        self._flush_graphics()
+        self.update_cursor_display()
+        if not self.program_running:
+            return "?CN ERROR"
+        self._break_resume_index = self.current_line_index
+        self.debug_log.append('info', f"BACK to statement {history.step}")
+        self.flush_debug_log()
+        self._pause_in(self._source_line(self._line_numbers[self.current_line_index]))
+        return None
+
+    def history_command(self, args):
+        """HISTORY (status) / HISTORY ON [interval] / HISTORY OFF."""
+        words = args.split()
+        if words[:1] == ['ON'] and len(words) <= 2:
+            interval = int(words[1]) if len(words) > 1 else HISTORY_INTERVAL
+            if interval < 1:
+                raise ValueError(args)
+            self.history = ExecutionHistory(interval)
+            self.history.source = self.program.text()
+            return [f"HISTORY ON, CHECKPOINT EVERY {interval} STATEMENTS"]
+        if words == ['OFF']:
+            self.history = None
+            return ["HISTORY OFF"]
+        if words:
+            raise ValueError(args)
+        history = self.history
+        if history is None:
+            return ["HISTORY OFF"]
+        lines = [f"STATEMENT {history.step}, {len(history.checkpoints)} CHECKPOINTS, "
+                 f"{len(history.events)} INPUTS LOGGED"]
+        numbers = self._line_numbers
+        for checkpoint in history.checkpoints:
+            index = checkpoint['line_index']
+            line = self._source_line(numbers[index]) if index < len(numbers) else 0
+            lines.append(f"  STATEMENT {checkpoint['step']:>9}  LINE {line:g}")
+        return lines
+
+    def _channel_states(self):
+        """Open channels #1-#15 as plain tuples (for SAVE STATE)."""
+        saved = []
+        for number, chan in sorted(self._seq_channels.items()):
+            if isinstance(chan, RandomFile):
+                saved.append((number, 'R', chan.name, chan.path, chan.record_length,
+                               chan.records, bytes(chan.buffer), [tuple(f) for f in chan.fields]))
+                continue
+            stream = chan.stream
+            stream.flush()
+            if isinstance(stream, io.StringIO):
+                text, path = stream.getvalue(), None
+            else:
+                text, path = None, chan.path or stream.name
+            saved.append((number, chan.mode, chan.name, path, text, stream.tell(),
+                          chan.records, chan._lookahead))
+        return saved
+
+    def _reopen_channels(self, saved):
+        """Reopen _channel_states() channels at their saved positions."""
+        for entry in saved:
+            number, mode = entry[0], entry[1]
+            if mode == 'R':
+                _, _, name, path, length, records, buffer, fields = entry
+                chan = RandomFile(name, path, length)
+                chan.records = records
+                chan.buffer[:] = buffer
+                chan.fields = [tuple(f) for f in fields]
+            else:
+                _, _, name, path, text, position, records, lookahead = entry
+                if text is not None:
+                    stream = io.StringIO(text)
+                    stream.seek(position)
+                elif mode == 'I':
+                    stream = open(path, 'r', encoding='utf-8-sig', errors='replace')
+                    stream.seek(position)
+                else:
+                    stream = open(path, 'a', encoding='utf-8')
+                chan = SequentialFile(name, mode, stream, None if mode == 'I' else path)
+                chan.records = records
+                chan._lookahead = lookahead
+            self._seq_channels[number] = chan
+
+    def save_state(self, path=STATE_FILE):
+        """SAVE STATE: the program, its compiled tables and the whole run state.
+
+        Written like CompiledProgramCache (temp file + os.replace), so an
+        interrupted save leaves the previous state file.  Raises OSError.
+        Returns the file size.
+        """
+        self._sync_program_from_editor()
+        self._commit_tape_writer()
+        payload = {
+            'program': self.program.text(),
+            'tables': (self.sorted_program, self._line_numbers, self._line_commands,
+                       getattr(self, '_line_cmd_words', []), self.data_values,
+                       getattr(self, '_uses_inkey', True)),
+            'state': self._capture_state(),
+            'run': (self.program_running, self.program_paused, self.waiting_for_input,
+                    self.input_variables, getattr(self, '_input_buffer', ''),
+                    getattr(self, 'initial_start_pos', '')),
+            'channels': self._channel_states(),
+            'key_buffer': ''.join(self._key_buffer),
+            'ram_top': self.memory.ram_top,
+            'program_dir': self._program_dir,
+        }
+        data = _STATE_HEADER.pack(STATE_FILE_MAGIC, STATE_FILE_VERSION) + zlib.compress(marshal.dumps(payload))
+        folder = os.path.dirname(os.path.abspath(path))
+        fd, temp_path = tempfile.mkstemp(prefix='.state-', suffix='.tmp', dir=folder)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return len(data)
+
+    def load_state(self, path=STATE_FILE, program=None):
+        """LOAD STATE: replace everything with a save_state file and carry on
+        as it was: waiting at its INPUT, paused, running or stopped.
+
+        program, if given, is the listing the state must have been saved
+        from; a state of another program is refused and nothing changes.
+        Returns an error message, or None.
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return "?FILE NOT FOUND"
+        if len(data) < _STATE_HEADER.size:
+            return "?BAD FILE DATA"
+        magic, version = _STATE_HEADER.unpack_from(data)
+        if magic != STATE_FILE_MAGIC or version != STATE_FILE_VERSION:
+            return "?BAD FILE DATA"
+        try:
+            payload = marshal.loads(zlib.decompress(data[_STATE_HEADER.size:]))
+        except (zlib.error, ValueError, EOFError, TypeError):
+            return "?BAD FILE DATA"
+        if payload['ram_top'] != self.memory.ram_top:
+            return f"?SAVED WITH {(payload['ram_top'] + 1 - RAM_START) // 1024}K MEMORY"
+        if program is not None and payload['program'] != program:
+            return STATE_OTHER_PROGRAM
+
+        self.new_program()
+        self.program.load(payload['program'].split('\n') if payload['program'] else [])
+        self._show_program_in_editor()
+        (self.sorted_program, self._line_numbers, self._line_commands,
+         self._line_cmd_words, data_values, self._uses_inkey) = payload['tables']
+        self.data_values = list(data_values)
+        self._program_dir = payload['program_dir']
+        self._restore_state(payload['state'])
+        try:
+            self._reopen_channels(payload['channels'])
+        except OSError as e:
+            self.program_running = False
+            return f"?FILE NOT FOUND: {e.filename}"
+        self._key_buffer.extend(payload['key_buffer'])
+        self._update_break_flags()
+        self._break_resume_index = self.current_line_index
+        self._update_watch_keys()
+        if self.history is not None:
+            self.history.reset(self.program.text())
+        if self.tracer is not None:
+            self.tracer.prepare(self._statement_lines(), self._statement_kinds())
+        self._flush_graphics()
+        self.update_cursor_display()
+
+        running, paused, waiting, input_variables, input_buffer, start_pos = payload['run']
+        if not running:
+            self.program_running = False
+            self.program_paused = False
+            self.enable_immediate_mode()
+            return None
+        self.metrics.reset()
+        self._run_started = time.perf_counter()
+        self.disable_immediate_mode()
+        if waiting:
+            # Mid-INPUT: the prompt and typed characters are back in video RAM
+            self.program_paused = False
+            self.waiting_for_input = True
+            self.input_variables = list(input_variables)
+            self._input_buffer = input_buffer
+            self.initial_start_pos = start_pos
+            self.stop_button.config(text="STOP", state=tk.NORMAL)
+            self.screen.config(state=tk.NORMAL)
+            self.screen.bind("<Key>", self.handle_input_key)
+            self.screen.bind("<Return>", self.handle_input_return)
+            self.screen.focus_set()
+            if self._key_buffer:
+                self.master.after_idle(self._feed_type_ahead)
+        elif paused:
+            self.stop_button.config(text="CONT", state=tk.NORMAL)
+            self.step_button.config(state=tk.NORMAL)
+            self.enable_immediate_mode()
+        else:
+            self.program_paused = False
+            self.stop_button.config(text="STOP", state=tk.NORMAL)
+            self.master.after(1, self.execute_next_line)
+        return None
 
-    def _cmd_stop(self, command):
-        line_number = self._get_current_line_number()
-        self.print_to_screen(f"BREAK IN {line_number}")
-        self.program_paused = True
-        self.stop_button.config(text="CONT", state=tk.NORMAL)
-        self.enable_immediate_mode()
+    def breakpoint_command(self, args):
+        """BREAK (list) / BREAK n [COUNT c] [IF cond] / BREAK OFF [n]; returns lines to show."""
+        args = args.strip()
+        if not args:
+            return [f"BREAK {bp}  HITS {bp.hits}" for _, bp in sorted(self.breakpoints.items())] \
+                or ["NO BREAKPOINTS"]
+        if args.split()[0] == "OFF":
+            spec = args[3:].strip()
+            if spec:
+                self.breakpoints.pop(float(spec), None)
+            else:
+                self.breakpoints.clear()
+            self._update_break_flags()
+            return [f"BREAK OFF {spec}".rstrip()]
+        match = re.match(r'^(\d+(?:\.\d+)?)(?:\s+COUNT\s+(\d+))?(?:\s+IF\s+(.+))?$', args)
+        if not match:
+            raise ValueError(args)
+        line, count, condition = match.groups()
+        breakpoint = Breakpoint(float(line), int(count or 0), (condition or '').strip())
+        self.breakpoints[breakpoint.line] = breakpoint
+        self._update_break_flags()
+        return [f"BREAK {breakpoint}"]
+
+    def set_breakpoint_from_window(self):
+        """Debug window Break button: same text as the BREAK command."""
+        try:
+            lines = self.breakpoint_command(self.break_entry.get().upper())
+        except ValueError:
+            lines = ["?SYNTAX ERROR - LINE [COUNT N] [IF CONDITION] OR OFF [LINE]"]
+        for line in lines:
+            self.debug_log.append('info', line)
+        self.flush_debug_log()
+
+    def step_back_from_window(self):
+        """Debug window Back button: BACK one statement."""
+        message = self.step_back()
+        if message:
+            self.debug_log.append('warning', f"BACK: {message}")
+            self.flush_debug_log()
 
     def _cmd_end(self, command):
+        self._commit_tape_writer()
+        self._close_all_channels()
         self.program_running = False
         self.stop_button.config(state=tk.DISABLED)
         self._flush_graphics()
@@ -3479,7 +6429,8 @@ class TRS80Simulator:
     _PROTECTED_FUNCTIONS = frozenset([
         'SIN', 'COS', 'TAN', 'ATN', 'EXP', 'LOG', 'SQR', 'ABS', 'INT', 'RND',
         'CHR$', 'STR$', 'LEFT$', 'RIGHT$', 'MID$', 'INSTR', 'LEN',
-        'ASC', 'VAL', 'PEEK', 'POINT', 'FIX', 'SGN', 'STRING$'
+        'ASC', 'VAL', 'PEEK', 'POINT', 'FIX', 'SGN', 'STRING$',
+        'EOF', 'LOC', 'LOF', 'MKI$', 'MKS$', 'MKD$', 'CVI', 'CVS', 'CVD'
     ])
 
     def _build_quote_map(self, s):
@@ -3532,6 +6483,8 @@ class TRS80Simulator:
         self.replaced = False
 
         # Fast path for simple numeric values
+        counts = self.metrics.counts
+        counts['eval.calls'] += 1
         expr_stripped = expr.strip()
         if expr_stripped.isdigit():
             return int(expr_stripped)
@@ -3549,6 +6502,7 @@ class TRS80Simulator:
             if key in self.scalar_variables:
                 return self.scalar_variables[key]
 
+        counts['eval.full'] += 1
         return self._eval_nested(expr)
 
     # ============================================================
@@ -3778,17 +6732,18 @@ class TRS80Simulator:
             quote_map = self._build_quote_map(expr)
 
         # NEW: bare MEM / ERR / ERL (Level II — no parentheses)
-        def _bare_sub(rx, val):
+        # value_of is only called on a match: MEM walks the program and variables.
+        def _bare_sub(rx, value_of):
             nonlocal expr
             def repl(mo):
                 i = mo.start()
                 if i < len(quote_map) and quote_map[i]:
                     return mo.group(0)
-                return str(val)
+                return str(value_of())
             expr = rx.sub(repl, expr)
-        _bare_sub(self._regex_cache['mem_bare'], self._mem_bytes())
-        _bare_sub(self._regex_cache['err_bare'], self.err_value)
-        _bare_sub(self._regex_cache['erl_bare'], self.erl_value)
+        _bare_sub(self._regex_cache['mem_bare'], self._mem_bytes)
+        _bare_sub(self._regex_cache['err_bare'], lambda: self.err_value)
+        _bare_sub(self._regex_cache['erl_bare'], lambda: self.erl_value)
         quote_map = self._build_quote_map(expr)
 
         # --- Stage 3: Single-pass keyword translation ---
@@ -3873,7 +6828,12 @@ class TRS80Simulator:
                 param_key = self._canonical_var_key(param)
                 saved = self.scalar_variables.get(param_key)
                 had_param = param_key in self.scalar_variables
-                self._set_scalar(param, arg_val)
+                # Binding the parameter is not a program write: no watchpoint fires
+                watch_scalars, self._watch_scalars = self._watch_scalars, {}
+                try:
+                    self._set_scalar(param, arg_val)
+                finally:
+                    self._watch_scalars = watch_scalars
                 try:
                     result = self._eval_nested(defn['body'])
                 finally:
@@ -3896,7 +6856,10 @@ class TRS80Simulator:
                 if isinstance(self.array_variables[array_name], list):
                     # Use cached compiled pattern per array name
                     if array_name not in self._array_patterns:
+                        self.metrics.counts['array_regex.misses'] += 1
                         self._array_patterns[array_name] = re.compile(rf'\b{re.escape(array_name)}\(')
+                    else:
+                        self.metrics.counts['array_regex.hits'] += 1
                     array_re = self._array_patterns[array_name]
                     start = 0
                     while True:
@@ -3951,6 +6914,7 @@ class TRS80Simulator:
                 self._last_var_count = var_count
             sorted_vars = self._sorted_vars_cache
             quote_map = self._build_quote_map(expr)
+            counts = self.metrics.counts
 
             for i in range(0, len(parts), 2):
                 if not parts[i].strip():
@@ -3959,14 +6923,19 @@ class TRS80Simulator:
                 # Optimization 4: Build part_quote_map once per part, outside variable loop
                 part_quote_map = self._build_quote_map(parts[i])
 
+                # Counted up front: one update per part, not per variable
+                counts['var_regex.hits'] += len(sorted_vars)
                 for var in sorted_vars:
                     if var not in sub_map:
+                        counts['var_regex.hits'] -= 1
                         continue
                     value = sub_map[var]
                     new_parts = []
                     last_end = 0
                     # Use cached compiled regex per variable name
                     if var not in self._var_regex_cache:
+                        counts['var_regex.hits'] -= 1
+                        counts['var_regex.misses'] += 1
                         if var.upper() in self._PROTECTED_FUNCTIONS:
                             pattern = rf'\b{re.escape(var)}\b(?!\()'
                         else:
@@ -3984,8 +6953,7 @@ class TRS80Simulator:
                         if not (s < len(part_quote_map) and part_quote_map[s]):
                             new_parts.append(parts[i][last_end:s])
                             if var.endswith('$') or isinstance(value, str):
-                                safe = str(value).replace("'", "\\'")
-                                replacement = f"'{safe}'"
+                                replacement = _basic_str_literal(str(value))
                                 if i + 2 < len(parts) and parts[i+1] == '+':
                                     replacement = replacement[:-1]
                             else:
@@ -4020,7 +6988,7 @@ class TRS80Simulator:
             result = eval(expr, self._eval_globals, self._eval_namespace)
             return result
         except Exception as e:
-            if self.debug_mode:
+            if self.debug_enabled('error'):
                 self.debug_print(f"Evaluation failed: {e}", 'error')
             # NEW: return 0 (not the expr string) so IF cannot false-PASS on bad A% eval
             return 0
@@ -4054,13 +7022,22 @@ class TRS80Simulator:
             'POINT': self._func_point,
             'LEN': lambda v, ie: len(str(v)),
             'STR$': self._func_str,
-            'CHR$': lambda v, ie: "'" + chr(int(float(v))).replace("'", "\\'") + "'",
+            'CHR$': lambda v, ie: _basic_str_literal(chr(int(float(v)))),
             'STRING$': self._func_string,
             'LEFT$': self._func_left,
             'RIGHT$': self._func_right,
             'MID$': self._func_mid,
             'INSTR': self._func_instr,
             'FRE': self._func_fre,
+            'EOF': self._func_eof,
+            'LOC': self._func_loc,
+            'LOF': self._func_lof,
+            'MKI$': self._func_mki,
+            'MKS$': lambda v, ie: self._func_mkf(v, 4),
+            'MKD$': lambda v, ie: self._func_mkf(v, 8),
+            'CVI': lambda v, ie: self._func_cv(v, 2),
+            'CVS': lambda v, ie: self._func_cv(v, 4),
+            'CVD': lambda v, ie: self._func_cv(v, 8),
         }
 
     def _func_val(self, inner_value, inner_expr):
@@ -4122,8 +7099,50 @@ class TRS80Simulator:
             return 0
 
     def _func_fre(self, inner_value, inner_expr):
-        # NEW: FRE("") — free string space (dummy arg ignored)
-        return self._fre_bytes()
+        # NEW: FRE("")/FRE(A$) — free string space; FRE(numeric) — free memory, like MEM
+        arg = inner_expr.strip()
+        if arg.startswith('"') or arg.endswith('$'):
+            return self._fre_bytes()
+        return self._mem_bytes()
+
+    def _func_eof(self, inner_value, inner_expr):
+        # Disk BASIC EOF(n): -1 once LINE INPUT#n has nothing left to read
+        chan = self._channel(inner_value)
+        return -1 if chan is not None and chan.at_end() else 0
+
+    def _func_loc(self, inner_value, inner_expr):
+        # LOC(n): records (lines) read from / written to channel n so far
+        chan = self._channel(inner_value)
+        return chan.records if chan is not None else 0
+
+    def _func_lof(self, inner_value, inner_expr):
+        # LOF(n): records in a random file
+        chan = self._channel(inner_value)
+        return len(chan) if isinstance(chan, RandomFile) else 0
+
+    def _func_mki(self, inner_value, inner_expr):
+        # MKI$(n): the 2-byte little-endian integer as a string (for FIELD / PUT)
+        n = self._cint(inner_value)
+        return _basic_str_literal(struct.pack('<h', n).decode('latin-1'))
+
+    def _func_mkf(self, inner_value, size):
+        # MKS$/MKD$: 4/8-byte Microsoft Binary Format, as the Model I stores numbers
+        try:
+            data = _to_mbf(float(inner_value), size)
+        except OverflowError:
+            self._raise_error(6, 'OV')
+            data = bytes(size)
+        return _basic_str_literal(data.decode('latin-1'))
+
+    def _func_cv(self, inner_value, size):
+        # CVI/CVS/CVD: inverse of MKI$/MKS$/MKD$ (?FC if the string is too short)
+        data = str(inner_value).encode('latin-1', 'replace')[:size]
+        if len(data) < size:
+            self._error_fc(f"CV needs {size} bytes")
+            return 0
+        if size == 2:
+            return struct.unpack('<h', data)[0]
+        return _from_mbf(data)
 
     def _func_string(self, inner_value, inner_expr):
         parts = self._split_all_top_level_commas(inner_expr)
@@ -4137,7 +7156,7 @@ class TRS80Simulator:
         else:
             char = chr(int(char))
         result = char * count
-        return "'" + result.replace("'", "\\'") + "'"
+        return _basic_str_literal(result)
 
     def _func_left(self, inner_value, inner_expr):
         parts = self._split_all_top_level_commas(inner_expr)
@@ -4145,7 +7164,7 @@ class TRS80Simulator:
             return "''"
         string, length = map(self._eval_nested, parts[:2])
         result = str(string)[:int(length)]
-        return "'" + result.replace("'", "\\'") + "'"
+        return _basic_str_literal(result)
 
     def _func_right(self, inner_value, inner_expr):
         parts = self._split_all_top_level_commas(inner_expr)
@@ -4153,7 +7172,7 @@ class TRS80Simulator:
             return "''"
         string, length = map(self._eval_nested, parts[:2])
         result = str(string)[-int(length):]
-        return "'" + result.replace("'", "\\'") + "'"
+        return _basic_str_literal(result)
 
     def _func_mid(self, inner_value, inner_expr):
         parts = self._split_all_top_level_commas(inner_expr)
@@ -4166,7 +7185,7 @@ class TRS80Simulator:
             result = str(string)[start:start+length]
         else:
             result = str(string)[start:]
-        return "'" + result.replace("'", "\\'") + "'"
+        return _basic_str_literal(result)
 
     def _func_instr(self, inner_value, inner_expr):
         parts = self._split_all_top_level_commas(inner_expr)
@@ -4203,82 +7222,153 @@ class TRS80Simulator:
 
     # ============================================================
     #  SECTION: Memory (POKE/PEEK)
-    #  TRS-80 screen memory: addresses 15360-16383 map to the
-    #  64x16 text grid.  PEEK(14400) returns the last key pressed
-    #  (keyboard buffer) — the primary way games poll input.
-    #  INKEY$ is the string-returning equivalent.
+    #  self.memory (TRS80Memory) is the whole 64K map; PEEK/POKE go
+    #  through its per-page handler table.  Plain RAM is the bytearray
+    #  itself; the keyboard pages call _peek_keyboard and the video
+    #  pages call _poke_video so the screen redraws.  Keyboard reads
+    #  come from the held-key matrix and never pump Tk (the run loop
+    #  does that).  PEEK(14400) first returns the last key pressed
+    #  (keyboard buffer) — the primary way games poll input.  INKEY$
+    #  is the string-returning equivalent.
     # ============================================================
     def poke(self, address, value):
         """
-        Simulate POKE command for TRS-80 screen memory.
-        Screen memory starts at 15360 and ends at 16383.
+        Simulate POKE through the Model I memory map.
+        RAM (16384 up to the configured top) stores the byte; video RAM
+        (15360-16383) also redraws it; ROM and unfitted addresses ignore
+        it.  Level II accepts -32768..-1 for 32768..65535.
         """
-        if 15360 <= address <= 16383:
-            screen_pos = address - 15360
-            row = screen_pos // 64
-            col = screen_pos % 64
-            
-            # Update the screen_content
-            self.screen_content[row][col] = chr(value)
-            
-            # Update the screen display
-            x = col * self._char_w
-            y = row * self._char_h
-            self.screen.create_text(x, y, text=chr(value), font=self._screen_font, fill="lime", anchor="nw",
-                tags=(f"c{row}_{col}", self.CANVAS_TEXT_LAYER_TAG))
-            
-            self.debug_print(f"POKE: Address={address}, Value={value}, Row={row}, Col={col}")
-        else:
+        if address < 0:
+            address += 0x10000
+        if not 0 <= address <= 0xFFFF or not 0 <= value <= 255:
+            self._error_fc(f"POKE {address},{value}")
+            return
+        self.memory.poke(address, value)
+        if self.debug_enabled():
             self.debug_print(f"POKE: Address={address}, Value={value}")
-            self.debug_print(f"Warning: Address out of range for screen memory")
 
-        
     def peek(self, address):
-        # 14400: games poll in tight loops; process Tk events then return last key
-        # code once (same consumption as INKEY$). Do not time-gate reads — that caused
-        # mostly 0 in fast PEEK(14400) loops.
-        if address == 14400:
-            # Only pump Tk events when no key is already buffered — avoids slowing
-            # tight PEEK(14400) loops with update_idletasks on every call.
-            if not self.last_key_pressed:
-                self.master.update_idletasks()
-            if self.last_key_pressed:
-                key_value = ord(self.last_key_pressed)
-                self.debug_print(f"KEY PEEK -> {self.last_key_pressed} ({key_value})")
-                self.last_key_pressed = None
-                return key_value
-            return 0
-        elif 15360 <= address <= 16383:
-            screen_pos = address - 15360
-            row = screen_pos // 64
-            col = screen_pos % 64
-            return ord(self.screen_content[row][col])
-        else:
+        if address < 0:
+            address += 0x10000
+        if not 0 <= address <= 0xFFFF:
+            self._error_fc(f"PEEK {address}")
             return 0
+        return self.memory.peek(address)
+
+    def _poke_video(self, address, value):
+        """Video page writer: store the byte and queue its cell for redraw."""
+        self.memory.data[address] = value
+        dirty = self._dirty_cells
+        dirty.add(address - VIDEO_RAM_START)
+        if len(dirty) >= _GRAPHICS_PENDING_BATCH:
+            self._flush_graphics()
+
+    def _peek_keyboard(self, address):
+        """Keyboard pages 14336-15359 (logged for BACK while HISTORY ON)."""
+        history = self.history
+        if history is None or not self.program_running or self.program_paused:
+            return self._read_keyboard(address)
+        if history.replay_at is not None:
+            return history.next_event(0)
+        value = self._read_keyboard(address)
+        history.events.append(value)
+        return value
+
+    def _read_keyboard(self, address):
+        """Keyboard pages 14336-15359: OR of the matrix rows selected by the low byte.
+
+        14400 (row 6) keeps this simulator's game convention: the next
+        type-ahead key is popped and returned as its ASCII code (same
+        consumption as INKEY$), and only with the buffer empty does it read
+        the live row (ENTER..SPACE bits).  The mirrors 14656/14912/15168
+        always read the genuine row.
+        """
+        if address == 14400 and self._key_buffer:
+            key = self._key_buffer.popleft()
+            if self.debug_enabled():
+                self.debug_print(f"KEY PEEK -> {key!r} ({ord(key)})")
+            return ord(key)
+        select = address & 0xFF
+        matrix = self._key_matrix
+        value = 0
+        row = 0
+        while select:
+            if select & 1:
+                value |= matrix[row]
+            select >>= 1
+            row += 1
+        return value
     
     def inkey(self):
-        # Check if a key has been pressed
-        # Process events but don't do full GUI update to avoid timing issues
-        self.master.update_idletasks()
-        
-        key = self.last_key_pressed
-        if key:         
-            self.debug_print(f"INKEY$ -> '{key}'")
-            # Clear the key after returning it
-            self.last_key_pressed = None
-            return key  
-        return ""  # Return an empty string if no key was pressed
+        # Pop the oldest type-ahead key; the run loop pumps Tk, INKEY$ never does
+        history = self.history
+        logging = history is not None and self.program_running and not self.program_paused
+        if logging and history.replay_at is not None:
+            return history.next_event("")
+        buf = self._key_buffer
+        key = buf.popleft() if buf else ""  # empty string if no key was pressed
+        if key and self.debug_enabled():
+            self.debug_print(f"INKEY$ -> {key!r}")
+        if logging:
+            history.events.append(key)
+        return key
 
     # ============================================================
 
     # NEW: Level II ERROR / RESUME / OPEN / PRINT# / LINE INPUT# / CLOSE / MEM / FRE
+    def _program_bytes(self):
+        """Bytes the program occupies from PROGRAM_START: the tokenised store."""
+        return len(self.program.data)
+
+    def _variable_bytes(self):
+        """Bytes in the simple-variable and array tables."""
+        total = 0
+        for key in self.scalar_variables:
+            total += _VAR_BYTES[self._resolve_var_kind(key)]
+        for name, values in self.array_variables.items():
+            ndims = 2 if name in self.array_dimensions else 1
+            # type + 2 name bytes + 2-byte length + dim count + 2 bytes per dimension
+            total += 6 + 2 * ndims + len(values) * _ELEMENT_BYTES[self._resolve_var_kind(name)]
+        return total
+
+    def _string_bytes_used(self):
+        used = 0
+        for key, value in self.scalar_variables.items():
+            if key.endswith('$'):
+                used += len(value)
+        for name, values in self.array_variables.items():
+            if name.endswith('$'):
+                used += sum(len(v) for v in values)
+        return used
+
     def _mem_bytes(self):
-        prog = sum(len(l) for l in self.sorted_program)
-        vars_sz = len(repr(self.scalar_variables)) + len(repr(self.array_variables))
-        return max(1000, 48000 - prog - vars_sz)
+        # Level II MEM: bytes between the end of the arrays and the stack,
+        # which sits just under the CLEAR n string space at the top of RAM.
+        free = (self.memory.ram_top - PROGRAM_START - self._program_bytes()
+                - self._variable_bytes() - self.string_space - _STACK_RESERVE)
+        return max(0, free)
 
     def _fre_bytes(self):
-        return max(100, 8192 - len(repr(self.scalar_variables)))
+        return max(0, self.string_space - self._string_bytes_used())
+
+    def _update_memory_pointers(self):
+        """Keep the Level II communication-region pointers PEEKable."""
+        top = self.memory.ram_top
+        self.memory.poke_word(16544, top - self.string_space)  # 0x40A0 string space start
+        self.memory.poke_word(16548, PROGRAM_START)            # 0x40A4 TXTTAB
+        self.memory.poke_word(16561, top)                      # 0x40B1 MEMSIZ
+
+    def _set_string_space(self, size_expr):
+        """CLEAR n: reserve n bytes for strings (?OM if it cannot fit)."""
+        size = int(float(self.evaluate_expression(size_expr)))
+        if size < 0:
+            self._error_fc(f"CLEAR {size}")
+            return
+        if size > self.memory.ram_top - PROGRAM_START - self._program_bytes() - _STACK_RESERVE:
+            self._raise_error(7, 'OM')
+            return
+        self.string_space = size
+        self._update_memory_pointers()
 
     def _cmd_error(self, command):
         n = int(float(self.evaluate_expression(command[5:].strip())))
@@ -4294,55 +7384,245 @@ class TRS80Simulator:
             return self._line_numbers[self._error_line_index]
         return int(float(self.evaluate_expression(rest)))
 
-    def _resolve_seq_input_file(self, name):
-        """Load OPEN \"I\" text from host disk into _seq_files if missing.
+    # ============================================================
+    #  SECTION: Virtual disk drives
+    #  Drives :0-:3 map to host folders (FolderDrive) or JV1 TRSDOS
+    #  disk images (DiskImageDrive, read-only).  A name without a
+    #  ":d" is looked up on the mounted drives in order, then in the
+    #  last LOADed program's folder, Basic_Code_Examples, cwd and this
+    #  script's folder (how ADVENT.bas finds CAVE.DAT).  Every drive
+    #  keeps a case-insensitive name index, so a repeated OPEN is a
+    #  dict lookup; the folder is re-read only after a miss finds its
+    #  mtime changed.
+    # ============================================================
+    def mount(self, number, target):
+        """Map drive :number to a host folder or a JV1 disk image (None unmounts).
 
-        Search order (case-insensitive basename match): last LOADed .bas dir,
-        Basic_Code_Examples next to this script / cwd, then cwd. Mirrors real
-        Level II disk OPEN used by ADVENT.bas for CAVE.DAT.
+        Returns the drive.  A drive number outside 0-3 prints ?BF ERROR and
+        a missing or unreadable image ?FF ERROR; both return None and leave
+        the drive as it was.
         """
-        if name in self._seq_files:
-            return True
-        candidates = []
-        if self._program_dir:
-            candidates.append(self._program_dir)
-        here = os.path.dirname(os.path.abspath(__file__))
-        candidates.append(os.path.join(here, 'Basic_Code_Examples'))
-        candidates.append(os.path.join(os.getcwd(), 'Basic_Code_Examples'))
-        candidates.append(os.getcwd())
-        candidates.append(here)
-        want = name.upper()
-        tried = set()
-        for folder in candidates:
-            if not folder or folder in tried:
-                continue
-            tried.add(folder)
-            if not os.path.isdir(folder):
-                continue
-            # Exact name first, then case-insensitive scan
-            direct = os.path.join(folder, name)
-            paths = [direct]
+        if not 0 <= number < DISK_DRIVES:
+            self.print_to_screen(f"?BF ERROR: NO DRIVE :{number}")
+            return None
+        if target is None:
+            drive = None
+        elif os.path.isdir(target):
+            drive = FolderDrive(target)
+        else:
+            try:
+                drive = DiskImageDrive(target)
+            except OSError as e:
+                self.print_to_screen(f"?FF ERROR: {target} ({e.strerror or e})")
+                return None
+        self.drives[number] = drive
+        return drive
+
+    def mount_command(self, args):
+        """MOUNT (list) / MOUNT n "PATH" (folder or .DSK) / MOUNT n OFF."""
+        words = args.split(None, 1)
+        if not words:
+            mounted = False
+            for number, drive in enumerate(self.drives):
+                if drive is not None:
+                    where = drive.folder if isinstance(drive, FolderDrive) else drive.path
+                    self.print_to_screen(f"DRIVE :{number}  {where}")
+                    mounted = True
+            if not mounted:
+                self.print_to_screen("NO DRIVES MOUNTED")
+            return
+        try:
+            number = int(words[0].lstrip(':'))
+        except ValueError:
+            self.print_to_screen("?SN ERROR")
+            return
+        target = words[1].strip().strip('"') if len(words) > 1 else ''
+        if not target:
+            self.print_to_screen("?SN ERROR")
+            return
+        if target.upper() == 'OFF':
+            self.mount(number, None)
+            return
+        path = self._match_host_path(target)
+        if self.mount(number, path) is not None:
+            self.print_to_screen(f"DRIVE :{number}  {path}")
+
+    @staticmethod
+    def _match_host_path(path):
+        """path as it exists on the host, matching each part case-insensitively
+        (typed names arrive upper-cased); path unchanged if nothing matches."""
+        path = os.path.expanduser(path)
+        if os.path.exists(path):
+            return path
+        current = os.sep if os.path.isabs(path) else os.curdir
+        for part in [part for part in path.split(os.sep) if part]:
             try:
-                for fn in os.listdir(folder):
-                    if fn.upper() == want:
-                        paths.append(os.path.join(folder, fn))
+                names = os.listdir(current)
             except OSError:
-                pass
-            for path in paths:
-                if not os.path.isfile(path):
-                    continue
-                try:
-                    with open(path, 'r', encoding='utf-8', errors='replace') as f:
-                        data = f.read()
-                    if data.startswith('\ufeff'):
-                        data = data[1:]
-                    self._seq_files[name] = data
-                    if self.debug_mode:
-                        self.debug_print(f"OPEN I loaded host file: {path}")
-                    return True
-                except OSError:
-                    continue
-        return False
+                return path
+            if part not in names:
+                found = [name for name in names if name.upper() == part.upper()]
+                if not found:
+                    return path
+                part = found[0]
+            current = os.path.join(current, part)
+        return os.path.normpath(current)
+
+    def _host_drive(self, folder):
+        drive = self._host_drives.get(folder)
+        if drive is None and os.path.isdir(folder):
+            drive = self._host_drives[folder] = FolderDrive(folder)
+        return drive
+
+    def _search_drives(self):
+        for drive in self.drives:
+            if drive is not None:
+                yield drive
+        here = os.path.dirname(os.path.abspath(__file__))
+        for folder in (self._program_dir, os.path.join(here, 'Basic_Code_Examples'),
+                       os.path.join(os.getcwd(), 'Basic_Code_Examples'), os.getcwd(), here):
+            drive = self._host_drive(folder) if folder else None
+            if drive is not None:
+                yield drive
+
+    def _find_disk_file(self, name):
+        """(drive, name) for an existing "CAVE.DAT" / "CAVE/DAT:1", else (None, name)."""
+        name, number = split_drive_spec(name)
+        if number is None:
+            drives = self._search_drives()
+        else:
+            drives = [self.drives[number]] if number >= 0 else []
+        for drive in drives:
+            if drive is not None and drive.find(name):
+                return drive, name
+        return None, name
+
+    def _output_drive(self, name):
+        """(drive, name) a new file is written to: its ":d", else :0 (may be None)."""
+        name, number = split_drive_spec(name)
+        if number is None:
+            return self.drives[0], name
+        if number < 0 or self.drives[number] is None:
+            self._raise_error(64, 'BF')
+            return None, None
+        return self.drives[number], name
+
+    def _cmd_dir(self, command):
+        """DIR [:d] — list the files on one drive, or on every mounted drive."""
+        arg = command[3:].strip().strip('"').lstrip(':')
+        if arg.startswith('='):
+            return self._cmd_let('LET ' + command)   # a variable called DIR
+        if arg:
+            number = int(float(self.evaluate_expression(arg)))
+            if not 0 <= number < DISK_DRIVES or self.drives[number] is None:
+                self._raise_error(64, 'BF')
+                return
+            numbers = [number]
+        else:
+            numbers = [n for n in range(DISK_DRIVES) if self.drives[n] is not None]
+        for number in numbers:
+            drive = self.drives[number]
+            where = drive.folder if isinstance(drive, FolderDrive) else drive.path
+            self.print_to_screen(f"DRIVE :{number}  {os.path.basename(where)}")
+            self._print_columns([name for name, _ in drive.names()])
+        if not arg and self._seq_files:
+            self.print_to_screen("MEMORY")
+            self._print_columns(sorted(self._seq_files))
+        if not numbers and not self._seq_files:
+            self.print_to_screen("NO DRIVES MOUNTED")
+
+    def _print_columns(self, names):
+        line = ''
+        for name in names:
+            cell = name.ljust(-(-(len(name) + 1) // 16) * 16)
+            if line and len(line) + len(cell) > 64:
+                self.print_to_screen(line.rstrip())
+                line = ''
+            line += cell
+        if line:
+            self.print_to_screen(line.rstrip())
+
+    def _file_is_open(self, name):
+        key = trsdos_name(split_drive_spec(name)[0])
+        return any(trsdos_name(chan.name) == key for chan in self._seq_channels.values())
+
+    def _cmd_kill(self, command):
+        """KILL "FILE[:d]" — delete a file from memory or a drive."""
+        name = str(self.evaluate_expression(command[4:].strip())).strip("'\"").upper()
+        if self._file_is_open(name):
+            self._raise_error(55, 'AO')
+            return
+        if name in self._seq_files:
+            del self._seq_files[name]
+            return
+        drive, name = self._find_disk_file(name)
+        if drive is None:
+            self._raise_error(4, 'FF')
+            return
+        self._note_file_write()
+        try:
+            drive.kill(name)
+        except PermissionError:
+            self._raise_error(70, 'WP')
+        except OSError:
+            self._raise_error(4, 'FF')
+
+    def _cmd_name(self, command):
+        """NAME "OLD[:d]" AS "NEW" — rename a file in memory or on its drive."""
+        m = re.match(r'NAME\s*(.+?)\s+AS\s+(.+)$', command, re.I)
+        if not m:
+            self._error_sn(command)
+            return
+        old, new = (str(self.evaluate_expression(g)).strip("'\"").upper() for g in m.groups())
+        new = split_drive_spec(new)[0]
+        if self._file_is_open(old):
+            self._raise_error(55, 'AO')
+            return
+        if old in self._seq_files:
+            if new in self._seq_files:
+                self._raise_error(58, 'FE')
+                return
+            self._seq_files[new] = self._seq_files.pop(old)
+            return
+        drive, old = self._find_disk_file(old)
+        if drive is None:
+            self._raise_error(4, 'FF')
+            return
+        self._note_file_write()
+        try:
+            drive.rename(old, new)
+        except PermissionError:
+            self._raise_error(70, 'WP')
+        except FileExistsError:
+            self._raise_error(58, 'FE')
+        except OSError:
+            self._raise_error(4, 'FF')
+
+    def _note_file_write(self):
+        if self.history is not None:
+            self.history.note_file_write()
+
+    def _channel(self, number_value):
+        """Open channel for a file number value, or None (?BN ERROR raised)."""
+        try:
+            number = int(float(str(number_value).strip("'\"").lstrip('#')))
+        except ValueError:
+            number = 0
+        chan = self._seq_channels.get(number)
+        if chan is None:
+            self._raise_error(52, 'BN')
+        return chan
+
+    def _close_channel(self, chan):
+        text = chan.close()
+        if text is not None:
+            self._seq_files[chan.name] = text
+
+    def _close_all_channels(self):
+        channels = self._seq_channels
+        while channels:
+            _, chan = channels.popitem()
+            self._close_channel(chan)
 
     def _cmd_open(self, command):
         arg = command[4:].strip()
@@ -4352,37 +7632,189 @@ class TRS80Simulator:
             return
         mode = str(self.evaluate_expression(parts[0].strip())).strip("'\"").upper()
         name = str(self.evaluate_expression(parts[2].strip())).strip("'\"").upper()
-        if mode not in ('I', 'O'):
+        if mode not in ('I', 'O', 'E', 'R'):
             self._raise_error(2, 'SN')
             return
-        if mode == 'O':
-            self._seq_files[name] = ''
-            self._seq_chan = {'mode': 'O', 'name': name, 'data': '', 'pos': 0}
-        else:
-            # NEW: host-disk fallback when not already in RAM (ADVENT CAVE.DAT)
-            if name not in self._seq_files and not self._resolve_seq_input_file(name):
+        number = int(float(self.evaluate_expression(parts[1].strip().lstrip('#'))))
+        if not 1 <= number <= 15:
+            self._raise_error(52, 'BN')
+            return
+        if number in self._seq_channels:
+            self._raise_error(55, 'AO')
+            return
+        path = None
+        if mode == 'R':
+            # Random files always live on the host: found like OPEN "I",
+            # else created on the output drive / the program's folder / cwd.
+            length = int(float(self.evaluate_expression(parts[3]))) if len(parts) > 3 else RANDOM_RECORD_LENGTH
+            if not 1 <= length <= 256:
+                self._error_fc(f"record length {length}")
+                return
+            drive, fname = self._find_disk_file(name)
+            if drive is None:
+                drive, fname = self._output_drive(name)
+                if fname is None:
+                    return
+            try:
+                if drive is not None:
+                    path = drive.output_path(fname)
+                else:
+                    path = os.path.join(self._program_dir or os.getcwd(), fname)
+                self._note_file_write()
+                self._seq_channels[number] = RandomFile(name, path, length)
+            except PermissionError:
+                self._raise_error(70, 'WP')
+            except OSError:
                 self._raise_error(4, 'FF')
+            return
+        if mode == 'I':
+            if name in self._seq_files:
+                stream = io.StringIO(self._seq_files[name])
+            else:
+                # NEW: host-disk fallback when not already in RAM (ADVENT CAVE.DAT)
+                drive, fname = self._find_disk_file(name)
+                try:
+                    stream = drive.open_input(fname)
+                except (AttributeError, OSError):
+                    self._raise_error(4, 'FF')
+                    return
+                if self.debug_enabled():
+                    self.debug_print(f"OPEN I streaming {fname} from {drive.find(fname)}")
+        elif split_drive_spec(name)[1] is not None or self.drives[0] is not None:
+            drive, fname = self._output_drive(name)
+            if fname is None:
                 return
-            self._seq_chan = {
-                'mode': 'I', 'name': name,
-                'data': self._seq_files[name], 'pos': 0,
-            }
+            try:
+                path = drive.output_path(fname)
+            except PermissionError:
+                self._raise_error(70, 'WP')
+                return
+            self._note_file_write()
+            if mode == 'E' and name in self._seq_files and not os.path.exists(path):
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.write(self._seq_files[name])
+            self._seq_files.pop(name, None)
+            stream = open(path, 'w' if mode == 'O' else 'a', encoding='utf-8')
+        else:
+            stream = io.StringIO(self._seq_files.get(name, '') if mode == 'E' else '')
+            stream.seek(0, io.SEEK_END)
+        self._seq_channels[number] = SequentialFile(name, mode, stream, path)
 
     def _cmd_close(self, command):
-        if self._seq_chan and self._seq_chan['mode'] == 'O':
-            self._seq_files[self._seq_chan['name']] = self._seq_chan['data']
-        self._seq_chan = None
+        """CLOSE closes every channel; CLOSE 1,2 (or #1) only those."""
+        self._commit_tape_writer()
+        arg = command[5:].strip()
+        if not arg:
+            self._close_all_channels()
+            return
+        for part in self._split_all_top_level_commas(arg):
+            number = int(float(self.evaluate_expression(part.strip().lstrip('#'))))
+            chan = self._seq_channels.pop(number, None)
+            if chan is not None:
+                self._close_channel(chan)
+
+    def _random_channel(self, text):
+        """RandomFile for a "#n" / "n" channel argument, or None (error raised)."""
+        chan = self._channel(self.evaluate_expression(text.strip().lstrip('#')))
+        if chan is not None and not isinstance(chan, RandomFile):
+            self._raise_error(54, 'BM')
+            return None
+        return chan
+
+    def _cmd_field(self, command):
+        """FIELD #n, w AS A$, w AS B$ ... — name slices of the record buffer."""
+        parts = self._split_all_top_level_commas(command[5:].strip())
+        chan = self._random_channel(parts[0])
+        if chan is None:
+            return
+        fields = []
+        offset = 0
+        for item in parts[1:]:
+            m = re.match(r'(.+?)\s+AS\s+([A-Z][A-Z0-9]*\$)\s*$', item.strip(), re.I)
+            if not m:
+                self._error_sn(command)
+                return
+            width = int(float(self.evaluate_expression(m.group(1))))
+            if offset + width > chan.record_length:
+                self._raise_error(50, 'FO')
+                return
+            fields.append((m.group(2).upper(), offset, width))
+            offset += width
+        chan.fields = fields
+        self._load_fields(chan)
+
+    def _load_fields(self, chan):
+        buffer = chan.buffer
+        for var, offset, width in chan.fields:
+            self._set_scalar(var, buffer[offset:offset + width].decode('latin-1'))
+
+    def _record_number(self, parts, chan):
+        if len(parts) > 1 and parts[1].strip():
+            number = int(float(self.evaluate_expression(parts[1])))
+        else:
+            number = chan.records + 1
+        if number < 1:
+            self._raise_error(63, 'BR')
+            return None
+        return number
+
+    def _cmd_get(self, command):
+        """GET #n[,record] — read a record into the buffer and its FIELD variables."""
+        parts = self._split_all_top_level_commas(command[3:].strip())
+        chan = self._random_channel(parts[0])
+        number = self._record_number(parts, chan) if chan is not None else None
+        if number is not None:
+            chan.get(number)
+            self._load_fields(chan)
+
+    def _cmd_put(self, command):
+        """PUT #n[,record] — write the buffer as a record (the file grows as needed)."""
+        parts = self._split_all_top_level_commas(command[3:].strip())
+        chan = self._random_channel(parts[0])
+        number = self._record_number(parts, chan) if chan is not None else None
+        if number is not None:
+            chan.put(number)
+
+    def _cmd_lset(self, command):
+        self._set_field(command[4:], left=True)
+
+    def _cmd_rset(self, command):
+        self._set_field(command[4:], left=False)
+
+    def _set_field(self, assignment, left):
+        """LSET/RSET A$=expr: pad/truncate into A$'s FIELD slice of the buffer."""
+        var, sep, expr = assignment.partition('=')
+        var = var.strip().upper()
+        if not sep or not var.endswith('$'):
+            self._error_sn(assignment)
+            return
+        text = str(self.evaluate_expression(expr.strip()))
+        for chan in self._seq_channels.values():
+            for name, offset, width in getattr(chan, 'fields', ()):
+                if name == var:
+                    data = text.encode('latin-1', 'replace')[:width]
+                    data = data.ljust(width) if left else data.rjust(width)
+                    chan.buffer[offset:offset + width] = data
+                    self._set_scalar(var, data.decode('latin-1'))
+                    return
+        # Not a field: Disk BASIC pads to the variable's current length
+        width = len(str(self._get_scalar(var, '')))
+        self._set_scalar(var, text[:width].ljust(width) if left else text[:width].rjust(width))
 
     def _cmd_print_file(self, command):
-        # NEW: PRINT#n — write to in-memory sequential file (mirrors JS _cmdPrintFile)
+        # NEW: PRINT#n — write to the channel's stream (mirrors JS _cmdPrintFile)
         import re as _re
         m = _re.match(r'PRINT#(\d+)\s*,?\s*(.*)$', command, _re.I)
-        if not m or not self._seq_chan or self._seq_chan['mode'] != 'O':
+        chan = self._seq_channels.get(int(m.group(1))) if m else None
+        if chan is not None and chan.mode == 'R':
+            self._raise_error(54, 'BM')
+            return
+        if chan is None or chan.mode == 'I':
             self._raise_error(4, 'FF')
             return
         content = (m.group(2) or '').strip()
         if not content:
-            self._seq_chan['data'] += '\n'
+            chan.write('\n')
             return
         # Selftest: PRINT#1,"LINE1" — evaluate items; strip quote wrappers from strings
         try:
@@ -4395,91 +7827,143 @@ class TRS80Simulator:
             line = self._format_number(val).strip()
         if not content.rstrip().endswith((';', ',')):
             line += '\n'
-        self._seq_chan['data'] += line
+        chan.write(line)
 
     def _cmd_line_input_file(self, command):
         import re as _re
         m = _re.match(r'LINE\s+INPUT#(\d+)\s*,\s*(.+)$', command, _re.I)
-        if not m or not self._seq_chan or self._seq_chan['mode'] != 'I':
+        chan = self._seq_channels.get(int(m.group(1))) if m else None
+        if chan is None or chan.mode != 'I':
             self._raise_error(4, 'FF')
             return
         var_name = m.group(2).strip().upper()
-        data = self._seq_chan['data']
-        pos = self._seq_chan['pos']
-        if pos >= len(data):
+        line = chan.read_line()
+        if line is None:
             self._raise_error(4, 'OD')
             return
-        end = data.find('\n', pos)
-        if end < 0:
-            line, pos = data[pos:], len(data)
-        else:
-            line, pos = data[pos:end], end + 1
-        if line.endswith('\r'):
-            line = line[:-1]
-        self._seq_chan['pos'] = pos
         self._set_scalar(var_name, line)
 
     # ============================================================
     #  SECTION: Graphics (SET/RESET/POINT)
-    #  The 128x48 pixel grid is stored in self.pixel_matrix.
-    #  SET/RESET queue operations in _pending_graphics (batched
-    #  every _GRAPHICS_PENDING_BATCH ops or at GUI-update boundaries).  _flush_graphics
-    #  draws/erases pixel rectangles on the Canvas.  self._active_pixels
-    #  tracks which (x,y) are lit for efficient redraw/scroll.
+    #  The 128x48 pixel grid is the semigraphic bytes in video RAM:
+    #  pixel (x,y) is bit (y%3)*2 + (x%2) of cell (y//3)*64 + x//2.
+    #  SET on a text cell first turns it into a blank block (128),
+    #  as the Level II ROM does.  SET/RESET only mark the cell dirty
+    #  (flushed every _GRAPHICS_PENDING_BATCH cells or at GUI-update
+    #  boundaries); _flush_graphics is the one Canvas renderer for
+    #  text and graphics alike.
     # ============================================================
     def set_pixel(self, x, y):
         if 0 <= x < 128 and 0 <= y < 48:
-            self.pixel_matrix[y][x] = 1
-            self._pending_graphics.append(('set', x, y))
-            self._active_pixels.add((x, y))
+            cell = (y // 3) * 64 + (x >> 1)
+            vram = self.video_ram
+            code = vram[cell]
+            if code < 128:
+                code = 128
+            vram[cell] = code | (1 << ((y % 3) * 2 + (x & 1)))
+            dirty = self._dirty_cells
+            dirty.add(cell)
             
             # Process graphics in batches to improve speed
-            if len(self._pending_graphics) >= _GRAPHICS_PENDING_BATCH:
+            if len(dirty) >= _GRAPHICS_PENDING_BATCH:
                 self._flush_graphics()
 
     def reset_pixel(self, x, y):
         if 0 <= x < 128 and 0 <= y < 48:
-            self.pixel_matrix[y][x] = 0
-            self._pending_graphics.append(('reset', x, y))
-            self._active_pixels.discard((x, y))
+            cell = (y // 3) * 64 + (x >> 1)
+            vram = self.video_ram
+            code = vram[cell]
+            if code < 128:
+                code = 128
+            vram[cell] = code & ~(1 << ((y % 3) * 2 + (x & 1)))
+            dirty = self._dirty_cells
+            dirty.add(cell)
             
             # Process graphics in batches to improve speed
-            if len(self._pending_graphics) >= _GRAPHICS_PENDING_BATCH:
+            if len(dirty) >= _GRAPHICS_PENDING_BATCH:
                 self._flush_graphics()
     
     def _flush_graphics(self):
-        """Process all pending graphics operations in one batch.
-        Uses itemconfigure on cached canvas item ids instead of delete+create (Mar 31 2026)."""
-        if not self._pending_graphics:
+        """Draw every video RAM cell written since the last flush.
+
+        Each dirty cell is compared with _drawn_codes (what the Canvas shows
+        now): the glyph item is updated only if the character changed, and
+        only the pixel rectangles whose bits flipped are recoloured.  Items
+        are cached per cell / per (x,y) and reused via itemconfigure.
+        """
+        dirty = self._dirty_cells
+        if not dirty:
             return
 
+        counts = self.metrics.counts
+        counts['graphics.flushes'] += 1
+        counts['graphics.cells'] += len(dirty)
+        vram = self.video_ram
+        drawn = self._drawn_codes
+        screen = self.screen
         ps = self.pixel_size
+        char_w = self._char_w
+        char_h = self._char_h
+        font = self._screen_font
+        text_ids = self._text_item_ids
         cache = self._gfx_pixel_item_ids
-        for operation, x, y in self._pending_graphics:
-            key = (x, y)
-            if operation == 'set':
-                if key in cache:
-                    self.screen.itemconfigure(cache[key], fill="lime", outline="lime")
-                else:
-                    kid = self.screen.create_rectangle(
-                        x * ps, y * ps,
-                        (x + 1) * ps, (y + 1) * ps,
-                        fill="lime", outline="lime", tags=f"p{x}_{y}"
-                    )
-                    cache[key] = kid
-            else:  # reset — recolor to black; skip create if no cached item (canvas bg is black)
-                if key in cache:
-                    self.screen.itemconfigure(cache[key], fill="black", outline="black")
-
-        self._pending_graphics = []
+        for cell in dirty:
+            code = vram[cell]
+            old = drawn[cell]
+            if code == old:
+                continue
+            drawn[cell] = code
+            row, col = divmod(cell, 64)
+
+            char = _CELL_CHARS[code]
+            if char != _CELL_CHARS[old]:
+                tid = text_ids.get(cell)
+                if tid is not None:
+                    screen.itemconfigure(tid, text=char)
+                elif char != ' ':
+                    counts['canvas.items_created'] += 1
+                    text_ids[cell] = screen.create_text(col * char_w, row * char_h, text=char,
+                        font=font, fill="lime", anchor="nw",
+                        tags=(f"c{row}_{col}", self.CANVAS_TEXT_LAYER_TAG))
+
+            bits = code & 0x3F if code & 0x80 else 0
+            changed = bits ^ (old & 0x3F if old & 0x80 else 0)
+            if not changed:
+                continue
+            x0 = col * 2
+            y0 = row * 3
+            for bit in range(6):
+                if not changed >> bit & 1:
+                    continue
+                x = x0 + (bit & 1)
+                y = y0 + (bit >> 1)
+                key = (x, y)
+                kid = cache.get(key)
+                if bits >> bit & 1:
+                    if kid is not None:
+                        screen.itemconfigure(kid, fill="lime", outline="lime")
+                    else:
+                        counts['canvas.items_created'] += 1
+                        cache[key] = screen.create_rectangle(
+                            x * ps, y * ps,
+                            (x + 1) * ps, (y + 1) * ps,
+                            fill="lime", outline="lime", tags=f"p{x}_{y}"
+                        )
+                elif kid is not None:  # reset — recolor to black (canvas bg is black)
+                    screen.itemconfigure(kid, fill="black", outline="black")
+
+        dirty.clear()
         # Keep text above p{x}_{y} items (RESET recolors gfx on top of glyphs in Tk draw order — mirrors web text layer).
-        self.screen.tag_raise(self.CANVAS_TEXT_LAYER_TAG)
-        self.screen.tag_raise('cursor')
+        screen.tag_raise(self.CANVAS_TEXT_LAYER_TAG)
+        screen.tag_raise('cursor')
 
     def get_pixel(self, x, y):
         # NEW: Level II POINT is boolean true=-1 when set, 0 when clear
+        # (a text cell has no pixels, so POINT over a character is 0)
         if 0 <= x < 128 and 0 <= y < 48:
-            return -1 if self.pixel_matrix[y][x] else 0
+            code = self.video_ram[(y // 3) * 64 + (x >> 1)]
+            if code & 0x80 and code >> ((y % 3) * 2 + (x & 1)) & 1:
+                return -1
         return 0
     
     def flush_graphics(self):
@@ -4492,9 +7976,16 @@ class TRS80Simulator:
     #  one line at a time.  SAVE/LOAD use .bas text files.
     #  Programs are always sorted by line number on save/load.
     # ============================================================
+    def _ask_open_filename(self, title, filetypes):
+        """File picker for LOAD/TAPE; front ends without Tk override this."""
+        return filedialog.askopenfilename(title=title, filetypes=filetypes)
+
+    def _ask_save_filename(self, defaultextension):
+        return filedialog.asksaveasfilename(defaultextension=defaultextension)
+
     def create_tape_file(self):
         self.debug_print("Creating tape .dat file")
-        file_name = filedialog.asksaveasfilename(defaultextension=".dat")
+        file_name = self._ask_save_filename(".dat")
         if file_name:
             self.tape_file = file_name
             with open(self.tape_file, 'w'):
@@ -4508,10 +7999,8 @@ class TRS80Simulator:
         
         self.debug_print("Selecting tape file")
         
-        self.tape_file = filedialog.askopenfilename(
-            title="Select Tape File",
-            filetypes=[("DAT files", "*.dat"), ("All files", "*.*")]
-        )
+        self.tape_file = self._ask_open_filename(
+            "Select Tape File", [("DAT files", "*.dat"), ("Cassette images", "*.cas"), ("All files", "*.*")])
         if not self.tape_file:
             # If user cancels, create a default tape file
             self.tape_file = "default_tape.dat"
@@ -4520,61 +8009,172 @@ class TRS80Simulator:
     def load_tape_file(self):
         """GUI button handler: select a .dat tape file and reset the read pointer."""
         self.debug_print("Loading tape file via button")
-        self.tape_file = filedialog.askopenfilename(
-            title="Load Tape File",
-            filetypes=[("DAT files", "*.dat"), ("All files", "*.*")]
-        )
+        self.tape_file = self._ask_open_filename(
+            "Load Tape File", [("DAT files", "*.dat"), ("Cassette images", "*.cas"), ("All files", "*.*")])
         if self.tape_file:
             self.tape_pointer = 0
             self.debug_print(f"Tape loaded: {self.tape_file}  (pointer reset to 0)")
         else:
             self.debug_print("Tape load cancelled")
 
+    def _close_tape_reader(self):
+        if self._tape_reader is not None:
+            self._tape_reader.close()
+            self._tape_reader = None
+
+    def _commit_tape_writer(self):
+        """Put buffered PRINT#-1 records on disk (CLOSE/END/STOP/BREAK/exit)."""
+        writer = self._tape_writer
+        if writer is not None:
+            self._tape_writer = None
+            try:
+                writer.commit()
+                self.debug_print(f"Tape written: {writer.path} (+{writer.records} records)")
+            except OSError as e:
+                self.print_to_screen(f"TAPE WRITE ERROR: {e}")
+
     def read_from_tape(self):
-        """Read a line from the tape file."""
-        if not os.path.exists(self.tape_file):
-            return None
-        
-        with open(self.tape_file, 'r') as file:
-            lines = file.readlines() #how does this work?
-            self.debug_print(f"Reading from tape: len={len(lines)}, pointer={self.tape_pointer}")
-            if self.tape_pointer < len(lines):
-                data = lines[self.tape_pointer].strip()
-                self.tape_pointer += 1
-                return data
-            else:
-                self.debug_print("Error: No more data on tape")
+        """Read the line at tape_pointer from the tape file and advance.
+
+        The tape is opened and indexed once (TapeReader, or CasImage for a
+        .CAS image); it is reopened
+        only when tape_file names another file or PRINT#-1 changed it.
+        """
+        self._commit_tape_writer()
+        reader = self._tape_reader
+        if reader is None or reader.path != self.tape_file:
+            self._close_tape_reader()
+            if not os.path.exists(self.tape_file):
                 return None
-            
-    def write_to_tape(self, data):
-        """Append data to the tape file."""
-        with open(self.tape_file, 'a') as file:
-            file.write(f"{data}\n")
+            reader = self._tape_reader = open_tape(self.tape_file)
+            if self.debug_enabled():
+                self.debug_print(f"Tape opened: {self.tape_file} ({len(reader)} records)")
+        data = reader.line(self.tape_pointer)
+        if data is None:
+            self.debug_print("Error: No more data on tape")
+            return None
+        self.tape_pointer += 1
+        return data
 
-    def save_program(self):
-        filename = filedialog.asksaveasfilename(defaultextension=".bas")
+    def write_to_tape(self, data):
+        """Append data to the tape file (buffered until _commit_tape_writer)."""
+        if self.history is not None and self.history.replay_at is not None:
+            return  # BACK's replay: the tape already has this record
+        writer = self._tape_writer
+        if writer is None or writer.path != self.tape_file:
+            self._commit_tape_writer()
+            self._close_tape_reader()
+            writer = self._tape_writer = TapeWriter(self.tape_file)
+        writer.write(data)
+
+    def save_program(self, filename=None, default_ext=".bas"):
+        """SAVE to filename, or ask for one (dialog) when not given.
+
+        A .cas name writes a tokenised CSAVE cassette image instead of text
+        (refused with ?FC while the program has decimal line numbers).
+        """
+        if not filename:
+            filename = self._ask_save_filename(default_ext)
         if filename:
-            program_lines = self._sort_program_lines(self.input_area.get(1.0, tk.END).strip().split('\n'))
-            program_text = '\n'.join(program_lines)
-            self.input_area.delete(1.0, tk.END)
-            self.input_area.insert(tk.END, program_text)
-            self.stored_program = program_lines
+            self._sync_program_from_editor()
+            self._show_program_in_editor()
+            if filename.lower().endswith('.cas'):
+                name = os.path.basename(filename)[:1]
+                try:
+                    image = self.program.image()
+                except ValueError as e:
+                    self.print_to_screen(f"?FC ERROR: LINE {e.args[0]} IS NOT A WHOLE NUMBER")
+                    return
+                with open(filename, 'wb') as f:
+                    f.write(encode_cas_program(image, name))
+                return
             with open(filename, 'w') as f:
-                f.write(program_text + '\n')
+                f.write(self.program.text() + '\n')
+
+    def _find_host_file(self, name, default_ext=''):
+        """Host path for a typed file name (LOAD "GAME"), or None.
+
+        Typed names arrive upper-cased, so after the exact path this does a
+        case-insensitive match (adding default_ext when the name has none)
+        in the name's folder / cwd, the last LOADed program's folder and
+        Basic_Code_Examples.
+        """
+        if os.path.isfile(name):
+            return name
+        base = os.path.basename(name)
+        wanted = {base.upper()}
+        if default_ext and not os.path.splitext(base)[1]:
+            wanted.add((base + default_ext).upper())
+        here = os.path.dirname(os.path.abspath(__file__))
+        folders = [os.path.dirname(name) or os.getcwd(), self._program_dir,
+                   os.path.join(here, 'Basic_Code_Examples'), here]
+        drives = [d for d in self.drives if isinstance(d, FolderDrive)]
+        drives += [self._host_drive(folder) for folder in folders if folder]
+        for drive in drives:
+            for want in wanted:
+                path = drive.find(want) if drive is not None else None
+                if path:
+                    return path
+        return None
+
+    def _load_cas_program(self, filename):
+        """Load the first CSAVE record of a .CAS image into self.program; True if loaded.
+
+        The record's bytes go into the store as they are (no detokenise /
+        tokenise round trip).  A SYSTEM tape is copied into memory block by
+        block (there is no Z80 to run it, but PEEK sees it) and gives False.
+        """
+        image = CasImage(filename)
+        try:
+            record = image.first_program()
+            if record is None:
+                self.print_to_screen("?NO PROGRAM ON TAPE")
+                return False
+            name = image.record_name(record)
+            if record[0] == 'basic':
+                self.program.load_image(image.basic_image(record))
+                return True
+            blocks = image.system_blocks(record)
+            try:
+                while True:
+                    address, data = next(blocks)
+                    for offset, value in enumerate(data):
+                        self.memory.poke((address + offset) & 0xFFFF, value)
+            except StopIteration as done:
+                entry = done.value
+            except ValueError:
+                self.print_to_screen("BAD")
+                return False
+            self.print_to_screen(f"SYSTEM TAPE {name} LOADED (ENTRY {entry})")
+            return False
+        finally:
+            image.close()
 
-    def load_program(self):
-        filename = filedialog.askopenfilename(filetypes=[("BASIC files", "*.bas"), ("Text files", "*.txt"), ("All files", "*.*")])
+    def load_program(self, filename=None, default_ext='.bas'):
+        """LOAD from filename, or ask for one (dialog) when not given.
+
+        A .cas file is a cassette image: its CSAVE program is detokenised.
+        """
+        if not filename:
+            filename = self._ask_open_filename(
+                "Load Program", [("BASIC files", "*.bas"), ("Cassette images", "*.cas"),
+                                 ("Text files", "*.txt"), ("All files", "*.*")])
+        elif not os.path.isfile(filename):
+            found = self._find_host_file(filename, default_ext) or self._find_host_file(filename, '.bas')
+            if not found:
+                self.print_to_screen(f"FILE NOT FOUND: {filename}")
+                return
+            filename = found
         if filename:
-            with open(filename, 'r') as f:
-                content = f.read()
-                program_lines = self._sort_program_lines(content.strip().split('\n'))
-                program_text = '\n'.join(program_lines)
-                self.input_area.delete(1.0, tk.END)
-                self.input_area.insert(tk.END, program_text)
-                # Update stored_program from loaded content
-                self.stored_program = program_lines
-                # NEW: remember folder so OPEN "I","CAVE.DAT" finds sibling data files
-                self._program_dir = os.path.dirname(os.path.abspath(filename))
+            if filename.lower().endswith('.cas'):
+                if not self._load_cas_program(filename):
+                    return
+            else:
+                with open(filename, 'r') as f:
+                    self.program.load(f.read().split('\n'))
+            self._show_program_in_editor()
+            # NEW: remember folder so OPEN "I","CAVE.DAT" finds sibling data files
+            self._program_dir = os.path.dirname(os.path.abspath(filename))
         # turn on the RUN button and Step button list
         self.run_button.config(state=tk.NORMAL)
         self.step_button.config(state=tk.NORMAL)
@@ -4698,7 +8298,7 @@ class TRS80Simulator:
     #  When no program is running, the green screen shows a ">"
     #  prompt.  Typed characters accumulate in command_buffer.
     #  On Enter, process_immediate_command either:
-    #    - Stores a numbered line in stored_program
+    #    - Stores a numbered line in the program store
     #    - Dispatches a command (RUN, LIST, NEW, CLEAR, CLS, etc.)
     #    - Falls through to execute_command for direct execution
     # ============================================================
@@ -4707,7 +8307,7 @@ class TRS80Simulator:
         if show_ready_if_empty and self.cursor_row == 0 and self.cursor_col == 0:
             self.print_to_screen("READY", end='\n')
 
-        line_str = ''.join(self.screen_content[self.cursor_row]).rstrip()
+        line_str = self._screen_row_text(self.cursor_row).rstrip()
         if line_str.endswith('>'):
             return
 
@@ -4718,7 +8318,14 @@ class TRS80Simulator:
     def enable_immediate_mode(self):
         """Enable immediate mode input on the main screen"""
         if not self.program_running and not self.waiting_for_input:
+            if self._run_started is not None:
+                self.metrics.seconds['run'] += time.perf_counter() - self._run_started
+                self._run_started = None
+            if self._run_sampler is not None:
+                self._finish_run_profile()
             self.immediate_mode = True
+            # Keys the finished program never read do not leak into the next RUN
+            self._key_buffer.clear()
             self.screen.config(state=tk.NORMAL)
             self.screen.bind("<Key>", self.handle_immediate_mode_key)
             self.screen.bind("<Return>", self.handle_immediate_mode_return)
@@ -4752,12 +8359,10 @@ class TRS80Simulator:
                 # Remove last character from buffer
                 self.command_buffer = self.command_buffer[:-1]
                 # Handle backspace on screen
-                if self.cursor_col > 1 or (self.cursor_col == 1 and self.screen_content[self.cursor_row][0] != '>'):  # Don't delete the prompt
+                if self.cursor_col > 1 or (self.cursor_col == 1 and self.video_ram[self.cursor_row * 64] != ord('>')):  # Don't delete the prompt
                     self.cursor_col -= 1
-                    x = self.cursor_col * self._char_w
-                    y = self.cursor_row * self._char_h
-                    self.screen.create_rectangle(x, y, x + self._char_w, y + self._char_h, fill="black", outline="black")
-                    self.screen_content[self.cursor_row][self.cursor_col] = ' '
+                    self._put_screen_char(self.cursor_row, self.cursor_col, ' ')
+                    self._flush_graphics()
                     self.update_cursor_display()
         elif event.char and event.char.isprintable():
             # Add character to buffer and display
@@ -4765,11 +8370,7 @@ class TRS80Simulator:
             self.command_buffer += char
 
             # Display character on screen
-            x = self.cursor_col * self._char_w
-            y = self.cursor_row * self._char_h
-            self.screen.create_text(x, y, text=char, font=self._screen_font, fill="lime", anchor="nw",
-                tags=(f"c{self.cursor_row}_{self.cursor_col}", self.CANVAS_TEXT_LAYER_TAG))
-            self.screen_content[self.cursor_row][self.cursor_col] = char
+            self._put_screen_char(self.cursor_row, self.cursor_col, char)
             self.cursor_col += 1
             
             # Handle line wrap
@@ -4779,6 +8380,7 @@ class TRS80Simulator:
                 if self.cursor_row >= 16:
                     self._scroll_screen_up()
 
+            self._flush_graphics()
             self.update_cursor_display()
 
         return "break"
@@ -4809,20 +8411,21 @@ class TRS80Simulator:
 
     def process_immediate_command(self, command):
         """Process commands entered in immediate mode"""
-        self.debug_print(f"Immediate mode command: {command}")
+        if self.debug_enabled():
+            self.debug_print(f"Immediate mode command: {command}")
         
         # Check if it's a numbered line (program entry)
-        if command and command.split()[0].replace('.', '').isdigit():
-            line_number = command.split()[0]
-            # Add to stored program
-            self.stored_program = [line for line in self.stored_program if not line.startswith(line_number + ' ')]
-            if len(command.split()) > 1:  # If there's content after line number
-                self.stored_program.append(command)
-            # Sort the program
-            self.stored_program.sort(key=lambda x: float(x.split()[0]))
-            # Update the input area with the stored program
-            self.input_area.delete(1.0, tk.END)
-            self.input_area.insert(tk.END, '\n'.join(self.stored_program))
+        parsed = parse_program_line(command) if command else None
+        if parsed is not None:
+            # Add, replace or (bare number) delete the line in the program store;
+            # the editor gets the same one-line change when it shows the listing.
+            self._sync_program_from_editor()
+            in_order = self._editor_lines == (self.program.listing() or [''])
+            index, action = self.program.set_line(*parsed)
+            if in_order:
+                self._update_editor_line(index, action)
+            else:
+                self._show_program_in_editor()
             return
         
         # Process immediate commands
@@ -4834,6 +8437,14 @@ class TRS80Simulator:
         
         if cmd == "RUN":
             self.disable_immediate_mode()
+            args = cmd_parts[1].split(maxsplit=1) if len(cmd_parts) > 1 else []
+            if args and args[0] == "PROFILE":
+                # RUN PROFILE ["FILE"]: sample the interpreter until the program ends
+                if self._run_sampler is not None:
+                    self._finish_run_profile()
+                self._run_profile_path = args[1].strip().strip('"') if len(args) > 1 else RUN_PROFILE_FILE
+                self._run_sampler = StackSampler()
+                self._run_sampler.start()
             self.run_program()
             return  # Don't show prompt here - it will be shown when program ends
         
@@ -4855,7 +8466,9 @@ class TRS80Simulator:
             self.set_screen_focus()
         
         elif cmd == "CLEAR":
-            # Level II: CLEAR zeros vars but keeps DEFINT… table
+            # Level II: CLEAR zeros vars but keeps DEFINT… table; CLEAR n sets string space
+            if len(cmd_parts) > 1:
+                self._set_string_space(cmd_parts[1])
             self.scalar_variables = {}
             self.array_variables = {}
             self.array_dimensions = {}
@@ -4870,18 +8483,41 @@ class TRS80Simulator:
                 self.disable_immediate_mode()
                 self.stop_program()  # This toggles the pause state
         
+        elif cmd in ("SAVE", "LOAD") and len(cmd_parts) > 1 and cmd_parts[1].split()[0] == "STATE":
+            # SAVE STATE ["FILE"] / LOAD STATE ["FILE"]: the whole run, not just the program
+            args = cmd_parts[1].split(maxsplit=1)
+            path = args[1].strip().strip('"') if len(args) > 1 else STATE_FILE
+            if cmd == "SAVE":
+                try:
+                    size = self.save_state(path)
+                    self.print_to_screen(f"STATE SAVED TO {path} ({size} BYTES)")
+                except OSError as e:
+                    self.print_to_screen(f"?STATE NOT SAVED: {e.strerror}")
+            else:
+                message = self.load_state(path)
+                if message:
+                    self.print_to_screen(message)
+                if self.program_running and not self.program_paused:
+                    return  # resumed: the program owns the screen again
+
         elif cmd in ("LOAD", "CLOAD"):
-            # NEW: CLOAD = LOAD alias (computer file dialog — not µSD/disk)
+            # NEW: CLOAD = LOAD alias (computer file dialog — not µSD/disk);
+            # LOAD "NAME" skips the dialog.  CLOAD "NAME" prefers NAME.CAS.
             self.disable_immediate_mode()
-            self.load_program()
+            self.load_program(cmd_parts[1].strip().strip('"') if len(cmd_parts) > 1 else None,
+                              '.cas' if cmd == "CLOAD" else '.bas')
             self.enable_immediate_mode()
             self.set_screen_focus()
             return  # Don't show another prompt
         
         elif cmd in ("SAVE", "CSAVE"):
-            # NEW: CSAVE = SAVE alias (computer file dialog — not µSD/disk)
+            # NEW: CSAVE = SAVE alias (computer file dialog — not µSD/disk);
+            # SAVE "NAME" skips the dialog.  CSAVE writes a .CAS cassette image.
             self.disable_immediate_mode()
-            self.save_program()
+            name = cmd_parts[1].strip().strip('"') if len(cmd_parts) > 1 else None
+            if cmd == "CSAVE" and name and not os.path.splitext(name)[1]:
+                name += '.cas'
+            self.save_program(name, '.cas' if cmd == "CSAVE" else '.bas')
             self.enable_immediate_mode()
             self.set_screen_focus()
         
@@ -4895,6 +8531,57 @@ class TRS80Simulator:
         
         elif cmd == "SYSTEM":
             self.print_to_screen("SYSTEM COMMAND NOT IMPLEMENTED")
+
+        elif cmd == "PROFILE":
+            self.profile_command(cmd_parts[1] if len(cmd_parts) > 1 else '')
+
+        elif cmd == "BREAK":
+            try:
+                for line in self.breakpoint_command(cmd_parts[1] if len(cmd_parts) > 1 else ''):
+                    self.print_to_screen(line)
+            except ValueError:
+                self.print_to_screen("?SYNTAX ERROR")
+
+        elif cmd == "WATCH":
+            try:
+                for line in self.watch_command(cmd_parts[1] if len(cmd_parts) > 1 else ''):
+                    self.print_to_screen(line)
+            except ValueError:
+                self.print_to_screen("?SYNTAX ERROR")
+
+        elif cmd == "HISTORY":
+            try:
+                for line in self.history_command(cmd_parts[1] if len(cmd_parts) > 1 else ''):
+                    self.print_to_screen(line)
+            except ValueError:
+                self.print_to_screen("?SYNTAX ERROR")
+
+        elif cmd == "BACK":
+            words = cmd_parts[1].split() if len(cmd_parts) > 1 else []
+            try:
+                if words[:1] == ['TO'] and len(words) == 2:
+                    message = self.step_back(to_step=int(words[1]))
+                elif len(words) <= 1:
+                    message = self.step_back(int(words[0]) if words else 1)
+                else:
+                    raise ValueError(words)
+            except ValueError:
+                message = "?SYNTAX ERROR"
+            if message:
+                self.print_to_screen(message)
+            else:
+                return  # paused at the target: _pause_in drew the prompt
+
+        elif cmd == "TRACE":
+            self.trace_command(cmd_parts[1] if len(cmd_parts) > 1 else '')
+
+        elif cmd == "MOUNT":
+            self.mount_command(cmd_parts[1] if len(cmd_parts) > 1 else '')
+
+        elif cmd == "STATS":
+            # Interpreter counters and timers of the last RUN (Metrics)
+            for line in self.metrics.report() or ["NO STATS - RUN A PROGRAM FIRST"]:
+                self.print_to_screen(line)
         
         else:
             # Try to execute as an immediate statement
@@ -4903,12 +8590,122 @@ class TRS80Simulator:
             except Exception as e:
                 self.print_to_screen(f"?{str(e)}")
 
+    def trace_command(self, args):
+        """TRACE shows what the TRON ring holds; TRACE "FILE" exports it
+        (.CSV as text, anything else in the binary .TRC layout)."""
+        tracer = self.tracer
+        if tracer is None or not tracer.recorded:
+            self.print_to_screen("NO TRACE - TRON OR TRON RECORD, THEN RUN")
+            return
+        path = args.strip().strip('"')
+        if not path:
+            kept = min(tracer.recorded, tracer.capacity)
+            self.print_to_screen(f"{tracer.recorded} STATEMENTS TRACED, LAST {kept} KEPT")
+            return
+        try:
+            if path.lower().endswith('.csv'):
+                tracer.write_csv(path)
+            else:
+                tracer.write_binary(path)
+        except OSError as e:
+            self.print_to_screen(f"?TRACE NOT WRITTEN: {e}")
+            return
+        self.print_to_screen(f"TRACE WRITTEN TO {path}")
+
+    def _finish_run_profile(self):
+        """Stop RUN PROFILE's sampler, write its collapsed stacks and summarise them."""
+        sampler, self._run_sampler = self._run_sampler, None
+        sampler.stop()
+        path = self._run_profile_path
+        try:
+            sampler.write_collapsed(path)
+        except OSError as e:
+            self.print_to_screen(f"?PROFILE NOT WRITTEN: {e}")
+            return
+        total = sampler.samples or 1
+        self.debug_log.append('info', f"RUN PROFILE: {sampler.samples} samples every "
+                                      f"{sampler.interval * 1000:g} ms -> {os.path.abspath(path)}")
+        for name, count in sampler.subsystems()[:12]:
+            self.debug_log.append('info', f"  {100 * count / total:5.1f}%  {name}")
+        self.flush_debug_log()
+        self.print_to_screen(f"PROFILE WRITTEN TO {path}")
+
+    def profile_command(self, args):
+        """PROFILE ON / OFF / [n] (top n lines, default 10) / LIST [range]."""
+        word = args.split(maxsplit=1)[0] if args.strip() else ''
+        if word in ("ON", "OFF"):
+            self.profiling = word == "ON"
+            self.print_to_screen(f"PROFILE {word}")
+        elif word == "LIST":
+            self.list_profile(args[4:].strip())
+        elif self.line_profile is None:
+            self.print_to_screen("NO PROFILE - PROFILE ON, THEN RUN")
+        else:
+            try:
+                count = int(args) if args.strip() else 10
+            except ValueError:
+                self.print_to_screen("?SYNTAX ERROR")
+                return
+            self.print_profile(count)
+
+    def _statement_lines(self):
+        """Program line of each RUN statement (colon-split ones are numbered 10.1, 10.2, ...)."""
+        return [self._source_line(number) for number in self._line_numbers]
+
+    def _source_line(self, number):
+        """The program line a RUN statement number (10, 10.1, 10.2, ...) belongs to."""
+        numbers = self.program.numbers
+        return numbers[max(bisect_right(numbers, number) - 1, 0)] if numbers else number
+
+    def _statement_kinds(self):
+        """Keyword of each RUN statement (LET for implicit assignments)."""
+        kinds = []
+        for word, command in zip(self._line_cmd_words, self._line_commands):
+            if word not in self._command_handlers:
+                word = 'LET' if '=' in command else (word or 'REM')
+            kinds.append(word)
+        return kinds
+
+    def print_profile(self, count=10):
+        """The count lines with most time, then time per statement keyword."""
+        profile = self.line_profile
+        total = profile.total_seconds() or 1.0
+        lines = profile.by_line()
+        self.print_to_screen(f"{'LINE':>7}{'HITS':>10}{'MS':>10}{'%':>6}")
+        for number, (hits, seconds) in sorted(lines.items(), key=lambda item: -item[1][1])[:count]:
+            self.print_to_screen(f"{number:>7g}{hits:>10}"
+                                 f"{seconds * 1000:>10.1f}{100 * seconds / total:>6.1f}")
+        self.print_to_screen(f"{'STATEMENT':<9}{'HITS':>10}{'MS':>10}{'%':>6}")
+        kinds = profile.by_kind()
+        for kind, (hits, seconds) in sorted(kinds.items(), key=lambda item: -item[1][1]):
+            self.print_to_screen(f"{kind[:9]:<9}{hits:>10}{seconds * 1000:>10.1f}{100 * seconds / total:>6.1f}")
+
+    def list_profile(self, range_spec=''):
+        """LIST with each line's hits and milliseconds from the last profiled RUN."""
+        if self.line_profile is None:
+            self.print_to_screen("NO PROFILE - PROFILE ON, THEN RUN")
+            return
+        self._sync_program_from_editor()
+        lines = self.line_profile.by_line()
+        first, last = 0.0, float(0xFFFF)
+        if range_spec:
+            try:
+                a, _, b = range_spec.replace(' ', '').partition('-')
+                first = float(a) if a else first
+                last = float(b) if b else (last if '-' in range_spec else first)
+            except ValueError:
+                self.print_to_screen("?SYNTAX ERROR")
+                return
+        for number, text in zip(self.program.numbers, self.program.listing()):
+            if first <= number <= last:
+                hits, seconds = lines.get(number, (0, 0.0))
+                self.print_to_screen(f"{hits:>7}{seconds * 1000:>9.1f} {text}")
+
     def list_program_range(self, range_spec):
         """LIST n / LIST n-m / LIST n- / LIST -m — same forms as JMR FM _list()."""
         # Always sync from input area first
-        current_program = self.input_area.get(1.0, tk.END).strip().split('\n')
-        self.stored_program = self._sort_program_lines(current_program)
-        
+        self._sync_program_from_editor()
+
         try:
             first, last = 0.0, float(0xFFFF)
             spec = str(range_spec).replace(' ', '')
@@ -4940,22 +8737,17 @@ class TRS80Simulator:
     def delete_lines(self, range_spec):
         """Delete specific line numbers or ranges"""
         # Always sync from input area first
-        current_program = self.input_area.get(1.0, tk.END).strip().split('\n')
-        self.stored_program = self._sort_program_lines(current_program)
-        
+        self._sync_program_from_editor()
+
         try:
             if '-' in range_spec:
                 start, end = map(float, range_spec.split('-'))
-                self.stored_program = [line for line in self.stored_program 
-                                     if not (start <= float(line.split()[0]) <= end)]
             else:
-                target = float(range_spec)
-                self.stored_program = [line for line in self.stored_program 
-                                     if float(line.split()[0]) != target]
-            
+                start = end = float(range_spec)
+            self.program.delete_range(start, end)
+
             # Update the input area
-            self.input_area.delete(1.0, tk.END)
-            self.input_area.insert(tk.END, '\n'.join(self.stored_program))
+            self._show_program_in_editor()
             self.print_to_screen("DELETED")
         except:
             self.print_to_screen("?SYNTAX ERROR")
@@ -4968,13 +8760,40 @@ Immediate Mode Commands (type directly on green screen):
 - LIST [line#] or [line#-line#] - List program (also LIST n- / LIST -m)
 - LLIST - Same as LIST (printer alias → screen here)
 - NEW - Clear program memory
-- CLEAR - Clear variables (keeps DEFINT/DEFSNG/DEFDBL/DEFSTR)
+- CLEAR [n] - Clear variables (keeps DEFINT/DEFSNG/DEFDBL/DEFSTR); n = string space
 - CONT - Continue after STOP
-- LOAD / CLOAD - Load program from file (computer dialog)
-- SAVE / CSAVE - Save program to file (computer dialog)
+- LOAD / CLOAD - Load program from file (computer dialog); LOAD "NAME" skips it
+- SAVE / CSAVE - Save program to file; CSAVE "NAME" writes NAME.CAS (tokenised,
+  whole line numbers only: 10.5 gives ?FC)
+  CLOAD reads .CAS images (CSAVE programs; SYSTEM tapes go into memory)
 - CLS - Clear screen
 - DELETE line# or line#-line# - Delete lines
 - DEFINT/DEFSNG/DEFDBL/DEFSTR letter[-letter][,…] - default types (DEFDBL→single)
+- PROFILE ON / OFF - Time every statement of the next RUN
+- PROFILE [n] - Top n lines by time (default 10), then time per statement type
+- PROFILE LIST [line#-line#] - LIST with hits and milliseconds beside each line
+- TRON / TROFF - Trace on/off: prints <line> as each line runs and records it
+  (also in programs); TRON RECORD records without printing
+- BREAK n [COUNT c] [IF condition] - Stop before line n (on its c-th pass, when
+  condition is true); BREAK lists them, BREAK OFF [n] clears; CONT resumes
+  (also the Break box in the debug window)
+- WATCH X / A(3) / A(2,1) / A() [IF condition] - Stop after the statement that
+  writes it (when condition is true); debug window shows line, old and new
+  value; WATCH lists, WATCH OFF [target] clears
+- SAVE STATE ["FILE"] - Save the program and everything it is doing (variables,
+  stacks, files, screen, a pending INPUT) to FILE (default trs80.state);
+  closing the window mid-run saves there too
+- LOAD STATE ["FILE"] - Resume a saved state exactly where it stopped
+- HISTORY ON [n] - Checkpoint every n statements (default 1000) and log INKEY$/
+  INPUT so BACK works; HISTORY shows the checkpoints, HISTORY OFF stops
+- BACK [n] / BACK TO s - While stopped: go back n statements (default 1), or to
+  statement s of the run, by replaying from a checkpoint (also the Back button);
+  refused if the replay would write a disk file again
+- TRACE - How much the trace ring holds; TRACE "FILE.CSV" or "FILE.TRC" exports it
+- STATS - Interpreter counters/timers of the last RUN (statements, evaluator
+  fast/full paths, regex cache hits, canvas items, graphics flushes, Tk updates)
+- RUN PROFILE ["FILE"] - Run while sampling the interpreter; writes collapsed stacks
+  (flame graph input, default trs80_profile.folded), summary in the debug window
 
 Program Commands:
 - PRINT "text" or PRINT expression [, expression...]
@@ -5002,7 +8821,20 @@ Program Commands:
 - STOP (Pause program - can continue)
 - END (Stop program)
 - PRINT#-1,expression (write to tape)
-- INPUT#-1,variable (read from tape)"""
+- INPUT#-1,variable (read from tape)
+  Tapes are .dat text (one record per line) or .CAS cassette images
+- OPEN "I"/"O"/"E",n,"FILE" - sequential file on channel n (1-15; E = append)
+- PRINT#n,expression / LINE INPUT#n,var$ - write / read a line
+- CLOSE [n[,n...]] - close channels (all when no number; END closes all)
+- EOF(n) = -1 at end of input file;  LOC(n) = lines read or written
+- OPEN "R",n,"FILE"[,len] - random file, len-byte records (default 256)
+- FIELD n, w AS A$, ... / LSET A$=x / RSET A$=x - fill the record buffer
+- PUT n[,rec] / GET n[,rec] - write / read a record;  LOF(n) = records
+- MKI$/MKS$/MKD$(x) pack numbers into 2/4/8 bytes; CVI/CVS/CVD unpack
+- "FILE:d" names drive d (0-3); without :d every drive is searched
+- DIR [:d] / KILL "FILE" / NAME "OLD" AS "NEW" - list, delete, rename
+- MOUNT n "PATH" - drive n (0-3) is a host folder or a JV1 .DSK image;
+  MOUNT n OFF unmounts it, MOUNT lists the drives"""
 
 help_text2 = """
 Mathematical Functions:
@@ -5047,9 +8879,13 @@ Graphics & Screen:
 
 Memory Functions:
 - PEEK(address): Read memory byte
-  * 14400: Keyboard buffer
-  * 15360-16383: Screen memory
+  * 14400: Keyboard buffer (last key as ASCII, else row 6 bits)
+  * 14337-14464: Keyboard matrix rows (held keys; 14656 = raw row 6:
+    ENTER 1, CLEAR 2, BREAK 4, UP 8, DOWN 16, LEFT 32, RIGHT 64, SPACE 128)
+  * 15360-16383: Screen memory (128-191 = graphics blocks)
+  * 16384-top: User RAM (48K: top 65535)
 - POKE address, value: Write memory byte
+- MEM / FRE(0): Free memory;  FRE(""): Free string space
 
 Special Features:
 - Multiple statements per line with :
@@ -5116,8 +8952,9 @@ Tips:
 - Cursor disappears during program execution (authentic TRS-80)
 """
 
-# Create the main window and start the application
-root = tk.Tk()
-app = TRS80Simulator(root)
-root.mainloop()
+if __name__ == "__main__":
+    # Create the main window and start the application
+    root = tk.Tk()
+    app = TRS80Simulator(root)
+    root.mainloop()
 